@@ -1,9 +1,6 @@
 import streamlit as st
 import os
-import pandas as pd
-import io
 from datetime import datetime
-from openpyxl import Workbook
 
 # Page configuration - Must be the first Streamlit command
 st.set_page_config(
@@ -13,9 +10,42 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-from utils.api_service import SerperAPI
-from utils.data_service import DataService
+from utils.rank_tracker import RankTracker, get_locale
+from utils.keyword_discovery import KeywordDiscovery, DISCOVERY_SOURCES
+from utils.sharded_tracker import ShardedRankTracker
+from utils.visibility import VisibilityIndex
+from utils.serp_features import extract_features
+from utils.cost_estimator import budget_problem, credit_limit, estimate_run_cost, reserve_run_credits
+from utils.dispatcher import choose_lane, load_fair_share_config
+from utils.alerts import AlertEngine
+from utils.session_memory import MAX_HISTORY_RUNS
+from utils.app_cache import (
+    clear_query_caches,
+    dataframe_to_csv,
+    dataframe_to_excel,
+    current_user,
+    get_alert_settings,
+    get_api_service,
+    get_budgets,
+    get_data_service,
+    get_dispatcher,
+    get_feature_store,
+    get_history_store,
+    get_ledger,
+    get_session_memory,
+)
 from components.forms import render_input_forms
+from components.schedules import render_schedule_manager
+from components.trends import render_trends
+from components.serp_features import render_serp_features
+from components.cache_admin import render_cache_admin
+from components.key_pool import render_key_pool_stats
+from components.credits import render_cost_estimate, render_credit_spend
+from components.request_queue import render_request_queue
+from components.cannibalization import render_cannibalization
+from components.competitors import render_competitor_suggestions
+from components.clusters import render_keyword_clusters
+from components.alerts import render_alerts
 
 # Custom CSS to improve the appearance
 st.markdown("""
@@ -53,117 +83,485 @@ if 'result_size' not in st.session_state:
     st.session_state.result_size = 10
 if 'location' not in st.session_state:
     st.session_state.location = "Turkey"
+# Past runs by timestamp, their payloads are kept in the session memory
 if 'results_history' not in st.session_state:
     st.session_state.results_history = {}
-if 'current_results' not in st.session_state:
-    st.session_state.current_results = None
-if 'search_metadata' not in st.session_state:
-    st.session_state.search_metadata = {}
+if 'batch_size' not in st.session_state:
+    st.session_state.batch_size = 1
+if 'max_depth' not in st.session_state:
+    st.session_state.max_depth = None
+if 'adaptive_size' not in st.session_state:
+    st.session_state.adaptive_size = False
+if 'run_usage' not in st.session_state:
+    st.session_state.run_usage = None
+if 'keyword_weights' not in st.session_state:
+    st.session_state.keyword_weights = {}
+if 'visibility_index' not in st.session_state:
+    st.session_state.visibility_index = None
+if 'index_serp_features' not in st.session_state:
+    st.session_state.index_serp_features = True
+if 'fetch_errors' not in st.session_state:
+    st.session_state.fetch_errors = {}
+if 'workers' not in st.session_state:
+    st.session_state.workers = 1
+if 'discover_keywords' not in st.session_state:
+    st.session_state.discover_keywords = False
+if 'expansion_depth' not in st.session_state:
+    st.session_state.expansion_depth = 2
+if 'max_new_keywords' not in st.session_state:
+    st.session_state.max_new_keywords = 50
+if 'discovery' not in st.session_state:
+    st.session_state.discovery = None
+if 'run_budget' not in st.session_state:
+    st.session_state.run_budget = 0
+if 'pending_estimate' not in st.session_state:
+    st.session_state.pending_estimate = None
+if 'alerts' not in st.session_state:
+    st.session_state.alerts = None
 
 # Simple header
 st.markdown("# SEO Position Checker")
 st.markdown("Check your domain positions on Google search results")
 
-# Initialize services
-data_service = DataService()
-api_service = SerperAPI()
+# Services shared across reruns and sessions
+data_service = get_data_service()
+api_service = get_api_service()
+rank_tracker = RankTracker(api_service, data_service)
+keyword_discovery = KeywordDiscovery(rank_tracker)
+history_store = get_history_store()
+feature_store = get_feature_store()
+
+ledger = get_ledger()
+budgets = get_budgets()
+user = current_user()
+# Results, hits and search metadata of runs, spilled to disk beyond the session's budget
+memory = get_session_memory(user)
+
+
+def find_previous_results():
+    """Results of the latest run with the same search type and location, used to pick starting sizes"""
+    for timestamp, entry in reversed(list(st.session_state.results_history.items())):
+        if entry['search_type'] == st.session_state.search_type and entry['location'] == st.session_state.location:
+            payload = memory.get(f"history/{timestamp}")
+            if payload is not None:
+                return payload['results']
+            # Pruned from disk while the session was idle, forget the run
+            del st.session_state.results_history[timestamp]
+            memory.drop(f"history/{timestamp}")
+    return None
+
+
+def discovery_enabled():
+    """Whether the run discovers related keywords, organic search only"""
+    return st.session_state.discover_keywords and st.session_state.search_type == "search"
+
 
 # Render simplified input forms
 track_button_clicked = render_input_forms()
 
+# Sidebar for scheduled sweeps
+render_schedule_manager()
+render_cache_admin(memory)
+render_key_pool_stats(api_service.key_pool)
+render_credit_spend(ledger, user, budgets)
+render_request_queue(get_dispatcher(), user)
+
 # Process tracking if button is clicked
+run_requested = False
 if track_button_clicked:
     if not st.session_state.domains:
         st.error("Please add at least one domain")
     elif not st.session_state.keywords:
         st.error("Please add at least one keyword")
     else:
-        with st.spinner("Fetching ranking data..."):
-            try:
-                results = {}
-                
-                # Progress bar for tracking
-                progress_bar = st.progress(0)
-                total_items = len(st.session_state.keywords)
-                
-                # Determine language based on location
-                language = "tr" if st.session_state.location == "Turkey" else "en"
-                country_code = "tr" if st.session_state.location == "Turkey" else "us"
-                
-                # Get results for each keyword
-                for i, keyword in enumerate(st.session_state.keywords):
-                    progress_text = f"Processing: {keyword}"
-                    st.caption(progress_text)
-                    
-                    if st.session_state.search_type == "images":
-                        search_results = api_service.get_image_search_results(
-                            keyword, 
-                            st.session_state.location,
-                            language,
-                            country_code,
-                            st.session_state.result_size
-                        )
-                    else:
-                        search_results = api_service.get_search_results(
-                            keyword, 
-                            st.session_state.search_type,
-                            st.session_state.location,
-                            language,
-                            country_code,
-                            st.session_state.result_size
-                        )
-                        
-                        # Save metadata for organic search only
-                        st.session_state.search_metadata[keyword] = {
-                            'related_searches': search_results.get('relatedSearches', []),
-                            'people_also_ask': search_results.get('peopleAlsoAsk', [])
-                        }
-                    
-                    # Find rankings for each domain
-                    keyword_results = {}
-                    for domain in st.session_state.domains:
-                        if st.session_state.search_type == "images":
-                            result = data_service.find_domain_in_image_results(search_results, domain, st.session_state.result_size)
-                        else:
-                            result = data_service.find_domain_rank(search_results, domain, st.session_state.result_size)
-                        keyword_results[domain] = result
-                    
-                    results[keyword] = keyword_results
-                    
-                    # Update progress
-                    progress_bar.progress((i + 1) / total_items)
-                
-                # Store the current results
-                st.session_state.current_results = results
-                
-                # Add to history with timestamp
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                st.session_state.results_history[timestamp] = {
-                    'results': results,
-                    'domains': st.session_state.domains.copy(),
-                    'keywords': st.session_state.keywords.copy(),
-                    'search_type': st.session_state.search_type,
-                    'result_size': st.session_state.result_size,
-                    'location': st.session_state.location,
-                    'search_metadata': st.session_state.search_metadata.copy() if st.session_state.search_type == "search" else {},
+        # Estimate the cost of the planned pages before anything is fetched
+        language, country_code = get_locale(st.session_state.location)
+        estimate = estimate_run_cost(
+            api_service,
+            st.session_state.keywords,
+            st.session_state.domains,
+            st.session_state.search_type,
+            st.session_state.location,
+            language,
+            country_code,
+            st.session_state.result_size,
+            batch_size=st.session_state.batch_size,
+            max_depth=st.session_state.max_depth,
+            adaptive=st.session_state.adaptive_size,
+            previous_results=find_previous_results(),
+            extra_keywords=st.session_state.max_new_keywords if discovery_enabled() else 0
+        )
+        limit = credit_limit(budgets, ledger.spent(user), st.session_state.run_budget)
+        problem = budget_problem(estimate, limit)
+        if problem:
+            st.error(problem)
+            render_cost_estimate(estimate, limit)
+            st.session_state.pending_estimate = None
+        else:
+            st.session_state.pending_estimate = {'estimate': estimate, 'limit': limit}
+            # Cheap runs start right away, expensive ones or ones likely to hit the budget wait for confirmation
+            expected = estimate['credits']['expected']
+            run_requested = expected <= budgets['confirm_above_credits'] and (limit is None or expected <= limit)
+
+pending_estimate = st.session_state.pending_estimate
+if pending_estimate and not run_requested:
+    render_cost_estimate(pending_estimate['estimate'], pending_estimate['limit'])
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Confirm and Run", use_container_width=True, type="primary"):
+            run_requested = True
+    with col2:
+        if st.button("Cancel", use_container_width=True):
+            st.session_state.pending_estimate = None
+            st.rerun()
+
+if run_requested:
+    estimate = pending_estimate['estimate']
+    st.session_state.pending_estimate = None
+    # Hold the run's credits first, other runs of the user may have started since the estimate
+    reservation_id, max_credits = reserve_run_credits(ledger, user, estimate, pending_estimate['limit'], budgets)
+    problem = budget_problem(estimate, max_credits)
+    if problem:
+        ledger.release(reservation_id)
+        st.error(problem)
+        run_requested = False
+
+if run_requested:
+    usage_before = dict(api_service.usage)
+    alert_engine = None
+    sharded_tracker = None
+    with st.spinner("Fetching ranking data..."):
+        try:
+            # Progress bar for tracking
+            progress_bar = st.progress(0)
+            progress_text = st.empty()
+            
+            # Determine language based on location
+            language, country_code = get_locale(st.session_state.location)
+            
+            def update_progress(fraction, text):
+                progress_bar.progress(fraction)
+                progress_text.caption(text)
+            
+            def report_queue(position):
+                progress_text.caption(
+                    f"Waiting for a request slot in the {position['lane']} lane: "
+                    f"{position['ahead']} request(s) ahead, {position['in_flight']} being sent"
+                )
+            
+            # Large runs queue in the bulk lane so small checks of other users stay fast
+            api_service.lane = choose_lane(estimate['requests']['expected'])
+            api_service.queue_callback = report_queue
+            
+            previous_results = find_previous_results()
+            
+            # Keep the visibility index from earlier runs so only changed keywords are recomputed
+            visibility_index = st.session_state.visibility_index
+            if visibility_index is None or visibility_index.domains != st.session_state.domains:
+                visibility_index = VisibilityIndex(st.session_state.domains)
+            discover = discovery_enabled()
+            if not discover:
+                visibility_index.retain(st.session_state.keywords)
+            keyword_weights = st.session_state.keyword_weights
+            
+            # Alert rules compare each result with the latest stored ranks as it arrives
+            alert_settings = get_alert_settings()
+            if alert_settings['enabled']:
+                alert_engine = AlertEngine(
+                    st.session_state.domains,
+                    history_store.get_latest_ranks(st.session_state.domains, st.session_state.location, st.session_state.search_type),
+                    rules=alert_settings['rules'],
+                    sinks=alert_settings['sinks'],
+                    location=st.session_state.location,
+                    search_type=st.session_state.search_type,
+                    depth=st.session_state.max_depth or st.session_state.result_size
+                )
+            
+            def update_visibility(keyword, keyword_results):
+                # Keywords without search volume count as zero once volumes are known
+                weight = keyword_weights.get(keyword, 0.0) if keyword_weights else 1.0
+                visibility_index.update(keyword, keyword_results, weight)
+                if alert_engine:
+                    alert_engine.evaluate(keyword, keyword_results)
+            
+            # Collect SERP features of organic searches for the features index
+            feature_snapshots = {}
+            
+            def collect_features(keyword, search_results):
+                feature_snapshots[keyword] = extract_features(search_results)
+            
+            index_features = st.session_state.index_serp_features and st.session_state.search_type == "search"
+            
+            track_options = dict(
+                batch_size=st.session_state.batch_size,
+                max_depth=st.session_state.max_depth,
+                progress_callback=update_progress,
+                adaptive=st.session_state.adaptive_size,
+                previous_results=previous_results,
+                result_callback=update_visibility,
+                response_callback=collect_features if index_features else None,
+                max_credits=max_credits
+            )
+            if discover:
+                # Crawl related searches from the entered keywords and track what is found
+                run = keyword_discovery.discover(
+                    st.session_state.keywords,
+                    st.session_state.domains,
+                    st.session_state.search_type,
+                    st.session_state.location,
+                    language,
+                    country_code,
+                    st.session_state.result_size,
+                    expansion_depth=st.session_state.expansion_depth,
+                    max_new_keywords=st.session_state.max_new_keywords,
+                    **track_options
+                )
+                st.session_state.keywords = run['keywords']
+                visibility_index.retain(run['keywords'])
+                st.session_state.discovery = {
+                    'discovered': run['discovered'],
+                    'coverage': run['coverage'],
+                    'frontier': run['frontier'],
                 }
-                
-                st.success("Positions found!")
-                st.rerun()
-                
-            except Exception as e:
-                st.error(f"Error fetching data: {str(e)}")
+            elif st.session_state.workers > 1:
+                # Split the keywords across worker processes
+                sharded_tracker = ShardedRankTracker(
+                    api_service.key_pool.configs(),
+                    st.session_state.workers,
+                    tenant=user,
+                    fair_share=load_fair_share_config()
+                )
+                run = sharded_tracker.track(
+                    st.session_state.keywords,
+                    st.session_state.domains,
+                    st.session_state.search_type,
+                    st.session_state.location,
+                    language,
+                    country_code,
+                    st.session_state.result_size,
+                    batch_size=st.session_state.batch_size,
+                    max_depth=st.session_state.max_depth,
+                    progress_callback=update_progress,
+                    adaptive=st.session_state.adaptive_size,
+                    previous_results=previous_results,
+                    result_callback=update_visibility,
+                    collect_features=index_features,
+                    max_credits=max_credits
+                )
+                feature_snapshots.update(run['features'])
+                st.session_state.discovery = None
+            else:
+                # Fetch every keyword, paginating deeper only where domains are still missing
+                run = rank_tracker.track(
+                    st.session_state.keywords,
+                    st.session_state.domains,
+                    st.session_state.search_type,
+                    st.session_state.location,
+                    language,
+                    country_code,
+                    st.session_state.result_size,
+                    **track_options
+                )
+                st.session_state.discovery = None
+            # Record the actual spend against the user's budget before anything else can fail
+            ledger.record(
+                user,
+                run['usage'],
+                len(st.session_state.keywords),
+                st.session_state.search_type,
+                st.session_state.location,
+                estimated_credits=estimate['credits']['expected'],
+                reservation_id=reservation_id
+            )
+            reservation_id = None
+            
+            results = run['results']
+            fetch_errors = run['errors']
+            
+            # Store the current results
+            memory.put('current_results', results)
+            # Metadata of this run's keywords only, earlier runs are in the history
+            memory.put('search_metadata', run['search_metadata'])
+            memory.put('url_hits', run['hits'])
+            st.session_state.fetch_errors = fetch_errors
+            st.session_state.run_usage = dict(run['usage'], estimated_credits=estimate['credits']['expected'])
+            st.session_state.visibility_index = visibility_index
+            if alert_engine:
+                st.session_state.alerts = {
+                    'alerts': alert_engine.close(fetch_errors),
+                    'delivery_errors': alert_engine.delivery_errors,
+                }
+                alert_engine = None
+            else:
+                st.session_state.alerts = None
+            
+            if feature_snapshots:
+                feature_store.index_snapshots(feature_snapshots, st.session_state.location)
+            
+            # Keep a persistent record for trend charts
+            history_store.record_run(
+                run,
+                st.session_state.domains,
+                st.session_state.keywords,
+                st.session_state.search_type,
+                st.session_state.location,
+                st.session_state.result_size,
+                max_depth=st.session_state.max_depth
+            )
+            clear_query_caches()
+            
+            # Add to history with timestamp
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            st.session_state.results_history[timestamp] = {
+                'search_type': st.session_state.search_type,
+                'result_size': st.session_state.result_size,
+                'max_depth': st.session_state.max_depth,
+                'location': st.session_state.location,
+                'keyword_count': len(st.session_state.keywords),
+            }
+            # Only read when a later run starts, so written to disk right away
+            memory.put(f"history/{timestamp}", {
+                'results': results,
+                'domains': st.session_state.domains.copy(),
+                'keywords': st.session_state.keywords.copy(),
+                'search_metadata': run['search_metadata'] if st.session_state.search_type == "search" else {},
+            }, spill=True)
+            while len(st.session_state.results_history) > MAX_HISTORY_RUNS:
+                oldest = next(iter(st.session_state.results_history))
+                del st.session_state.results_history[oldest]
+                memory.drop(f"history/{oldest}")
+            
+            st.success("Positions found!")
+            st.rerun()
+            
+        except Exception as e:
+            st.error(f"Error fetching data: {str(e)}")
+        finally:
+            api_service.queue_callback = None
+            if alert_engine is not None:
+                # Stops the sender thread of a run that failed before its alerts were settled
+                alert_engine.abort()
+            if reservation_id is not None:
+                # The run failed before it was recorded, settle with what was charged so far
+                usage = {key: api_service.usage[key] - usage_before[key] for key in usage_before}
+                spent = {'requests': usage['requests'], 'credits_used': usage['credits'], 'cache_hits': usage['cache_hits']}
+                if sharded_tracker is not None:
+                    # Workers fetch with their own clients, the tracker sums what their shards spent
+                    for key in spent:
+                        spent[key] += sharded_tracker.usage.get(key, 0)
+                ledger.record(
+                    user,
+                    spent,
+                    len(st.session_state.keywords),
+                    st.session_state.search_type,
+                    st.session_state.location,
+                    estimated_credits=estimate['credits']['expected'],
+                    reservation_id=reservation_id
+                )
 
 # Display results in a simplified format
-if st.session_state.current_results:
+current_results = memory.get('current_results')
+if current_results is None and memory.expired('current_results'):
+    st.info("The results of your last run were left unused for a day and have been removed. Run the check again to see them.")
+if current_results:
+    # pandas is only needed once there are results, keeping the first page light
+    import pandas as pd
+    
     st.markdown("## Results")
     
+    # API usage of the last run
+    usage = st.session_state.run_usage
+    if usage:
+        st.caption(
+            f"{usage['requests']} API requests · {usage['bytes_downloaded'] / 1024:,.0f} KB downloaded "
+            f"(fixed size: ~{usage['estimated_fixed_size_bytes'] / 1024:,.0f} KB) · "
+            f"{usage['credits_used']} credits used (fixed size: {usage['fixed_size_credits']}, saved: {usage['credits_saved']})"
+            + (f" · estimated {usage['estimated_credits']}" if usage.get('estimated_credits') is not None else "")
+            + (f" · {usage['cache_hits']} served from cache" if usage.get('cache_hits') else "")
+        )
+    
+    # Report keywords that could not be fetched
+    if st.session_state.fetch_errors:
+        st.warning(f"{len(st.session_state.fetch_errors)} keyword(s) could not be fetched and are shown as not found.")
+        with st.expander("Show failed keywords"):
+            for keyword, error in st.session_state.fetch_errors.items():
+                st.caption(f"{keyword}: {error}")
+    
+    # Rank drops found while the run fetched
+    if st.session_state.alerts is not None:
+        render_alerts(st.session_state.alerts['alerts'], st.session_state.alerts['delivery_errors'])
+    
+    # Visibility and share of voice from CTR-weighted positions
+    visibility_index = st.session_state.visibility_index
+    if visibility_index is not None and len(visibility_index):
+        st.markdown("### Visibility")
+        st.caption("Visibility: share of the clicks a #1 ranking for every keyword would get. Share of voice: share of the clicks captured by the tracked domains.")
+        visibility_rows = []
+        for domain, metrics in visibility_index.summary().items():
+            row = {
+                'Domain': domain,
+                'Visibility %': round(metrics['visibility'], 2),
+                'Share of Voice %': round(metrics['share_of_voice'], 2)
+            }
+            if st.session_state.keyword_weights:
+                row['Estimated Clicks'] = round(metrics['estimated_clicks'])
+            visibility_rows.append(row)
+        st.dataframe(pd.DataFrame(visibility_rows), use_container_width=True, hide_index=True)
+
+    # Coverage of the keywords found by discovery
+    discovery = st.session_state.discovery
+    if discovery:
+        st.markdown("### Keyword Discovery")
+        st.caption(
+            f"{len(discovery['discovered'])} keywords discovered through related searches · "
+            f"{discovery['frontier']['remaining']} candidates left unexplored"
+            + (f", {discovery['frontier']['dropped']} dropped from the frontier" if discovery['frontier']['dropped'] else "")
+        )
+        coverage_rows = []
+        for domain, counts in discovery['coverage'].items():
+            coverage_rows.append({
+                'Domain': domain,
+                'Ranked Keywords': f"{counts['found']} / {counts['keywords']}",
+                'Ranked Discovered Keywords': f"{counts['discovered_found']} / {counts['discovered']}",
+                'Discovered Coverage %': round(100 * counts['discovered_found'] / counts['discovered'], 1) if counts['discovered'] else 0.0
+            })
+        st.dataframe(pd.DataFrame(coverage_rows), use_container_width=True, hide_index=True)
+        if discovery['discovered']:
+            with st.expander("Show discovered keywords"):
+                discovered_df = pd.DataFrame(discovery['discovered'])
+                discovered_df['source'] = discovered_df['source'].map(DISCOVERY_SOURCES)
+                discovered_df['novelty'] = discovered_df['novelty'].round(2)
+                st.dataframe(
+                    discovered_df.rename(columns={
+                        'keyword': 'Keyword', 'parent': 'Found From', 'source': 'Source',
+                        'depth': 'Depth', 'novelty': 'Novelty'
+                    }),
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+    # Several URLs of one domain competing for a keyword
+    render_cannibalization(
+        memory.get('url_hits', {}),
+        st.session_state.domains,
+        st.session_state.keywords,
+        st.session_state.location,
+        st.session_state.search_type
+    )
+
+    # Keywords sharing ranking URLs, named clusters label the combined table
+    cluster_names = {}
+    if st.session_state.search_type == "search":
+        cluster_names = render_keyword_clusters(st.session_state.keywords, st.session_state.location)
+    
     # Create a combined table with domains and URLs
     combined_data = []
     
     for keyword in st.session_state.keywords:
-        keyword_results = st.session_state.current_results.get(keyword, {})
+        keyword_results = current_results.get(keyword, {})
         row = {'Keyword': keyword}
+        if cluster_names:
+            row['Cluster'] = cluster_names.get(keyword, "")
         
         # Add rank and URL for each domain
         for domain in st.session_state.domains:
@@ -176,28 +574,11 @@ if st.session_state.current_results:
                 if st.session_state.search_type == "images":
                     row[f"{domain} Image URL"] = ""
             else:
-                # Check if this is an image result (3 values) or regular result (2 values)
-                if len(result) == 3 and st.session_state.search_type == "images":
-                    # Unpack the tuple (rank, url, image_url)
-                    rank, url, image_url = result
-                    # Convert all ranks to string for consistency
-                    row[f"{domain} Rank"] = str(rank) if rank else "Not found"
-                    row[f"{domain} URL"] = url if url else ""
-                    row[f"{domain} Image URL"] = image_url if image_url else ""
-                else:
-                    # Unpack the tuple properly
-                    if len(result) == 3:
-                        # This is an image result but we're only going to use the first two values
-                        rank, url, _ = result
-                    else:
-                        # This is a regular result
-                        rank, url = result
-                    
-                    # Convert all ranks to string for consistency
-                    row[f"{domain} Rank"] = str(rank) if rank else "Not found"
-                    row[f"{domain} URL"] = url if url else ""
-                    if st.session_state.search_type == "images":
-                        row[f"{domain} Image URL"] = ""
+                # Convert all ranks to string for consistency
+                row[f"{domain} Rank"] = str(result.rank) if result.rank else "Not found"
+                row[f"{domain} URL"] = result.url
+                if st.session_state.search_type == "images":
+                    row[f"{domain} Image URL"] = result.image_url
         
         combined_data.append(row)
     
@@ -212,7 +593,7 @@ if st.session_state.current_results:
     
     # CSV export
     with col1:
-        csv = combined_df.to_csv(index=False)
+        csv = dataframe_to_csv(combined_df)
         st.download_button(
             label="Download as CSV",
             data=csv,
@@ -222,15 +603,8 @@ if st.session_state.current_results:
     
     # Excel export
     with col2:
-        # Create an Excel file in memory
-        output = io.BytesIO()
-        
-        # Create a workbook and add data
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            combined_df.to_excel(writer, sheet_name='Rankings', index=False)
-            
-        # Set pointer to the beginning of the stream
-        output.seek(0)
+        # openpyxl is only loaded once there are results to export
+        output = dataframe_to_excel(combined_df, 'Rankings')
         
         # Download button for Excel
         st.download_button(
@@ -239,9 +613,20 @@ if st.session_state.current_results:
             file_name="seo_rankings.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
-    
+
+    # Overview charts and gap analysis, imported here since they load plotly
+    from components.analysis import render_gap_analysis
+    from components.results import render_results
+
+    overview_tab, gap_tab = st.tabs(["Overview", "Gap Analysis"])
+    with overview_tab:
+        render_results(current_results, st.session_state.domains, st.session_state.keywords, clusters=cluster_names)
+    with gap_tab:
+        render_gap_analysis(current_results, st.session_state.domains, st.session_state.keywords, clusters=cluster_names)
+
     # For organic search, display additional information
-    if st.session_state.search_type == "search" and st.session_state.search_metadata:
+    search_metadata = memory.get('search_metadata', {})
+    if st.session_state.search_type == "search" and search_metadata:
         st.markdown("## Additional Search Information")
         st.caption("People Also Ask questions and Related Search Terms")
         
@@ -249,7 +634,7 @@ if st.session_state.current_results:
         additional_data = []
         
         for keyword in st.session_state.keywords:
-            metadata = st.session_state.search_metadata.get(keyword, {})
+            metadata = search_metadata.get(keyword, {})
             
             # Get related searches
             related_searches = metadata.get('related_searches', [])
@@ -286,7 +671,7 @@ if st.session_state.current_results:
             
             # CSV export
             with col1:
-                csv_additional = additional_df.to_csv(index=False)
+                csv_additional = dataframe_to_csv(additional_df)
                 st.download_button(
                     label="Download Additional Data as CSV",
                     data=csv_additional,
@@ -296,15 +681,7 @@ if st.session_state.current_results:
             
             # Excel export
             with col2:
-                # Create an Excel file in memory
-                output_additional = io.BytesIO()
-                
-                # Create a workbook and add data
-                with pd.ExcelWriter(output_additional, engine='openpyxl') as writer:
-                    additional_df.to_excel(writer, sheet_name='Additional Data', index=False)
-                    
-                # Set pointer to the beginning of the stream
-                output_additional.seek(0)
+                output_additional = dataframe_to_excel(additional_df, 'Additional Data')
                 
                 # Download button for Excel
                 st.download_button(
@@ -315,6 +692,21 @@ if st.session_state.current_results:
                 )
 else:
     st.info("Enter domains and keywords then click 'Check Positions' to see results here.")
+
+# SERP features across the indexed keyword archive
+if st.session_state.search_type == "search" and st.session_state.keywords:
+    render_serp_features(st.session_state.keywords, st.session_state.location)
+    # Hosts ranking next to the tracked domains in the archived organic results
+    render_competitor_suggestions(st.session_state.domains, st.session_state.keywords, st.session_state.location)
+
+# Historical trends for the current domains
+if st.session_state.domains:
+    render_trends(
+        st.session_state.domains,
+        st.session_state.keywords,
+        st.session_state.location,
+        st.session_state.search_type
+    )
     
 # Footer with usage instructions
 st.markdown("""
@@ -0,0 +1,42 @@
+import streamlit as st
+
+from utils.alerts import RULE_LABELS
+
+
+def render_alerts(alerts, delivery_errors=None):
+    """
+    Render the rank alerts raised during the last run
+
+    Args:
+        alerts (list): Alerts returned by AlertEngine.close
+        delivery_errors (list): Sinks that could not deliver, as messages
+    """
+    for error in delivery_errors or []:
+        st.warning(f"Alerts could not be delivered: {error}")
+    if not alerts:
+        return
+
+    import pandas as pd
+
+    st.markdown("### Alerts")
+    counts = {}
+    for alert in alerts:
+        counts[alert['rule']] = counts.get(alert['rule'], 0) + 1
+    st.error(" · ".join(f"{RULE_LABELS.get(rule, rule)}: {count}" for rule, count in counts.items()))
+    with st.expander(f"Show {len(alerts)} alert(s)"):
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    'Alert': RULE_LABELS.get(alert['rule'], alert['rule']),
+                    'Keyword': alert['keyword'],
+                    'Domain': alert['domain'],
+                    'Previous Rank': alert['previous_rank'],
+                    'Rank': alert['rank'],
+                    'Competitor': alert['competitor'] or "",
+                    'Details': alert['message'],
+                }
+                for alert in alerts
+            ]),
+            use_container_width=True,
+            hide_index=True
+        )
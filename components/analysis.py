@@ -2,7 +2,10 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 
-def render_gap_analysis(results, domains, keywords):
+from utils.charts import rank_scatter
+from utils.models import rank_of
+
+def render_gap_analysis(results, domains, keywords, clusters=None):
     """
     Render gap analysis between domains with improved UI
     
@@ -10,6 +13,7 @@ def render_gap_analysis(results, domains, keywords):
         results (dict): The results dictionary
         domains (list): List of domains
         keywords (list): List of keywords
+        clusters (dict): Keyword -> cluster name from cluster_labels, groups opportunities by intent
     """
     if len(domains) < 2:
         st.warning("⚠️ You need at least two domains to perform gap analysis.")
@@ -41,19 +45,21 @@ def render_gap_analysis(results, domains, keywords):
     
     for keyword in keywords:
         keyword_results = results.get(keyword, {})
-        primary_rank = keyword_results.get(primary_domain, None)
+        primary_rank = rank_of(keyword_results.get(primary_domain))
         
         row = {
             'Keyword': keyword,
             'Your Rank': primary_rank if primary_rank is not None else "Not ranked"
         }
+        if clusters:
+            row['Cluster'] = clusters.get(keyword, "")
         
         # Add competitor ranks
         best_competitor = None
         best_competitor_rank = None
         
         for competitor in competitor_domains:
-            competitor_rank = keyword_results.get(competitor, None)
+            competitor_rank = rank_of(keyword_results.get(competitor))
             row[competitor] = competitor_rank if competitor_rank is not None else "Not ranked"
             
             # Track best competitor for this keyword
@@ -144,13 +150,25 @@ def render_gap_analysis(results, domains, keywords):
                 return 'background-color: #f0f0f0; color: #424242;'  # Light gray for small gaps
             return ''
         
-        # Display styled table with better formatting
+        # Display styled table with better formatting, pandas refuses to style very large tables
         st.dataframe(
-            opportunities.style.map(highlight_gaps, subset=['Rank Difference']),
+            opportunities.style.map(highlight_gaps, subset=['Rank Difference'])
+            if opportunities.size <= pd.get_option("styler.render.max_elements") else opportunities,
             use_container_width=True,
             height=300
         )
         
+        # Keywords of one cluster share a SERP, so one page can close all their gaps
+        if clusters:
+            clustered = opportunities[opportunities['Cluster'] != ""]
+            if not clustered.empty:
+                st.markdown("#### Opportunities by Cluster")
+                cluster_df = clustered.groupby('Cluster').agg(
+                    Keywords=('Keyword', 'count'),
+                    **{'Total Gap': ('Rank Difference', 'sum')}
+                ).reset_index().sort_values('Total Gap', ascending=False)
+                st.dataframe(cluster_df, use_container_width=True, hide_index=True)
+        
         # Create visualization of top opportunities with improved design
         st.markdown("### 📊 Top Keyword Opportunities")
         
@@ -185,26 +203,20 @@ def render_gap_analysis(results, domains, keywords):
                 st.plotly_chart(fig1, use_container_width=True, key="opportunity_bar_chart")
             
             with chart_col2:
-                # Create a scatter plot showing your rank vs competitor rank
-                scatter_data = top_opportunities.copy()
-                scatter_data['Competitor Rank'] = scatter_data.apply(
-                    lambda row: row['Your Rank'] - row['Rank Difference'] 
-                    if isinstance(row['Your Rank'], (int, float)) else 0, 
-                    axis=1
-                )
+                # Scatter of your rank vs competitor rank over every ranked opportunity,
+                # keywords at the same positions share one WebGL marker
+                scatter_points = [
+                    {
+                        'x': row['Your Rank'],
+                        'y': row['Your Rank'] - row['Rank Difference'],
+                        'color': row['Best Competitor'],
+                        'label': row['Keyword']
+                    }
+                    for row in opportunities.to_dict('records')
+                    if isinstance(row['Your Rank'], (int, float))
+                ]
                 
-                fig2 = px.scatter(
-                    scatter_data,
-                    x='Your Rank',
-                    y='Competitor Rank',
-                    color='Best Competitor',
-                    size='Rank Difference',
-                    hover_name='Keyword',
-                    title='Your Rank vs Competitor Rank',
-                    labels={'Your Rank': 'Your Position', 'Competitor Rank': 'Competitor Position'},
-                    height=400,
-                    color_discrete_sequence=px.colors.qualitative.Bold
-                )
+                fig2, _ = rank_scatter(scatter_points, title='Your Rank vs Competitor Rank')
                 
                 # Add reference line (y=x)
                 fig2.add_shape(
@@ -226,7 +238,7 @@ def render_gap_analysis(results, domains, keywords):
             💡 **How to read these charts:**
             - In the bar chart, taller bars represent bigger ranking gaps where competitors outperform you
             - In the scatter plot, points below the diagonal line show keywords where competitors rank better than you
-            - The size of each bubble represents the magnitude of the ranking gap
+            - The size of each bubble represents how many keywords share those positions
             """)
     else:
         st.success("🎉 No keyword opportunities found. You are ranking better than competitors for all tracked keywords.")
@@ -250,9 +262,10 @@ def render_gap_analysis(results, domains, keywords):
                 return 'background-color: #f0f0f0; color: #424242;'  # Light gray for small advantages
             return ''
         
-        # Display styled table with better formatting
+        # Display styled table with better formatting, unstyled when too large like the opportunities
         st.dataframe(
-            strengths.style.map(highlight_strengths, subset=['Rank Difference']),
+            strengths.style.map(highlight_strengths, subset=['Rank Difference'])
+            if strengths.size <= pd.get_option("styler.render.max_elements") else strengths,
             use_container_width=True,
             height=300
         )
@@ -0,0 +1,71 @@
+import streamlit as st
+
+from utils.api_service import RESPONSE_CACHE
+from utils.app_cache import cache_sizes, clear_all_caches, get_session_registry, get_spill_store
+
+
+def _megabytes(size):
+    return f"{size / 1024 / 1024:,.1f} MB"
+
+
+def render_cache_admin(memory=None):
+    """
+    Render the sidebar panel with shared cache sizes, session memory and a clear button
+
+    Args:
+        memory (SessionMemory): This session's payloads, from get_session_memory
+    """
+    with st.sidebar.expander("Cache"):
+        lookups = RESPONSE_CACHE.hits + RESPONSE_CACHE.misses
+        st.caption(
+            f"Search responses: {len(RESPONSE_CACHE):,} cached, "
+            f"{RESPONSE_CACHE.hits:,} of {lookups:,} lookups served from cache "
+            f"(kept {RESPONSE_CACHE.ttl // 60:.0f} min)"
+        )
+
+        sizes = cache_sizes()
+        if sizes:
+            import pandas as pd
+            st.dataframe(
+                pd.DataFrame(
+                    [{'Cache': name, 'Size (KB)': round(size / 1024, 1)} for name, size in sorted(sizes.items())]
+                ),
+                use_container_width=True,
+                hide_index=True
+            )
+        else:
+            st.caption("No cached services or queries yet.")
+
+        if memory is not None:
+            import pandas as pd
+
+            usage = memory.usage()
+            st.caption(
+                f"This session: about {_megabytes(usage['resident_bytes'])} in memory "
+                f"(limit {_megabytes(memory.max_bytes)}), {_megabytes(usage['spilled_bytes'])} on disk"
+            )
+            if usage['expired']:
+                st.caption(f"{len(usage['expired'])} stored payload(s) expired from disk while the session was idle")
+            spill = get_spill_store().usage()
+            st.caption(f"Spill directory: {spill['files']:,} files, {_megabytes(spill['bytes'])}")
+            sessions = get_session_registry().sessions()
+            if sessions:
+                st.dataframe(
+                    pd.DataFrame([
+                        {
+                            'Session': session['session_id'][:8],
+                            'User': session['user'] or "",
+                            'In Memory (MB)': round(session['resident_bytes'] / 1024 / 1024, 1),
+                            'On Disk (MB)': round(session['spilled_bytes'] / 1024 / 1024, 1),
+                            'Entries': session['entries'],
+                            'Idle (min)': round(session['idle_seconds'] / 60),
+                        }
+                        for session in sessions
+                    ]),
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+        if st.button("Clear caches", key="clear_caches", help="Clears cached queries, exports and search responses for every session. Shared services are kept."):
+            clear_all_caches()
+            st.rerun()
@@ -0,0 +1,103 @@
+import streamlit as st
+from datetime import date, timedelta
+
+from utils.app_cache import cached_url_changes, dataframe_to_csv
+from utils.cannibalization import find_multiple_urls, find_url_switches, keyword_flags, summarize
+
+# Days of history searched for URL switches
+SWITCH_WINDOW_DAYS = 90
+
+
+def render_cannibalization(hits, domains, keywords, location, search_type):
+    """
+    Render keywords where several URLs of a domain compete
+
+    Multiple URLs come from the current run, URL switches from the stored
+    history of earlier runs.
+
+    Args:
+        hits (dict): Keyword -> domain -> list of RankHit of the current run
+        domains (list): List of domains
+        keywords (list): Keywords of the current run
+        location (str): Location for search results
+        search_type (str): Type of search (search, images)
+    """
+    multiple_urls = find_multiple_urls({keyword: hits[keyword] for keyword in keywords if keyword in hits})
+    url_switches = find_url_switches(
+        cached_url_changes(domains, location, search_type, date.today() - timedelta(days=SWITCH_WINDOW_DAYS)),
+        keywords
+    )
+    if not multiple_urls and not url_switches:
+        return
+
+    import pandas as pd
+
+    st.markdown("### Keyword Cannibalization")
+    st.caption(
+        "Keywords where more than one URL of a domain ranks in the fetched results, "
+        f"or where the ranking URL changed between runs in the last {SWITCH_WINDOW_DAYS} days."
+    )
+
+    summary = summarize(multiple_urls, url_switches, domains, len(keywords))
+    st.dataframe(
+        pd.DataFrame([
+            {
+                'Domain': domain,
+                'Keywords with Multiple URLs': counts['multiple_url_keywords'],
+                'Competing URLs': counts['competing_urls'],
+                'Keywords with URL Switches': counts['switching_keywords'],
+                'Affected Keywords %': round(counts['affected_pct'], 1),
+            }
+            for domain, counts in summary.items()
+        ]),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    if multiple_urls:
+        with st.expander(f"Show {len(multiple_urls)} keyword(s) with multiple URLs"):
+            st.dataframe(
+                pd.DataFrame([
+                    {
+                        'Keyword': finding['keyword'],
+                        'Domain': finding['domain'],
+                        'URLs': finding['url_count'],
+                        'Best Rank': finding['best_rank'],
+                        'Positions': "\n".join(f"#{rank} {url}" for rank, url in finding['urls']),
+                    }
+                    for finding in multiple_urls
+                ]),
+                use_container_width=True,
+                hide_index=True
+            )
+
+    if url_switches:
+        with st.expander(f"Show {len(url_switches)} URL switch(es)"):
+            st.dataframe(
+                pd.DataFrame([
+                    {
+                        'Keyword': change['keyword'],
+                        'Domain': change['domain'],
+                        'Run': change['started_at'].replace("T", " "),
+                        'Previous URL': change['previous_url'],
+                        'Previous Rank': change['previous_rank'],
+                        'URL': change['url'],
+                        'Rank': change['rank'],
+                    }
+                    for change in url_switches
+                ]),
+                use_container_width=True,
+                hide_index=True
+            )
+
+    flags = keyword_flags(multiple_urls, url_switches)
+    export_df = pd.DataFrame([
+        {'Keyword': keyword, 'Domain': domain, 'Issues': ", ".join(issues)}
+        for (keyword, domain), issues in sorted(flags.items())
+    ])
+    st.download_button(
+        label="Download Cannibalization Report as CSV",
+        data=dataframe_to_csv(export_df),
+        file_name="cannibalization.csv",
+        mime="text/csv"
+    )
@@ -0,0 +1,64 @@
+import streamlit as st
+
+from utils.app_cache import cached_keyword_clusters, dataframe_to_csv
+from utils.keyword_clusters import DEFAULT_THRESHOLD, cluster_labels
+
+# Jaccard similarities offered as the minimum URL overlap
+THRESHOLD_OPTIONS = [0.2, DEFAULT_THRESHOLD, 0.4, 0.5, 0.7]
+
+
+def render_keyword_clusters(keywords, location):
+    """
+    Render keywords grouped by the URLs their results share
+
+    Clusters are built from the organic results archived in the SERP
+    features index, so no keyword is fetched again.
+
+    Args:
+        keywords (list): Keywords of the current run
+        location (str): Location for search results
+
+    Returns:
+        dict: Keyword -> cluster name, empty if nothing was clustered
+    """
+    threshold = st.session_state.get('cluster_threshold', DEFAULT_THRESHOLD)
+    clusters = cached_keyword_clusters(keywords, location, threshold)
+    if not clusters:
+        return {}
+
+    import pandas as pd
+
+    st.markdown("### Keyword Clusters")
+    st.caption(
+        "Keywords whose top 10 results share URLs answer the same search intent and can usually be "
+        "served by one page. Each cluster is named after the keyword sharing most of its URLs."
+    )
+    st.select_slider(
+        "Minimum URL overlap",
+        options=THRESHOLD_OPTIONS,
+        format_func=lambda x: f"{x:.0%}",
+        key="cluster_threshold",
+        help="Jaccard similarity of two keywords' top URLs needed to put them in one cluster"
+    )
+    labels = cluster_labels(clusters)
+    st.caption(f"{len(labels):,} of {len(keywords):,} keywords in {len(clusters):,} clusters")
+
+    clusters_df = pd.DataFrame([
+        {
+            'Cluster': cluster['name'],
+            'Keywords': cluster['size'],
+            'Members': ", ".join(cluster['keywords']),
+            'Shared URLs': "\n".join(cluster['shared_urls'][:5]),
+        }
+        for cluster in clusters
+    ])
+    st.dataframe(clusters_df, use_container_width=True, hide_index=True, height=300)
+    st.download_button(
+        label="Download Clusters as CSV",
+        data=dataframe_to_csv(pd.DataFrame(
+            [{'Cluster': name, 'Keyword': keyword} for keyword, name in labels.items()]
+        )),
+        file_name="seo_keyword_clusters.csv",
+        mime="text/csv"
+    )
+    return labels
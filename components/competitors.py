@@ -0,0 +1,82 @@
+import streamlit as st
+
+from utils.app_cache import cached_competitors, dataframe_to_csv
+
+
+def _add_domains(hosts):
+    """Append hosts to the tracked domains and the domains text area"""
+    added = [host for host in hosts if host not in st.session_state.domains]
+    st.session_state.domains = st.session_state.domains + added
+    current = st.session_state.get('domains_input', "").strip()
+    st.session_state.domains_input = "\n".join(([current] if current else []) + added)
+
+
+def render_competitor_suggestions(domains, keywords, location):
+    """
+    Render the hosts ranking most often next to the tracked domains
+
+    Counted over the organic results archived in the SERP features index,
+    so suggestions cover every indexed page of the keywords without
+    fetching anything again.
+
+    Args:
+        domains (list): Tracked domains, left out of the suggestions
+        keywords (list): Keywords of the current run
+        location (str): Location for search results
+    """
+    st.markdown("## Competitor Discovery")
+    scope_all = st.checkbox("Include all indexed keywords", value=False, key="competitor_scope")
+    competitors = cached_competitors(domains, keywords=None if scope_all else keywords, location=location)
+    suggestions = competitors['suggestions']
+    if not suggestions:
+        st.info("No archived organic results yet. Run an organic search with SERP feature indexing enabled.")
+        return
+
+    import pandas as pd
+
+    st.caption(
+        f"Hosts ranking most often across {competitors['keywords']:,} archived result pages. "
+        "Visibility is the share of the clicks a #1 ranking for every keyword would get."
+    )
+    if not all(suggestion['exact'] for suggestion in suggestions):
+        # Hosts that replaced another one were only counted from then on
+        st.caption(
+            "Hosts not marked Exact were counted only after more hosts ranked than are tracked: "
+            "they rank for at least their Keywords, and their Visibility may be overestimated."
+        )
+    suggestions_df = pd.DataFrame([
+        {
+            'Host': suggestion['host'],
+            'Keywords': suggestion['keywords'],
+            'Keywords %': round(suggestion['keyword_pct'], 1),
+            'Visibility %': round(suggestion['visibility'], 2),
+            'Average Position': round(suggestion['average_position'], 1),
+            # Once more hosts rank than are counted, lower ranked hosts are estimates
+            'Certain': suggestion['guaranteed'],
+            'Exact': suggestion['exact'],
+        }
+        for suggestion in suggestions
+    ])
+    st.dataframe(suggestions_df, use_container_width=True, hide_index=True)
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        selected = st.multiselect(
+            "Competitors to track",
+            options=[suggestion['host'] for suggestion in suggestions],
+            key="competitor_selection"
+        )
+    with col2:
+        st.button(
+            "Add to Domains",
+            use_container_width=True,
+            disabled=not selected,
+            on_click=_add_domains,
+            args=(selected,)
+        )
+    st.download_button(
+        label="Download Competitors as CSV",
+        data=dataframe_to_csv(suggestions_df),
+        file_name="seo_competitors.csv",
+        mime="text/csv"
+    )
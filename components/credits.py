@@ -0,0 +1,55 @@
+import streamlit as st
+
+
+def render_cost_estimate(estimate, limit=None):
+    """
+    Render the estimated cost of a planned run
+
+    Args:
+        estimate (dict): Output of estimate_run_cost
+        limit (int): Credit limit of the run, None if unlimited
+    """
+    credits = estimate['credits']
+    requests = estimate['requests']
+    st.info(
+        f"Estimated cost for {estimate['keywords']:,} keywords: **{credits['expected']:,} credits** "
+        f"(between {credits['min']:,} and {credits['max']:,}) in about {requests['expected']:,} API requests. "
+        f"{estimate['cached']:,} keyword(s) will be served from the cache."
+    )
+    if limit is not None and credits['expected'] > limit:
+        st.warning(f"The run will stop at the credit budget of {limit:,}, keywords left over are reported as failed.")
+
+
+def render_credit_spend(ledger, user, budgets):
+    """
+    Render the sidebar panel with the user's credit spend and budgets
+
+    Args:
+        ledger (CreditLedger): The credit ledger
+        user (str): The current user
+        budgets (dict): Output of get_budgets
+    """
+    with st.sidebar.expander("Credit Spend"):
+        spent = ledger.spent(user)
+        reserved = ledger.reserved(user)
+        monthly = budgets['per_user_monthly_credits']
+        if monthly:
+            st.caption(f"{spent:,} of {monthly:,} credits used this month, {max(0, monthly - spent):,} left")
+            st.progress(min(1.0, spent / monthly))
+        else:
+            st.caption(f"{spent:,} credits used this month")
+        if reserved:
+            st.caption(f"{reserved:,} of them held by runs in progress")
+        if budgets['per_run_credits']:
+            st.caption(f"Runs are limited to {budgets['per_run_credits']:,} credits")
+
+        recent = ledger.recent(user, limit=10)
+        if not recent:
+            st.caption("No runs recorded yet.")
+            return
+        for entry in recent:
+            estimated = f" (estimated {entry['estimated_credits']:,})" if entry['estimated_credits'] is not None else ""
+            st.caption(
+                f"{entry['recorded_at'].replace('T', ' ')} · {entry['keyword_count']:,} keywords · "
+                f"{entry['credits']:,} credits{estimated}"
+            )
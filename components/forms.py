@@ -1,5 +1,36 @@
 import streamlit as st
 
+from utils.api_service import VERTICALS
+from utils.sharded_tracker import default_workers
+from utils.keyword_import import (
+    DOMAIN_HEADERS,
+    KEYWORD_HEADERS,
+    WEIGHT_HEADERS,
+    ImportFileError,
+    import_values,
+    iter_file_values,
+    iter_text_lines,
+    normalize_domain,
+    normalize_keyword,
+)
+
+IMPORT_FILE_TYPES = ["txt", "csv", "xlsx", "gz"]
+
+
+def _render_import_report(name):
+    """Show counts and rejected values of the last import"""
+    report = st.session_state.get('import_reports', {}).get(name)
+    if report is None:
+        return
+    st.caption(report.summary())
+    if report.rejects:
+        with st.expander(f"Show rejected {name}"):
+            for line_number, value, reason in report.rejects:
+                st.caption(f"Line {line_number}: {value[:100]} ({reason})")
+            if report.rejected > len(report.rejects):
+                st.caption(f"...and {report.rejected - len(report.rejects)} more")
+
+
 def render_input_forms():
     """Render the simplified input forms for domains, keywords, and search options"""
     
@@ -8,8 +39,16 @@ def render_input_forms():
     domains_input = st.text_area(
         "Enter domains (one per line)",
         placeholder="example.com\nanothersite.com",
-        height=100
+        height=100,
+        key="domains_input"
     )
+    domains_file = st.file_uploader(
+        "Or import domains from a file",
+        type=IMPORT_FILE_TYPES,
+        help="TXT, CSV or XLSX (optionally gzip compressed). Uses a 'domain' or 'url' column if present, otherwise the first column.",
+        key="domains_file"
+    )
+    _render_import_report('domains')
     
     # Keywords input (bulk)
     st.subheader("Keywords")
@@ -18,6 +57,13 @@ def render_input_forms():
         placeholder="keyword1\nkeyword2\nkeyword3",
         height=100
     )
+    keywords_file = st.file_uploader(
+        "Or import keywords from a file",
+        type=IMPORT_FILE_TYPES,
+        help="TXT, CSV or XLSX (optionally gzip compressed). Uses a 'keyword' column if present, otherwise the first column. An optional 'search volume' column weights the visibility index.",
+        key="keywords_file"
+    )
+    _render_import_report('keywords')
     
     # Only display simple search options
     col1, col2 = st.columns(2)
@@ -26,8 +72,8 @@ def render_input_forms():
         # Search type
         st.session_state.search_type = st.selectbox(
             "Search Type",
-            options=["search", "images"],
-            format_func=lambda x: "Organic Search" if x == "search" else "Image Search",
+            options=list(VERTICALS),
+            format_func=lambda x: VERTICALS[x]['label'],
             index=0
         )
     
@@ -47,27 +93,108 @@ def render_input_forms():
         value=st.session_state.result_size
     )
     
+    # Advanced request options
+    with st.expander("Advanced Options"):
+        st.session_state.batch_size = st.select_slider(
+            "Keywords per Request",
+            options=[1, 10, 25, 50, 100],
+            value=st.session_state.batch_size,
+            help="Send several keywords in one batched API request. 1 sends one request per keyword."
+        )
+        
+        st.session_state.max_depth = st.selectbox(
+            "Search Depth",
+            options=[None, 200, 300],
+            format_func=lambda x: "First page only" if x is None else f"Up to position {x}",
+            index=[None, 200, 300].index(st.session_state.max_depth),
+            help="Fetch further result pages, only for keywords where a domain was not found yet."
+        )
+        
+        worker_options = [1] + [workers for workers in (2, 4, 8, 16, 32) if workers <= default_workers()]
+        st.session_state.workers = st.selectbox(
+            "Worker Processes",
+            options=worker_options,
+            index=worker_options.index(st.session_state.workers) if st.session_state.workers in worker_options else 0,
+            help="Split large keyword lists across processes so parsing and matching use several CPU cores. Worth it from a few thousand keywords."
+        )
+        
+        st.session_state.adaptive_size = st.checkbox(
+            "Adaptive Result Size",
+            value=st.session_state.adaptive_size,
+            help="Start with 10 results per keyword and request the full result size only where a domain was not found. Uses the previous run to pick a starting size."
+        )
+        
+        st.session_state.index_serp_features = st.checkbox(
+            "Index SERP Features",
+            value=st.session_state.index_serp_features,
+            help="Store all People Also Ask questions, related searches, sitelinks and top stories for the SERP Features Explorer."
+        )
+        
+        st.session_state.discover_keywords = st.checkbox(
+            "Discover Related Keywords",
+            value=st.session_state.discover_keywords,
+            help="Organic search only. Expand the keywords through related searches and People Also Ask, track the discovered keywords too and report how many each domain ranks for."
+        )
+        
+        if st.session_state.discover_keywords:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.session_state.expansion_depth = st.selectbox(
+                    "Expansion Depth",
+                    options=[1, 2, 3],
+                    index=[1, 2, 3].index(st.session_state.expansion_depth),
+                    help="How many steps away from the entered keywords discovery may go"
+                )
+            with col2:
+                st.session_state.max_new_keywords = st.select_slider(
+                    "Max Discovered Keywords",
+                    options=[10, 25, 50, 100, 200],
+                    value=st.session_state.max_new_keywords,
+                    help="Each discovered keyword costs at least one more search"
+                )
+        
+        st.session_state.run_budget = st.number_input(
+            "Run Credit Budget",
+            min_value=0,
+            step=10,
+            value=st.session_state.run_budget,
+            help="Stop requesting pages once this run has used this many credits. 0 leaves only the configured budgets."
+        )
+    
     # Track button with more prominence
     track_btn = st.button("Check Positions", use_container_width=True, type="primary")
     
     # Process input values if track button was clicked
     if track_btn:
-        # Process domains
-        if domains_input:
-            # Clear previous domains
-            st.session_state.domains = []
-            # Add new domains
-            domain_list = [d.strip().replace("https://", "").replace("http://", "") 
-                          for d in domains_input.split("\n") if d.strip()]
-            st.session_state.domains = domain_list
+        import_reports = {}
+        
+        try:
+            # Process domains, an uploaded file takes precedence over the text area
+            if domains_file is not None:
+                import_reports['domains'] = import_values(
+                    iter_file_values(domains_file, domains_file.name, DOMAIN_HEADERS), normalize_domain
+                )
+            elif domains_input:
+                import_reports['domains'] = import_values(iter_text_lines(domains_input), normalize_domain)
+            
+            # Process keywords
+            if keywords_file is not None:
+                import_reports['keywords'] = import_values(
+                    iter_file_values(keywords_file, keywords_file.name, KEYWORD_HEADERS, WEIGHT_HEADERS), normalize_keyword
+                )
+            elif keywords_input:
+                import_reports['keywords'] = import_values(iter_text_lines(keywords_input), normalize_keyword)
+        except ImportFileError as e:
+            # Keep the previous domains and keywords and do not start a run
+            st.error(str(e))
+            return False
         
-        # Process keywords
-        if keywords_input:
-            # Clear previous keywords
-            st.session_state.keywords = []
-            # Add new keywords
-            keyword_list = [k.strip() for k in keywords_input.split("\n") if k.strip()]
-            st.session_state.keywords = keyword_list
+        if 'domains' in import_reports:
+            st.session_state.domains = import_reports['domains'].values
+        if 'keywords' in import_reports:
+            st.session_state.keywords = import_reports['keywords'].values
+            st.session_state.keyword_weights = import_reports['keywords'].weights
+        st.session_state.import_reports = import_reports
     
     # Return track button status to use in app.py
     return track_btn
@@ -0,0 +1,29 @@
+import streamlit as st
+
+
+def render_key_pool_stats(key_pool):
+    """
+    Render the sidebar panel with per-key usage and quarantine state
+
+    Args:
+        key_pool (KeyPool): The process-wide API key pool
+    """
+    with st.sidebar.expander("API Keys"):
+        if not key_pool:
+            st.caption("No API key configured. Add api_keys.serper or api_keys.serper_keys to your secrets.")
+            return
+
+        stats = key_pool.stats()
+        st.caption(f"{len(stats)} key(s), picked by weighted round-robin. Credits include earlier runs recorded in the ledger.")
+        for key in stats:
+            limit = f" / {key['credit_limit']:,}" if key['credit_limit'] else ""
+            st.caption(
+                f"**{key['name']}** (weight {key['weight']}): {key['status']} · "
+                f"{key['requests']:,} requests · {key['credits']:,}{limit} credits · "
+                f"{key['failures']} failures ({key['rate_limited']} rate limited)"
+            )
+
+        if any(key['status'] != "active" for key in stats):
+            if st.button("Release quarantined keys", key="release_keys"):
+                key_pool.release_quarantine()
+                st.rerun()
@@ -0,0 +1,35 @@
+import streamlit as st
+
+from utils.dispatcher import BULK, LANES
+
+
+def render_request_queue(dispatcher, user):
+    """
+    Render the sidebar panel with the shared request queue
+
+    Args:
+        dispatcher (RequestDispatcher): The process-wide dispatcher
+        user (str): The current user, whose queued requests are highlighted
+    """
+    with st.sidebar.expander("Request Queue"):
+        stats = dispatcher.stats()
+        bulk_rate = dispatcher.lane_rates.get(BULK)
+        st.caption(
+            f"Up to {dispatcher.max_in_flight} requests at a time, "
+            f"{dispatcher.bulk_max_in_flight} of them for large runs"
+            + (f" at {bulk_rate:g} per second" if bulk_rate else "")
+            + ". Large runs use the bulk lane and take turns fairly between users."
+        )
+        for lane in LANES:
+            counts = stats['lanes'][lane]
+            st.caption(f"**{lane.capitalize()}**: {counts['in_flight']} being sent, {counts['queued']} waiting")
+
+        mine = [tenant for tenant in stats['tenants'] if tenant['tenant'] == user]
+        for tenant in mine:
+            st.caption(
+                f"You ({tenant['lane']}): {tenant['queued']} waiting · "
+                f"{tenant['requests']:,} requests and {tenant['credits']:,} credits served"
+            )
+        others = len({tenant['tenant'] for tenant in stats['tenants'] if tenant['tenant'] != user and tenant['queued']})
+        if others:
+            st.caption(f"{others} other user(s) have requests waiting")
@@ -2,7 +2,10 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 
-def render_results(results, domains, keywords):
+from utils.charts import keyword_rank_bars, rank_histogram
+from utils.models import rank_of
+
+def render_results(results, domains, keywords, clusters=None):
     """
     Render the ranking results with improved UI and visualizations
     
@@ -10,6 +13,7 @@ def render_results(results, domains, keywords):
         results (dict): The results dictionary
         domains (list): List of domains
         keywords (list): List of keywords
+        clusters (dict): Keyword -> cluster name from cluster_labels, adds a Cluster column
     """
     if not results:
         st.info("No results available.")
@@ -30,7 +34,7 @@ def render_results(results, domains, keywords):
         not_found_count = 0
         
         for keyword in keywords:
-            rank = results.get(keyword, {}).get(domain, None)
+            rank = rank_of(results.get(keyword, {}).get(domain))
             if rank is not None:
                 domain_positions.append(rank)
                 if rank <= 3:
@@ -114,9 +118,11 @@ def render_results(results, domains, keywords):
     for keyword in keywords:
         keyword_results = results.get(keyword, {})
         row = {'Keyword': keyword}
+        if clusters:
+            row['Cluster'] = clusters.get(keyword, "")
         
         for domain in domains:
-            rank = keyword_results.get(domain, None)
+            rank = rank_of(keyword_results.get(domain))
             if rank is None:
                 row[domain] = "Not found"
             else:
@@ -141,13 +147,14 @@ def render_results(results, domains, keywords):
             return 'background-color: #ffcdd2; color: #b71c1c;'  # Red for others
         return ''
     
-    # Display the styled table with filtering options
-    st.caption("Green = Top 3, Yellow = Top 10, Orange = Top 30, Red = Lower positions")
-    st.dataframe(
-        df.style.map(highlight_rankings, subset=[col for col in df.columns if col != 'Keyword']),
-        use_container_width=True,
-        height=400
-    )
+    # Display the styled table with filtering options, pandas refuses to style very large tables
+    if df.size <= pd.get_option("styler.render.max_elements"):
+        st.caption("Green = Top 3, Yellow = Top 10, Orange = Top 30, Red = Lower positions")
+        table = df.style.map(highlight_rankings, subset=[col for col in df.columns if col not in ('Keyword', 'Cluster')])
+    else:
+        st.caption("Rank colors are left out for tables this large")
+        table = df
+    st.dataframe(table, use_container_width=True, height=400)
     
     # Create visualizations
     st.markdown("### 📊 Ranking Visualizations")
@@ -207,37 +214,23 @@ def render_results(results, domains, keywords):
     with viz_tab2:
         # Ranking distribution chart
         if domains and keywords:
-            # Prepare data for distribution chart
-            all_ranks = []
+            # Ranks per domain, binned before plotting so the chart size does not grow with keywords
+            ranks_by_domain = {}
             for domain in domains:
                 domain_ranks = []
                 for keyword in keywords:
-                    rank = results.get(keyword, {}).get(domain, None)
+                    rank = rank_of(results.get(keyword, {}).get(domain))
                     if rank is not None:
-                        domain_ranks.append({'Domain': domain, 'Rank': rank})
-                all_ranks.extend(domain_ranks)
+                        domain_ranks.append(rank)
+                if domain_ranks:
+                    ranks_by_domain[domain] = domain_ranks
             
-            if all_ranks:
-                rank_df = pd.DataFrame(all_ranks)
-                
-                # Create histogram of rankings
-                fig2 = px.histogram(
-                    rank_df,
-                    x='Rank',
-                    color='Domain',
-                    marginal='box',  # Add box plot on the margin
-                    nbins=20,
-                    title='Distribution of Ranking Positions',
-                    labels={'Rank': 'Ranking Position (Lower is Better)'},
-                    opacity=0.7
-                )
+            if ranks_by_domain:
+                # Create histogram of rankings with a box plot on the margin
+                fig2 = rank_histogram(ranks_by_domain, title='Distribution of Ranking Positions')
                 
-                fig2.update_layout(
-                    xaxis_title='Ranking Position',
-                    yaxis_title='Count of Keywords',
-                    height=450,
-                    bargap=0.1
-                )
+                fig2.update_xaxes(title='Ranking Position (Lower is Better)', row=2, col=1)
+                fig2.update_yaxes(title='Count of Keywords', row=2, col=1)
                 
                 st.plotly_chart(fig2, use_container_width=True, key="ranking_distribution_chart")
                 
@@ -256,41 +249,27 @@ def render_results(results, domains, keywords):
         # Keyword performance chart
         if domains and keywords:
             # Prepare data for keyword performance chart
-            keyword_data = []
+            ranks_by_keyword = {}
             for keyword in keywords:
                 keyword_results = results.get(keyword, {})
-                for domain in domains:
-                    rank = keyword_results.get(domain, None)
-                    if rank is not None:
-                        keyword_data.append({
-                            'Keyword': keyword,
-                            'Domain': domain,
-                            'Rank': rank
-                        })
+                keyword_ranks = {domain: rank_of(keyword_results.get(domain)) for domain in domains}
+                if any(rank is not None for rank in keyword_ranks.values()):
+                    ranks_by_keyword[keyword] = keyword_ranks
             
-            if keyword_data:
-                keyword_df = pd.DataFrame(keyword_data)
-                
-                # Create a grouped bar chart
-                fig3 = px.bar(
-                    keyword_df,
-                    x='Keyword',
-                    y='Rank',
-                    color='Domain',
-                    barmode='group',
-                    title='Keyword Rankings by Domain',
-                    labels={'Rank': 'Ranking Position (Lower is Better)'}
-                )
+            if ranks_by_keyword:
+                # Create a grouped bar chart of the best ranked keywords
+                fig3, folded = keyword_rank_bars(ranks_by_keyword, domains, title='Keyword Rankings by Domain')
                 
                 # Invert y-axis so lower (better) positions appear higher
                 fig3.update_layout(
-                    yaxis={'autorange': 'reversed', 'title': 'Ranking Position'},
+                    yaxis={'autorange': 'reversed', 'title': 'Ranking Position (Lower is Better)'},
                     xaxis={'title': 'Keywords', 'tickangle': -45},
-                    legend={'title': 'Domains'},
-                    height=450
+                    legend={'title': 'Domains'}
                 )
                 
                 st.plotly_chart(fig3, use_container_width=True, key="keyword_performance_chart")
+                if folded:
+                    st.caption(f"Showing the {len(ranks_by_keyword) - folded} best ranked keywords, the other {folded} are averaged per domain in the last group.")
                 
                 st.markdown("""
                 💡 **Keyword Analysis:**
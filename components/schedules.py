@@ -0,0 +1,109 @@
+import streamlit as st
+
+from utils.app_cache import current_user
+from utils.scheduler import REFRESH_ADAPTIVE, REFRESH_ALL, CronSpec, ScheduleStore, next_run_time
+
+SCHEDULE_PRESETS = {
+    "@nightly": "Every night at 02:00",
+    "@daily": "Every day at midnight",
+    "@weekly": "Every Sunday at midnight",
+    "@hourly": "Every hour",
+}
+
+
+def render_schedule_manager():
+    """Render the sidebar panel for saving and managing scheduled sweeps"""
+    store = ScheduleStore()
+
+    st.sidebar.markdown("## Scheduled Sweeps")
+    st.sidebar.caption("Run `python -m utils.scheduler run` to execute saved projects on their schedule.")
+
+    # Save the current domains and keywords as a project
+    with st.sidebar.form("save_schedule_form", clear_on_submit=False):
+        st.markdown("**Save current setup**")
+        name = st.text_input("Project name")
+        preset = st.selectbox(
+            "Schedule",
+            options=list(SCHEDULE_PRESETS) + ["custom"],
+            format_func=lambda x: SCHEDULE_PRESETS.get(x, "Custom cron expression")
+        )
+        custom_schedule = st.text_input("Cron expression", placeholder="30 1 * * 1-5", help="minute hour day-of-month month day-of-week")
+        window_minutes = st.number_input(
+            "Spread requests over (minutes)",
+            min_value=0,
+            max_value=24 * 60,
+            value=60,
+            help="Requests are paced evenly over this window to stay under rate limits"
+        )
+        adaptive_refresh = st.checkbox(
+            "Skip stable keywords",
+            value=False,
+            help="Check keywords whose results rarely move less often, up to every two weeks, and volatile ones on every run"
+        )
+        credit_budget = st.number_input(
+            "Credit budget per run",
+            min_value=0,
+            value=0,
+            step=100,
+            help="0 for no limit. With skipped stable keywords, the most volatile due keywords are fetched first"
+        )
+        submitted = st.form_submit_button("Save Project")
+
+    if submitted:
+        schedule = custom_schedule.strip() if preset == "custom" else preset
+        if not name.strip():
+            st.sidebar.error("Please enter a project name")
+        elif not st.session_state.domains or not st.session_state.keywords:
+            st.sidebar.error("Run a position check first so the project has domains and keywords")
+        else:
+            try:
+                CronSpec(schedule)
+            except ValueError as e:
+                st.sidebar.error(str(e))
+            else:
+                store.save_project(
+                    name.strip(),
+                    st.session_state.domains,
+                    st.session_state.keywords,
+                    schedule,
+                    search_type=st.session_state.search_type,
+                    location=st.session_state.location,
+                    result_size=st.session_state.result_size,
+                    max_depth=st.session_state.max_depth,
+                    window_minutes=int(window_minutes),
+                    refresh=REFRESH_ADAPTIVE if adaptive_refresh else REFRESH_ALL,
+                    credit_budget=int(credit_budget) or None,
+                    user=current_user()
+                )
+                st.sidebar.success(f"Saved project '{name.strip()}'")
+
+    # Existing projects
+    projects = store.load()
+    if not projects:
+        st.sidebar.caption("No scheduled projects yet.")
+        return
+
+    for project_name, project in projects.items():
+        with st.sidebar.expander(project_name):
+            enabled = project.get('enabled', True)
+            st.caption(f"{len(project['domains'])} domains, {len(project['keywords'])} keywords, {project['location']}")
+            st.caption(f"Schedule: {SCHEDULE_PRESETS.get(project['schedule'], project['schedule'])}")
+            st.caption(f"Last run: {project.get('last_run') or 'never'}")
+            if project.get('user'):
+                st.caption(f"Charged to: {project['user']}")
+            if project.get('refresh') == REFRESH_ADAPTIVE:
+                st.caption("Refresh: stable keywords are skipped")
+            if project.get('credit_budget'):
+                st.caption(f"Credit budget: {project['credit_budget']:,} per run")
+            if enabled:
+                st.caption(f"Next run: {next_run_time(project):%Y-%m-%d %H:%M}")
+
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("Pause" if enabled else "Resume", key=f"toggle_{project_name}"):
+                    store.set_enabled(project_name, not enabled)
+                    st.rerun()
+            with col2:
+                if st.button("Delete", key=f"delete_{project_name}"):
+                    store.delete_project(project_name)
+                    st.rerun()
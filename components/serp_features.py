@@ -0,0 +1,69 @@
+import streamlit as st
+
+from utils.app_cache import cached_feature_search, cached_knowledge_graph_keywords, cached_top_features
+from utils.serp_features import FEATURE_TYPES
+
+
+def render_serp_features(keywords, location):
+    """
+    Render the SERP features explorer over the indexed keyword archive
+
+    Args:
+        keywords (list): Keywords of the current run
+        location (str): Location for search results
+    """
+    import pandas as pd
+
+    st.markdown("## SERP Features Explorer")
+    st.caption("Search People Also Ask questions, related searches, sitelinks and top stories across every indexed keyword.")
+
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        query = st.text_input("Search features", placeholder="e.g. price, how to", key="serp_feature_query")
+    with col2:
+        feature_types = st.multiselect(
+            "Feature types",
+            options=list(FEATURE_TYPES),
+            format_func=lambda x: FEATURE_TYPES[x],
+            key="serp_feature_types"
+        )
+
+    if query:
+        matches = cached_feature_search(query, feature_types=feature_types or None, location=location)
+        if matches:
+            matches_df = pd.DataFrame(matches)
+            matches_df['feature_type'] = matches_df['feature_type'].map(FEATURE_TYPES)
+            st.dataframe(
+                matches_df.rename(columns={
+                    'keyword': 'Keyword', 'location': 'Location', 'feature_type': 'Feature',
+                    'position': 'Position', 'text': 'Text', 'url': 'URL'
+                }),
+                use_container_width=True,
+                hide_index=True,
+                height=300
+            )
+        else:
+            st.info("No matching features found.")
+
+    # Deduplicated features shared by the current keywords
+    scope_all = st.checkbox("Include all indexed keywords", value=False, key="serp_feature_scope")
+    scope_keywords = None if scope_all else keywords
+    tabs = st.tabs(list(FEATURE_TYPES.values()))
+    for tab, feature_type in zip(tabs, FEATURE_TYPES):
+        with tab:
+            top = cached_top_features(feature_type, keywords=scope_keywords, location=location)
+            if top:
+                st.dataframe(
+                    pd.DataFrame(top).rename(columns={
+                        'text': 'Text', 'keyword_count': 'Keywords', 'keywords': 'Shown For'
+                    }),
+                    use_container_width=True,
+                    hide_index=True,
+                    height=300
+                )
+            else:
+                st.caption("No features of this type indexed yet.")
+
+    knowledge_graphs = cached_knowledge_graph_keywords(keywords=scope_keywords, location=location)
+    if knowledge_graphs:
+        st.caption(f"Knowledge graph shown for {len(knowledge_graphs)} keyword(s): " + ", ".join(list(knowledge_graphs)[:20]))
@@ -0,0 +1,91 @@
+import streamlit as st
+from datetime import date, timedelta
+
+from utils.app_cache import cached_trend
+
+TREND_RANGES = {
+    30: "Last 30 days",
+    90: "Last 90 days",
+    365: "Last year",
+}
+
+
+def render_trends(domains, keywords, location, search_type):
+    """
+    Render ranking trends over time from the stored history
+
+    Trend queries are cached across sessions and cleared after each run.
+
+    Args:
+        domains (list): List of domains
+        keywords (list): Keywords that can be shown individually
+        location (str): Location for search results
+        search_type (str): Type of search (search, images)
+    """
+    st.markdown("## Ranking Trends")
+
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        days = st.selectbox(
+            "Time Range",
+            options=list(TREND_RANGES),
+            format_func=lambda x: TREND_RANGES[x],
+            index=1,
+            key="trend_range"
+        )
+    with col2:
+        selected_keywords = st.multiselect(
+            "Keywords (leave empty for the average over all keywords)",
+            options=keywords,
+            max_selections=10,
+            key="trend_keywords"
+        )
+
+    end = date.today()
+    start = end - timedelta(days=days - 1)
+    trend = cached_trend(
+        domains,
+        location,
+        search_type,
+        start,
+        end,
+        keywords=selected_keywords or None
+    )
+
+    if not trend:
+        st.info("No history yet for these domains. Trends appear after runs on different days.")
+        return
+
+    # Charting libraries load only once there is something to plot
+    import pandas as pd
+    import plotly.express as px
+
+    trend_df = pd.DataFrame(trend)
+    trend_df['Series'] = trend_df['domain'] if not selected_keywords else trend_df['domain'] + " · " + trend_df['keyword']
+
+    fig = px.line(
+        trend_df.dropna(subset=['avg_rank']),
+        x='period',
+        y='avg_rank',
+        color='Series',
+        markers=True,
+        title='Average Ranking Position Over Time (Lower is Better)',
+        labels={'period': 'Date', 'avg_rank': 'Average Position', 'Series': 'Domain'},
+        hover_data={'best_rank': True, 'found': True, 'samples': True}
+    )
+    fig.update_layout(yaxis={'autorange': 'reversed'}, height=450)
+    st.plotly_chart(fig, use_container_width=True, key="rank_trend_chart")
+
+    if not selected_keywords:
+        # Share of keywords where each domain was found at all
+        trend_df['Coverage %'] = trend_df['found'] / trend_df['samples'] * 100
+        coverage_fig = px.line(
+            trend_df,
+            x='period',
+            y='Coverage %',
+            color='Series',
+            title='Keyword Coverage Over Time',
+            labels={'period': 'Date', 'Series': 'Domain'}
+        )
+        coverage_fig.update_layout(height=350)
+        st.plotly_chart(coverage_fig, use_container_width=True, key="coverage_trend_chart")
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from utils.dispatcher import BULK, INTERACTIVE, RequestDispatcher
+
+
+class WaiterSleepsTest(unittest.TestCase):
+    """Requests waiting for a slot sleep until a release instead of polling"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # A bucket that never runs dry, the bulk lane only waits on bulk_max_in_flight
+        self.dispatcher = RequestDispatcher(
+            max_in_flight=4,
+            interactive_reserved=1,
+            bulk_max_in_flight=1,
+            lane_rates={BULK: 1000},
+            rate_path=os.path.join(directory.name, "dispatch.sqlite3")
+        )
+        self.dispatches = 0
+        dispatch = self.dispatcher._dispatch
+
+        def counting_dispatch():
+            self.dispatches += 1
+            dispatch()
+
+        self.dispatcher._dispatch = counting_dispatch
+
+    def test_bulk_waiter_sleeps_until_release(self):
+        held = threading.Event()
+        release = threading.Event()
+        granted_at = []
+
+        def hold_slot():
+            with self.dispatcher.slot(BULK, "a"):
+                held.set()
+                release.wait()
+
+        def wait_for_slot():
+            with self.dispatcher.slot(BULK, "b"):
+                granted_at.append(time.monotonic())
+
+        # Daemon threads and a released holder, so a failing test does not hang
+        holder = threading.Thread(target=hold_slot, daemon=True)
+        self.addCleanup(release.set)
+        holder.start()
+        held.wait()
+        waiter = threading.Thread(target=wait_for_slot, daemon=True)
+        waiter.start()
+
+        time.sleep(0.5)
+        # Holder, waiter and maybe one wake-up, a spinning waiter calls it thousands of times
+        self.assertLess(self.dispatches, 10)
+        self.assertFalse(granted_at)
+        with self.dispatcher._cond:
+            self.assertIsNone(self.dispatcher._wait_timeout(None))
+
+        released_at = time.monotonic()
+        release.set()
+        holder.join()
+        waiter.join(timeout=5)
+        self.assertEqual(len(granted_at), 1)
+        self.assertLess(granted_at[0] - released_at, 1)
+
+    def test_interactive_waiter_sleeps_while_bulk_is_queued(self):
+        self.dispatcher.max_in_flight = 1
+        release = threading.Event()
+        held = threading.Event()
+
+        def hold_slot():
+            with self.dispatcher.slot(INTERACTIVE, "a"):
+                held.set()
+                release.wait()
+
+        holder = threading.Thread(target=hold_slot, daemon=True)
+        self.addCleanup(release.set)
+        holder.start()
+        held.wait()
+
+        def wait_for_slot(lane):
+            with self.dispatcher.slot(lane, "b"):
+                pass
+
+        waiters = [threading.Thread(target=wait_for_slot, args=(lane,), daemon=True) for lane in (BULK, INTERACTIVE)]
+        for waiter in waiters:
+            waiter.start()
+
+        time.sleep(0.5)
+        self.assertLess(self.dispatches, 10)
+
+        release.set()
+        holder.join()
+        for waiter in waiters:
+            waiter.join(timeout=5)
+            self.assertFalse(waiter.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,347 @@
+"""
+Rank alerts evaluated while a run fetches
+
+AlertEngine is called for every keyword result as it arrives (the
+tracker's result_callback) and compares it with the keyword's latest
+stored ranks, loaded once before the run with
+HistoryStore.get_latest_ranks. Stored ranks deeper than the run looks are
+ignored, a first-page run cannot tell whether rank 45 still holds. Each
+result costs a few dictionary lookups per domain, and sinks deliver from a
+background thread, so alerting does not slow bulk runs down.
+
+Rules:
+
+- rank_drop: a domain lost more than `threshold` positions
+- left_top: a domain fell out of the top `top` results
+- overtaken: a competitor now ranks above the primary domain
+
+A found rank is final as soon as it arrives, but a missing one may still
+be found on a deeper page, so rules that need a missing rank wait for the
+end of the run (close). Alerts are handed to file and webhook sinks in
+batches of ALERT_BATCH_SIZE rather than one request per alert, and close
+waits for the last batch to be delivered.
+
+Settings come from the alerts secrets section, see load_alert_config.
+"""
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+
+from utils.models import rank_of
+from utils.storage import get_data_path
+
+RANK_DROP = "rank_drop"
+LEFT_TOP = "left_top"
+OVERTAKEN = "overtaken"
+
+RULE_LABELS = {
+    RANK_DROP: "Rank drop",
+    LEFT_TOP: "Left the top results",
+    OVERTAKEN: "Overtaken by a competitor",
+}
+
+DEFAULT_RULES = [
+    {'type': RANK_DROP, 'threshold': 5},
+    {'type': LEFT_TOP, 'top': 10},
+    {'type': OVERTAKEN},
+]
+# Alerts buffered before they are handed to the sinks
+ALERT_BATCH_SIZE = 50
+# Seconds a webhook may take to accept a batch
+WEBHOOK_TIMEOUT = 5
+
+
+def load_alert_config():
+    """
+    The alerts secrets section
+
+    Returns:
+        dict: The section's settings, empty when it is missing
+    """
+    import streamlit as st
+
+    try:
+        return dict(st.secrets["alerts"])
+    except Exception:
+        # Secrets not available, e.g. outside Streamlit, the defaults apply
+        return {}
+
+
+def load_rules(config):
+    """
+    Alert rules from the alerts secrets section
+
+    Args:
+        config (dict): May set rank_drop (positions, 0 disables), top (0
+            disables) and overtaken (bool)
+
+    Returns:
+        list: Rule dicts in the form of DEFAULT_RULES
+    """
+    rules = []
+    rank_drop = config.get('rank_drop', DEFAULT_RULES[0]['threshold'])
+    if rank_drop:
+        rules.append({'type': RANK_DROP, 'threshold': int(rank_drop)})
+    top = config.get('top', DEFAULT_RULES[1]['top'])
+    if top:
+        rules.append({'type': LEFT_TOP, 'top': int(top)})
+    if config.get('overtaken', True):
+        rules.append({'type': OVERTAKEN})
+    return rules
+
+
+class FileSink:
+    """Append alerts as JSON lines to a local file"""
+
+    def __init__(self, path=None):
+        self.path = path or get_data_path("alerts.jsonl")
+
+    def deliver(self, alerts):
+        with open(self.path, 'a', encoding='utf-8') as file:
+            for alert in alerts:
+                file.write(json.dumps(alert, ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    """POST batches of alerts as JSON to a webhook, e.g. a local chat relay"""
+
+    def __init__(self, url, timeout=WEBHOOK_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def deliver(self, alerts):
+        # requests is only needed once a webhook receives alerts
+        import requests
+
+        response = requests.post(self.url, json={'alerts': alerts}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+def load_sinks(config):
+    """
+    Sinks from the alerts secrets section
+
+    Args:
+        config (dict): May set file (path, relative paths are in the data
+            directory, "" disables) and webhook_url
+
+    Returns:
+        list: FileSink and WebhookSink instances
+    """
+    sinks = []
+    file_name = config.get('file', "alerts.jsonl")
+    if file_name:
+        sinks.append(FileSink(file_name if os.path.isabs(file_name) else get_data_path(file_name)))
+    if config.get('webhook_url'):
+        sinks.append(WebhookSink(config['webhook_url']))
+    return sinks
+
+
+class AlertEngine:
+    """
+    Incremental evaluation of alert rules over one run's results
+
+    Usage: create it before the run, pass evaluate as (or inside) the
+    tracker's result_callback and call close once the run has finished.
+    """
+
+    def __init__(self, domains, previous_ranks, rules=None, sinks=None, primary_domain=None, location=None, search_type=None, depth=None):
+        """
+        Args:
+            domains (list): Tracked domains
+            previous_ranks (dict): Keyword -> domain -> rank, from HistoryStore.get_latest_ranks
+            rules (list): Rule dicts, defaults to DEFAULT_RULES
+            sinks (list): Objects with a deliver(alerts) method
+            primary_domain (str): Domain whose competitors are watched, defaults to the first domain
+            location (str): Location of the run, added to every alert
+            search_type (str): Search vertical of the run, added to every alert
+            depth (int): Deepest rank the run looks for (max_depth, or the result
+                size for first-page runs), deeper previous ranks are ignored
+        """
+        self.domains = list(domains)
+        if depth:
+            # A rank the run cannot see is unknown rather than lost
+            previous_ranks = {
+                keyword: {domain: rank for domain, rank in ranks.items() if rank is None or rank <= depth}
+                for keyword, ranks in previous_ranks.items()
+            }
+        self.previous_ranks = previous_ranks
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.sinks = sinks or []
+        self.primary_domain = primary_domain or (self.domains[0] if self.domains else None)
+        self.location = location
+        self.search_type = search_type
+        self.alerts = []
+        self.delivery_errors = []
+        self._fired = set()
+        # Keyword -> latest keyword_results of keywords waiting on a missing rank
+        self._pending = {}
+        self._buffer = []
+        # Batches waiting for the sender thread, started with the first batch
+        self._outbox = queue.Queue()
+        self._sender = None
+
+    def evaluate(self, keyword, keyword_results):
+        """
+        Check the rules for one keyword's results as they arrive
+
+        May be called again for the same keyword as deeper pages fill in
+        ranks, every alert fires once.
+
+        Args:
+            keyword (str): The keyword
+            keyword_results (dict): Domain -> RankHit or None
+        """
+        previous = self.previous_ranks.get(keyword)
+        if not previous:
+            return
+        if self._check(keyword, previous, keyword_results, final=False):
+            self._pending[keyword] = keyword_results
+        else:
+            self._pending.pop(keyword, None)
+        if len(self._buffer) >= ALERT_BATCH_SIZE:
+            self.flush()
+
+    def close(self, errors=None):
+        """
+        Settle the rules that waited on missing ranks and deliver everything left
+
+        Args:
+            errors (dict): Keyword -> error of the run, failed keywords are not
+                reported as lost
+
+        Returns:
+            list: Every alert of the run
+        """
+        errors = errors or {}
+        for keyword, keyword_results in self._pending.items():
+            if keyword not in errors:
+                self._check(keyword, self.previous_ranks[keyword], keyword_results, final=True)
+        self._pending = {}
+        self.flush()
+        if self._sender is not None:
+            self._outbox.put(None)
+            self._sender.join()
+            self._sender = None
+        return self.alerts
+
+    def abort(self):
+        """
+        Finish after a failed run
+
+        Alerts already raised are delivered, rules waiting on missing ranks
+        are dropped since the run may never have fetched those keywords.
+
+        Returns:
+            list: Every alert raised before the failure
+        """
+        self._pending = {}
+        return self.close()
+
+    def flush(self):
+        """Queue the buffered alerts for delivery without waiting for the sinks"""
+        if not self._buffer or not self.sinks:
+            self._buffer = []
+            return
+        batch, self._buffer = self._buffer, []
+        if self._sender is None:
+            self._sender = threading.Thread(target=self._deliver_batches, name="alert-sinks", daemon=True)
+            self._sender.start()
+        self._outbox.put(batch)
+
+    def _deliver_batches(self):
+        """Sender thread: hand queued batches to every sink, recording failures instead of raising"""
+        while True:
+            batch = self._outbox.get()
+            if batch is None:
+                return
+            for sink in self.sinks:
+                try:
+                    sink.deliver(batch)
+                except Exception as e:
+                    self.delivery_errors.append(f"{type(sink).__name__}: {e}")
+
+    def _check(self, keyword, previous, keyword_results, final):
+        """
+        Evaluate every rule for one keyword
+
+        Returns:
+            bool: Whether a rule still waits on a missing rank
+        """
+        waiting = False
+        ranks = {domain: rank_of(keyword_results.get(domain)) for domain in self.domains}
+        for index, rule in enumerate(self.rules):
+            if rule['type'] == OVERTAKEN:
+                waiting |= self._check_overtaken(index, keyword, previous, ranks, final)
+                continue
+            for domain in self.domains:
+                before, now = previous.get(domain), ranks[domain]
+                if before is None:
+                    continue
+                if now is None and not final:
+                    waiting = True
+                    continue
+                if rule['type'] == RANK_DROP:
+                    dropped = (now if now is not None else float('inf')) - before > rule['threshold']
+                    if dropped:
+                        self._fire(index, rule, keyword, domain, before, now)
+                elif rule['type'] == LEFT_TOP:
+                    if before <= rule['top'] and (now is None or now > rule['top']):
+                        self._fire(index, rule, keyword, domain, before, now)
+        return waiting
+
+    def _check_overtaken(self, index, keyword, previous, ranks, final):
+        """Fire for competitors now ranking above the primary domain, True if waiting on a missing rank"""
+        primary = self.primary_domain
+        if primary is None:
+            return False
+        primary_before, primary_now = previous.get(primary), ranks.get(primary)
+        waiting = False
+        for competitor in self.domains:
+            if competitor == primary:
+                continue
+            competitor_now = ranks[competitor]
+            if competitor_now is None:
+                # A competitor still missing cannot have overtaken
+                continue
+            if primary_now is None and not final:
+                waiting = True
+                continue
+            competitor_before = previous.get(competitor)
+            was_behind = primary_before is not None and (competitor_before is None or competitor_before > primary_before)
+            is_ahead = primary_now is None or competitor_now < primary_now
+            if was_behind and is_ahead:
+                self._fire(index, self.rules[index], keyword, primary, primary_before, primary_now, competitor, competitor_now)
+        return waiting
+
+    def _fire(self, index, rule, keyword, domain, previous_rank, rank, competitor=None, competitor_rank=None):
+        """Record an alert unless the same rule already fired for it"""
+        key = (index, keyword, domain, competitor)
+        if key in self._fired:
+            return
+        self._fired.add(key)
+
+        position = f"#{rank}" if rank is not None else "not found"
+        if rule['type'] == OVERTAKEN:
+            message = f"{competitor} (#{competitor_rank}) now ranks above {domain} ({position}, was #{previous_rank}) for '{keyword}'"
+        elif rule['type'] == LEFT_TOP:
+            message = f"{domain} left the top {rule['top']} for '{keyword}': #{previous_rank} to {position}"
+        else:
+            message = f"{domain} moved from #{previous_rank} to {position} for '{keyword}'"
+        alert = {
+            'rule': rule['type'],
+            'keyword': keyword,
+            'domain': domain,
+            'previous_rank': previous_rank,
+            'rank': rank,
+            'competitor': competitor,
+            'competitor_rank': competitor_rank,
+            'message': message,
+            'location': self.location,
+            'search_type': self.search_type,
+            'detected_at': datetime.now().isoformat(timespec="seconds"),
+        }
+        self.alerts.append(alert)
+        self._buffer.append(alert)
@@ -1,66 +1,242 @@
 import requests
 import streamlit as st
 import json
-import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.dispatcher import INTERACTIVE
+from utils.key_pool import KeyPool, KeyPoolExhausted, parse_retry_after
+from utils.serp_parser import parse_serp
+
+# Serper accepts up to 100 query objects in a single batched POST
+MAX_BATCH_SIZE = 100
+
+# Search verticals: endpoint, result list, fields holding the result's site
+# and the field with a direct image URL
+VERTICALS = {
+    'search': {'label': "Organic Search", 'endpoint': "search", 'results': "organic", 'link_fields': ('link',)},
+    'images': {'label': "Image Search", 'endpoint': "images", 'results': "images", 'link_fields': ('link', 'domain'), 'image_field': "imageUrl"},
+    'news': {'label': "News", 'endpoint': "news", 'results': "news", 'link_fields': ('link',)},
+    'videos': {'label': "Videos", 'endpoint': "videos", 'results': "videos", 'link_fields': ('link',)},
+    'places': {'label': "Places", 'endpoint': "places", 'results': "places", 'link_fields': ('website',)},
+}
+
+# Responses are reused for identical queries within this many seconds
+RESPONSE_CACHE_TTL = 15 * 60
+RESPONSE_CACHE_SIZE = 5000
+
+# Connection pool and retry policy shared by all requests of an instance.
+# Rate limits (429) are handled by switching to another key instead.
+POOL_SIZE = 10
+MAX_RETRIES = 3
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Longest wait for a rate limited key when no other key is usable
+MAX_KEY_WAIT = 60
+# Attempts per request before giving up on rejected keys, times the number of keys
+KEY_ATTEMPTS_PER_KEY = 2
+
+def credits_for_request(result_size):
+    """
+    Estimate the Serper credits charged for one query
+    
+    Serper bills one credit for up to 10 results and two credits for
+    larger result pages.
+    
+    Args:
+        result_size (int): Number of results requested (num)
+        
+    Returns:
+        int: Credits charged for the query
+    """
+    return 1 if result_size <= 10 else 2
+
+def get_vertical(search_type):
+    """
+    Return the settings of a search vertical
+    
+    Args:
+        search_type (str): One of VERTICALS (search, images, news, videos, places)
+        
+    Returns:
+        dict: The vertical's endpoint, result list and link fields
+    """
+    if search_type not in VERTICALS:
+        raise ValueError(f"Unsupported search type: {search_type}")
+    return VERTICALS[search_type]
+
+class ResponseCache:
+    """
+    Parsed responses of recent queries, least recently used evicted first
+    
+    Keys are the endpoint plus the canonical query object, so the same
+    keyword fetched with another page, size or location is a different
+    entry. Shared between SerperAPI instances, which are recreated on every
+    Streamlit rerun.
+    """
+    
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    @staticmethod
+    def key(endpoint, payload):
+        """Cache key of a single query object"""
+        return endpoint + " " + json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    
+    def get(self, key):
+        """Return a cached response, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def contains(self, key):
+        """Whether a fresh response is cached, without counting a lookup"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.monotonic() - entry[0] <= self.ttl
+    
+    def put(self, key, value):
+        """Store a response, evicting the least recently used beyond max_entries"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._entries.clear()
+
+# Process-wide response cache used by default
+RESPONSE_CACHE = ResponseCache()
+
+def load_key_configs():
+    """
+    Read the API key settings from Streamlit secrets and the environment
+    
+    Returns:
+        list: Key settings, see KeyPool.read_config
+    """
+    try:
+        config = dict(st.secrets["api_keys"])
+    except Exception:
+        # Secrets not available, e.g. outside Streamlit
+        config = {}
+    return KeyPool.read_config(config)
+
+def load_key_pool(ledger=None):
+    """
+    Build the API key pool from Streamlit secrets and the environment
+    
+    Args:
+        ledger (CreditLedger): Where key spend is recorded, defaults to the local ledger
+        
+    Returns:
+        KeyPool: Every configured key with its recorded spend, possibly empty
+    """
+    if ledger is None:
+        # Imported here, the ledger is only needed once a pool is loaded
+        from utils.credit_ledger import CreditLedger
+        ledger = CreditLedger()
+    pool = KeyPool(load_key_configs(), ledger)
+    pool.refresh_spend()
+    return pool
 
 class SerperAPI:
     """Service for interacting with the Serper.dev API"""
     
-    def __init__(self, api_key=None):
-        # Try to get API key from Streamlit secrets, then fallback to parameter
-        try:
-            self.api_key = api_key or st.secrets["api_keys"]["serper"]
-        except:
-            # Fallback to environment variable if secrets not available
-            self.api_key = api_key or os.getenv("SERPER_API_KEY")
+    def __init__(self, api_key=None, cache=RESPONSE_CACHE, max_retries=MAX_RETRIES, key_pool=None):
+        # A given key or pool wins, otherwise keys come from secrets and the environment
+        if key_pool is not None:
+            self.key_pool = key_pool
+        elif api_key:
+            self.key_pool = KeyPool([api_key])
+        else:
+            self.key_pool = load_key_pool()
         self.base_url = "https://google.serper.dev"
+        # Running totals of what this instance has requested and downloaded
+        self.usage = {'requests': 0, 'queries': 0, 'bytes': 0, 'credits': 0, 'cache_hits': 0}
+        # Minimum seconds between requests, used to spread scheduled runs
+        self.min_request_interval = 0
+        self._last_request_at = 0
+        # Shared RequestDispatcher giving sessions fair turns, None sends right away
+        self.dispatcher = None
+        self.lane = INTERACTIVE
+        self.tenant = None
+        # Called with the queue position while a request waits for the dispatcher
+        self.queue_callback = None
+        # Responses of identical queries are reused, None disables caching
+        self.cache = cache
+        # Keep-alive connections, retrying server errors with backoff
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["POST"]),
+            raise_on_status=False
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=POOL_SIZE, max_retries=retry))
+    
+    @property
+    def api_key(self):
+        """The first configured API key, None if there is none"""
+        return self.key_pool.keys[0].key if self.key_pool else None
     
     def set_api_key(self, api_key):
-        """Update the API key"""
-        self.api_key = api_key
+        """Replace the key pool with a single API key"""
+        self.key_pool = KeyPool([api_key])
     
-    def get_search_results(self, query, search_type="search", location="United States", language="en", country_code="us", result_size=10):
+    def get_search_results(self, query, search_type="search", location="United States", language="en", country_code="us", result_size=10, page=1):
         """
         Get search results from Serper.dev API
         
         Args:
             query (str): The search query
-            search_type (str): Type of search (search, images, news, etc.)
+            search_type (str): Search vertical (search, images, news, videos, places)
             location (str): Location for search results
             language (str): Language code (en, tr, etc.)
             country_code (str): Country code (us, tr, etc.)
             result_size (int): Number of results to return (10, 20, 50 or 100)
+            page (int): Result page to fetch, starting at 1
             
         Returns:
             dict: The search results
         """
-        if not self.api_key:
+        if not self.key_pool:
             raise ValueError("API key is required")
         
-        headers = {
-            "X-API-KEY": self.api_key,
-            "Content-Type": "application/json"
-        }
-        
-        # Use different endpoint and payload structure for image search
-        if search_type == "images":
-            return self.get_image_search_results(query, location, language, country_code, result_size)
-        
-        payload = {
-            "q": query,
-            "gl": country_code,
-            "hl": language,
-            "type": search_type,
-            "location": location,
-            "num": result_size  # Add the number of results to return
-        }
+        endpoint = self._get_endpoint(search_type)
+        payload = self._build_payload(query, location, language, country_code, result_size, page)
         
-        endpoint = f"{self.base_url}/search"
+        cached = self._cached(endpoint, payload)
+        if cached is not None:
+            return cached
         
         try:
-            response = requests.post(endpoint, headers=headers, json=payload)
-            response.raise_for_status()  # Raise exception for HTTP errors
-            return response.json()
+            result = self._post(endpoint, payload)
         except requests.exceptions.RequestException as e:
             st.error(f"API Error: {str(e)}")
             if hasattr(e, 'response') and e.response:
@@ -71,29 +247,123 @@ class SerperAPI:
                     st.error(f"Status code: {e.response.status_code}")
                     st.error(f"Response text: {e.response.text}")
             raise e
+        
+        self._store(endpoint, payload, result)
+        return result
+    
+    def is_cached(self, query, search_type="search", location="United States", language="en", country_code="us", result_size=10, page=1):
+        """
+        Check whether a query would be answered from the response cache
+        
+        Returns:
+            bool: True if a fresh response is cached and no credits would be used
+        """
+        if self.cache is None:
+            return False
+        payload = self._build_payload(query, location, language, country_code, result_size, page)
+        return self.cache.contains(ResponseCache.key(self._get_endpoint(search_type), payload))
     
-    def get_image_search_results(self, query, location="United States", language="en", country_code="us", result_size=10):
+    def get_image_search_results(self, query, location="United States", language="en", country_code="us", result_size=10, page=1):
         """
         Get image search results from Serper.dev API
         
+        Same as get_search_results with search_type "images".
+        
+        Returns:
+            dict: The image search results
+        """
+        return self.get_search_results(query, "images", location, language, country_code, result_size, page)
+
+    def get_batch_search_results(self, queries, search_type="search", location="United States", language="en", country_code="us", result_size=10, batch_size=MAX_BATCH_SIZE, progress_callback=None, page=1):
+        """
+        Get search results for many queries using Serper's batch endpoint
+        
+        Queries are packed into arrays of up to batch_size query objects and
+        sent in one POST each. The array response is split back into
+        per-query results. If a whole batch fails, or an individual item in
+        the response is an error, those queries are retried one by one so a
+        single bad query does not lose the rest of the batch. Queries with a
+        cached response are not sent at all.
+        
         Args:
-            query (str): The search query
+            queries (list): The search queries
+            search_type (str): Search vertical (search, images, news, videos, places)
             location (str): Location for search results
             language (str): Language code (en, tr, etc.)
             country_code (str): Country code (us, tr, etc.)
             result_size (int): Number of results to return (10, 20, 50 or 100)
+            batch_size (int): Number of queries to send per HTTP request
+            progress_callback (callable): Called with the number of processed queries after each batch
+            page (int): Result page to fetch for every query, starting at 1
             
         Returns:
-            dict: The image search results
+            tuple: (results, errors) where results maps query -> search results
+                and errors maps query -> error message for queries that failed
         """
-        if not self.api_key:
+        if not self.key_pool:
             raise ValueError("API key is required")
         
-        headers = {
-            "X-API-KEY": self.api_key,
-            "Content-Type": "application/json"
-        }
+        batch_size = max(1, min(int(batch_size), MAX_BATCH_SIZE))
+        endpoint = self._get_endpoint(search_type)
         
+        # Duplicate queries only need to be fetched once
+        unique_queries = list(dict.fromkeys(queries))
+        
+        results = {}
+        errors = {}
+        
+        for start in range(0, len(unique_queries), batch_size):
+            batch = []
+            payload = []
+            for query in unique_queries[start:start + batch_size]:
+                query_payload = self._build_payload(query, location, language, country_code, result_size, page)
+                cached = self._cached(endpoint, query_payload)
+                if cached is not None:
+                    results[query] = cached
+                else:
+                    batch.append(query)
+                    payload.append(query_payload)
+            
+            response_items = []
+            if payload:
+                try:
+                    response_items = self._post(endpoint, payload)
+                except requests.exceptions.RequestException:
+                    # The whole batch failed, fall back to one request per query
+                    response_items = []
+            
+            # A single-object batch may come back as a plain object
+            if isinstance(response_items, dict):
+                response_items = [response_items]
+            
+            for index, query in enumerate(batch):
+                item = response_items[index] if index < len(response_items) else None
+                
+                if not self._is_valid_result(item):
+                    # Missing or failed item, retry this query on its own
+                    try:
+                        item = self._post(endpoint, payload[index])
+                    except requests.exceptions.RequestException as e:
+                        errors[query] = str(e)
+                        continue
+                
+                if self._is_valid_result(item):
+                    results[query] = item
+                    self._store(endpoint, payload[index], item)
+                else:
+                    errors[query] = item.get('message', 'Invalid response') if isinstance(item, dict) else 'Invalid response'
+            
+            if progress_callback:
+                progress_callback(min(start + batch_size, len(unique_queries)))
+        
+        return results, errors
+    
+    def _get_endpoint(self, search_type):
+        """Return the endpoint URL for the given search type"""
+        return f"{self.base_url}/{get_vertical(search_type)['endpoint']}"
+    
+    def _build_payload(self, query, location, language, country_code, result_size, page=1):
+        """Build the query object sent to the Serper API"""
         payload = {
             "q": query,
             "gl": country_code,
@@ -101,21 +371,107 @@ class SerperAPI:
             "location": location,
             "num": result_size
         }
+        if page > 1:
+            payload["page"] = page
+        return payload
+    
+    def _cached(self, endpoint, payload):
+        """Return the cached response of a query object, counting the hit"""
+        if self.cache is None:
+            return None
+        result = self.cache.get(ResponseCache.key(endpoint, payload))
+        if result is not None:
+            self.usage['cache_hits'] += 1
+        return result
+    
+    def _store(self, endpoint, payload, result):
+        """Cache a valid response of a query object"""
+        if self.cache is not None and self._is_valid_result(result):
+            self.cache.put(ResponseCache.key(endpoint, payload), result)
+    
+    def _post(self, endpoint, payload):
+        """
+        POST a query object (or an array of them) and return the decoded response
         
-        # Images need a specific endpoint
-        endpoint = f"{self.base_url}/images"
+        Each attempt uses the next key of the pool. Keys rejected with 401,
+        403 or 429 are quarantined and the request moves on to another key,
+        up to KEY_ATTEMPTS_PER_KEY attempts per key of the pool.
         
-        try:
-            response = requests.post(endpoint, headers=headers, json=payload)
-            response.raise_for_status()  # Raise exception for HTTP errors
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            st.error(f"API Error: {str(e)}")
-            if hasattr(e, 'response') and e.response:
-                try:
-                    error_details = e.response.json()
-                    st.error(f"Error details: {json.dumps(error_details, indent=2)}")
-                except:
-                    st.error(f"Status code: {e.response.status_code}")
-                    st.error(f"Response text: {e.response.text}")
-            raise e
+        Raises:
+            KeyPoolExhausted: If every attempt was rejected or no key is usable
+        """
+        payloads = payload if isinstance(payload, list) else [payload]
+        credits = sum(credits_for_request(p.get('num', 10)) for p in payloads)
+        
+        # Keys that keep answering 429 with a short Retry-After would otherwise be retried forever
+        attempts = KEY_ATTEMPTS_PER_KEY * max(1, len(self.key_pool))
+        while True:
+            attempts -= 1
+            key = self._acquire_key()
+            headers = {
+                "X-API-KEY": key.key,
+                "Content-Type": "application/json"
+            }
+            self._wait_for_slot()
+            try:
+                with self._dispatch_slot(credits):
+                    response = self.session.post(endpoint, headers=headers, json=payload)
+                response.raise_for_status()  # Raise exception for HTTP errors
+            except requests.exceptions.HTTPError as e:
+                status_code = e.response.status_code if e.response is not None else None
+                if self.key_pool.record_failure(key, status_code, parse_retry_after(e.response)):
+                    if attempts > 0:
+                        continue
+                    raise KeyPoolExhausted(f"API keys rejected {KEY_ATTEMPTS_PER_KEY * max(1, len(self.key_pool))} attempts, last with HTTP {status_code}") from e
+                raise
+            except requests.exceptions.RequestException:
+                self.key_pool.record_failure(key, None)
+                raise
+            
+            self.key_pool.record_success(key, credits, len(response.content))
+            self._record_usage(response, payloads)
+            try:
+                return parse_serp(response.content)
+            except ValueError as e:
+                # Decode errors are ValueErrors, callers handle failed queries as RequestException
+                raise requests.exceptions.InvalidJSONError(f"Invalid JSON in response: {e}", response=response) from e
+    
+    def _acquire_key(self):
+        """Pick a key from the pool, waiting briefly if all keys are rate limited"""
+        while True:
+            try:
+                return self.key_pool.acquire()
+            except KeyPoolExhausted as e:
+                wait = e.retry_at - time.monotonic() if e.retry_at is not None else None
+                if wait is None or wait > MAX_KEY_WAIT:
+                    raise
+                time.sleep(max(wait, 0))
+    
+    def _wait_for_slot(self):
+        """Sleep until min_request_interval has passed since the previous request"""
+        if self.min_request_interval > 0:
+            wait = self._last_request_at + self.min_request_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        self._last_request_at = time.monotonic()
+    
+    def _dispatch_slot(self, credits):
+        """Wait for this session's turn at the shared dispatcher, if there is one"""
+        if self.dispatcher is None:
+            return nullcontext()
+        return self.dispatcher.slot(self.lane, self.tenant, credits, self.queue_callback)
+    
+    def _record_usage(self, response, payloads):
+        """Add a successful response to the running usage totals"""
+        self.usage['requests'] += 1
+        self.usage['queries'] += len(payloads)
+        self.usage['bytes'] += len(response.content)
+        self.usage['credits'] += sum(credits_for_request(p.get('num', 10)) for p in payloads)
+    
+    @staticmethod
+    def _is_valid_result(item):
+        """Check whether a batch response item is a search result rather than an error"""
+        if not isinstance(item, dict):
+            return False
+        # Error items carry a message/statusCode instead of search parameters
+        return 'searchParameters' in item or not ('message' in item or 'statusCode' in item or 'error' in item)
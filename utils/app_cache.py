@@ -0,0 +1,340 @@
+"""
+Caches shared by every session of the Streamlit app
+
+Services are built once per process with st.cache_resource instead of on
+every script rerun. Query results derived from the stores and export files
+are cached with st.cache_data under explicit TTLs, so concurrent users
+reuse each other's work. Search responses are shared through the API
+response cache.
+"""
+import hashlib
+import io
+
+import streamlit as st
+
+from utils.alerts import load_alert_config, load_rules, load_sinks
+from utils.api_service import RESPONSE_CACHE, SerperAPI, load_key_configs
+from utils.competitor_discovery import DEFAULT_SUGGESTIONS, CompetitorDiscovery
+from utils.cost_estimator import load_budgets
+from utils.credit_ledger import CreditLedger
+from utils.data_service import DataService
+from utils.dispatcher import RequestDispatcher, load_fair_share_config
+from utils.history_store import HistoryStore
+from utils.keyword_clusters import DEFAULT_THRESHOLD, cluster_keywords, url_sets_from_archive
+from utils.serp_features import SerpFeatureStore
+from utils.session_memory import SessionMemory, SessionRegistry, SpillStore
+
+# Seconds before API keys are read from secrets again
+SECRETS_TTL = 60 * 60
+# Seconds cached history and SERP feature queries stay valid, runs clear them early
+QUERY_CACHE_TTL = 5 * 60
+# Seconds generated export files are kept
+EXPORT_CACHE_TTL = 30 * 60
+
+
+@st.cache_resource(ttl=SECRETS_TTL, show_spinner=False)
+def get_key_configs():
+    """API key settings from secrets and the environment, read again after SECRETS_TTL"""
+    return load_key_configs()
+
+
+@st.cache_resource(show_spinner=False)
+def _shared_key_pool():
+    """The one KeyPool of the process, recording key spend in the credit ledger"""
+    # Imported here, KeyPool is only used through SerperAPI elsewhere
+    from utils.key_pool import KeyPool
+
+    return KeyPool(ledger=get_ledger())
+
+
+def get_key_pool():
+    """
+    Process-wide API key pool from secrets and the environment
+
+    Shared by all sessions so key usage and quarantines are tracked once.
+    The pool lives for the whole process and only its settings follow the
+    secrets, while spend comes back from the ledger, so neither the
+    secrets TTL nor clearing caches resets credit limits.
+    """
+    pool = _shared_key_pool()
+    pool.sync(get_key_configs())
+    return pool
+
+
+@st.cache_resource(ttl=SECRETS_TTL, show_spinner=False)
+def get_dispatcher():
+    """
+    Process-wide RequestDispatcher giving every session a fair share of requests
+
+    Tenant weights, slot counts and the bulk rate come from the fair_share
+    secrets section.
+    """
+    return RequestDispatcher.from_config(load_fair_share_config())
+
+
+@st.cache_resource(ttl=SECRETS_TTL, show_spinner=False)
+def get_alert_settings():
+    """
+    Alert rules and sinks from the alerts secrets section
+
+    Returns:
+        dict: enabled, rules and sinks (FileSink and WebhookSink instances)
+    """
+    config = load_alert_config()
+    return {
+        'enabled': bool(config.get('enabled', True)),
+        'rules': load_rules(config),
+        'sinks': load_sinks(config),
+    }
+
+
+@st.cache_resource(show_spinner=False)
+def get_spill_store():
+    """Process-wide SpillStore for session payloads, pruned of stale files on creation"""
+    store = SpillStore()
+    store.prune()
+    return store
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_registry():
+    """Process-wide SessionRegistry collecting the memory usage of every session"""
+    return SessionRegistry()
+
+
+def get_session_memory(user):
+    """
+    The current session's SessionMemory
+
+    Args:
+        user (str): The current user, shown in the session report
+
+    Returns:
+        SessionMemory: Bounded store of the session's run payloads
+    """
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return SessionMemory(
+        st.session_state,
+        get_spill_store(),
+        registry=get_session_registry(),
+        session_id=ctx.session_id if ctx else "local",
+        user=user
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_data_service():
+    """Process-wide DataService"""
+    return DataService()
+
+
+@st.cache_resource(show_spinner=False)
+def get_history_store():
+    """Process-wide HistoryStore, opening a connection per query"""
+    return HistoryStore()
+
+
+@st.cache_resource(show_spinner=False)
+def get_feature_store():
+    """Process-wide SerpFeatureStore, opening a connection per query"""
+    return SerpFeatureStore()
+
+
+@st.cache_resource(show_spinner=False)
+def get_ledger():
+    """Process-wide CreditLedger, opening a connection per query"""
+    return CreditLedger()
+
+
+@st.cache_resource(ttl=SECRETS_TTL, show_spinner=False)
+def get_budgets():
+    """Credit budgets from secrets (load_budgets), read again after SECRETS_TTL"""
+    return load_budgets()
+
+
+def current_user():
+    """
+    Name the credit ledger records the current session's runs under
+
+    Returns:
+        str: The signed-in user's email or name, "local" without authentication
+    """
+    try:
+        return st.user.get('email') or st.user.get('name') or "local"
+    except Exception:
+        # Streamlit versions without st.user
+        return "local"
+
+
+def get_api_service():
+    """
+    Return the SerperAPI of the current session
+
+    Each session keeps its own instance, so usage counters and request
+    pacing are not mixed between users, while responses are shared through
+    the process-wide response cache and requests take turns at the shared
+    dispatcher.
+
+    Returns:
+        SerperAPI: The session's API client
+    """
+    key_pool = get_key_pool()
+    api_service = st.session_state.get('api_service')
+    if api_service is None or api_service.key_pool is not key_pool:
+        api_service = SerperAPI(key_pool=key_pool)
+        st.session_state.api_service = api_service
+    api_service.dispatcher = get_dispatcher()
+    api_service.tenant = current_user()
+    return api_service
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, show_spinner=False)
+def cached_trend(domains, location, search_type, start, end, keywords=None):
+    """HistoryStore.get_trend cached across sessions"""
+    return get_history_store().get_trend(domains, location, search_type, start, end, keywords=keywords)
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, show_spinner=False)
+def cached_url_changes(domains, location, search_type, start=None):
+    """HistoryStore.get_url_changes cached across sessions"""
+    return get_history_store().get_url_changes(domains, location, search_type, start)
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, show_spinner=False)
+def cached_feature_search(query, feature_types=None, location=None):
+    """SerpFeatureStore.search cached across sessions"""
+    return get_feature_store().search(query, feature_types=feature_types, location=location)
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, show_spinner=False)
+def cached_top_features(feature_type, keywords=None, location=None):
+    """SerpFeatureStore.top_features cached across sessions"""
+    return get_feature_store().top_features(feature_type, keywords=keywords, location=location)
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, show_spinner=False)
+def cached_knowledge_graph_keywords(keywords=None, location=None):
+    """SerpFeatureStore.knowledge_graph_keywords cached across sessions"""
+    return get_feature_store().knowledge_graph_keywords(keywords=keywords, location=location)
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, show_spinner=False)
+def cached_competitors(domains, keywords=None, location=None, n=DEFAULT_SUGGESTIONS):
+    """Competitor suggestions over the archived organic results, cached across sessions"""
+    discovery = CompetitorDiscovery(domains)
+    discovery.add_archive(get_feature_store().iter_organic(keywords=keywords, location=location))
+    return {'keywords': discovery.keywords, 'suggestions': discovery.suggestions(n)}
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, show_spinner=False)
+def cached_keyword_clusters(keywords, location=None, threshold=DEFAULT_THRESHOLD):
+    """Keyword clusters by shared URLs of the archived organic results, cached across sessions"""
+    url_sets = url_sets_from_archive(get_feature_store().iter_organic(keywords=keywords, location=location))
+    return cluster_keywords(url_sets, threshold)
+
+
+def frame_digest(df):
+    """
+    Digest of every cell, column name and dtype of a DataFrame
+
+    Keys the export caches. st.cache_data hashes only a sample of the rows
+    of large frames, so two result tables could share a cached export.
+
+    Args:
+        df (pandas.DataFrame): The table to export
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    # pandas is already loaded once there is a table to export
+    import pandas as pd
+
+    digest = hashlib.sha256(repr((list(df.columns), [str(dtype) for dtype in df.dtypes])).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+@st.cache_data(ttl=EXPORT_CACHE_TTL, show_spinner=False, max_entries=100)
+def _excel_export(_df, sheet_name, digest):
+    """XLSX file of a DataFrame, cached by its digest, the frame itself is not hashed"""
+    # pandas loads openpyxl here, only when an export is requested
+    import pandas as pd
+    
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        _df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return output.getvalue()
+
+
+@st.cache_data(ttl=EXPORT_CACHE_TTL, show_spinner=False, max_entries=100)
+def _csv_export(_df, digest):
+    """CSV text of a DataFrame, cached by its digest, the frame itself is not hashed"""
+    return _df.to_csv(index=False)
+
+
+def dataframe_to_excel(df, sheet_name):
+    """
+    Render a DataFrame as an XLSX file
+
+    Args:
+        df (pandas.DataFrame): The table to export
+        sheet_name (str): Name of the worksheet
+
+    Returns:
+        bytes: The XLSX file
+    """
+    return _excel_export(df, sheet_name, frame_digest(df))
+
+
+def dataframe_to_csv(df):
+    """Render a DataFrame as CSV text"""
+    return _csv_export(df, frame_digest(df))
+
+
+def clear_query_caches():
+    """Drop cached store queries after new results were written"""
+    cached_trend.clear()
+    cached_url_changes.clear()
+    cached_feature_search.clear()
+    cached_top_features.clear()
+    cached_knowledge_graph_keywords.clear()
+    cached_competitors.clear()
+    cached_keyword_clusters.clear()
+
+
+def clear_all_caches():
+    """
+    Drop every cached query, export and search response
+
+    Services from st.cache_resource are shared by all sessions and hold
+    state such as the request queue, key quarantines and session memory,
+    so one session clearing its caches keeps them.
+    """
+    st.cache_data.clear()
+    RESPONSE_CACHE.clear()
+
+
+def cache_sizes():
+    """
+    Memory used by each st.cache_data and st.cache_resource function
+
+    Returns:
+        dict: Cached function name -> bytes, empty outside a Streamlit server
+    """
+    from streamlit.runtime import Runtime
+
+    if not Runtime.exists():
+        return {}
+    stats = Runtime.instance().stats_mgr.get_stats()
+    # Older Streamlit versions return a flat list instead of families
+    if isinstance(stats, dict):
+        stats = [stat for family in stats.values() for stat in family]
+
+    sizes = {}
+    for stat in stats:
+        if getattr(stat, 'category_name', None) in ("st_cache_data", "st_cache_resource"):
+            name = stat.cache_name.rsplit(".", 1)[-1]
+            sizes[name] = sizes.get(name, 0) + stat.byte_length
+    return sizes
@@ -0,0 +1,140 @@
+"""
+Keyword cannibalization analysis
+
+A domain cannibalizes a keyword when several of its URLs compete for it,
+either on the same result page or by taking turns between runs. Both are
+read from data the tracker already collects: every hit of a domain on the
+fetched pages (the run's 'hits') and the ranking URL of each stored run
+(HistoryStore.get_url_changes).
+"""
+
+MULTIPLE_URLS = "Multiple URLs"
+URL_SWITCH = "URL switched"
+
+
+def normalize_url(url):
+    """
+    Reduce a URL to what identifies the page
+
+    Scheme, "www.", fragment and a trailing slash are dropped, so
+    http://www.example.com/page/ and https://example.com/page#top are the
+    same page.
+    """
+    if not url:
+        return ""
+    url = url.split("#", 1)[0]
+    url = url.partition("//")[2] or url
+    url = url[4:] if url.lower().startswith("www.") else url
+    host, slash, path = url.partition("/")
+    return (host.lower() + slash + path).rstrip("/")
+
+
+def find_multiple_urls(hits, min_urls=2):
+    """
+    Keywords where a domain ranks with several distinct URLs
+
+    Args:
+        hits (dict): Keyword -> domain -> list of RankHit, as in a run's 'hits'
+        min_urls (int): Distinct URLs needed to report a keyword
+
+    Returns:
+        list: Dictionaries with keyword, domain, urls (list of (rank, url),
+            best first), url_count, best_rank and rank_spread
+    """
+    findings = []
+    for keyword, keyword_hits in hits.items():
+        for domain, domain_hits in keyword_hits.items():
+            urls = {}
+            for hit in domain_hits:
+                # Keep the best position of each page, image results may repeat a page
+                urls.setdefault(normalize_url(hit.url), (hit.rank, hit.url))
+            if len(urls) < min_urls:
+                continue
+            ranked = sorted(urls.values())
+            findings.append({
+                'keyword': keyword,
+                'domain': domain,
+                'urls': ranked,
+                'url_count': len(ranked),
+                'best_rank': ranked[0][0],
+                'rank_spread': ranked[-1][0] - ranked[0][0],
+            })
+    findings.sort(key=lambda finding: (finding['domain'], -finding['url_count'], finding['best_rank']))
+    return findings
+
+
+def find_url_switches(url_changes, keywords=None):
+    """
+    Keep the URL changes that point to a different page
+
+    Args:
+        url_changes (list): Rows of HistoryStore.get_url_changes
+        keywords (iterable): Only keep these keywords, None keeps all
+
+    Returns:
+        list: The rows whose URLs differ after normalize_url
+    """
+    keywords = set(keywords) if keywords is not None else None
+    return [
+        change for change in url_changes
+        if (keywords is None or change['keyword'] in keywords)
+        and normalize_url(change['url']) != normalize_url(change['previous_url'])
+    ]
+
+
+def summarize(multiple_urls, url_switches, domains, keyword_count):
+    """
+    Cannibalization per domain across the keyword set
+
+    Args:
+        multiple_urls (list): Output of find_multiple_urls
+        url_switches (list): Output of find_url_switches
+        domains (list): Domains to report, in display order
+        keyword_count (int): Number of keywords tracked
+
+    Returns:
+        dict: Domain -> multiple_url_keywords, competing_urls (URLs beyond the
+            first), switching_keywords, switches, affected_keywords and
+            affected_pct (keywords with either issue)
+    """
+    summary = {
+        domain: {'multiple_url_keywords': 0, 'competing_urls': 0, 'switching_keywords': 0, 'switches': 0}
+        for domain in domains
+    }
+    affected = {domain: set() for domain in domains}
+
+    for finding in multiple_urls:
+        if finding['domain'] in summary:
+            summary[finding['domain']]['multiple_url_keywords'] += 1
+            summary[finding['domain']]['competing_urls'] += finding['url_count'] - 1
+            affected[finding['domain']].add(finding['keyword'])
+
+    switching = {domain: set() for domain in domains}
+    for change in url_switches:
+        if change['domain'] in summary:
+            summary[change['domain']]['switches'] += 1
+            switching[change['domain']].add(change['keyword'])
+            affected[change['domain']].add(change['keyword'])
+
+    for domain in domains:
+        summary[domain]['switching_keywords'] = len(switching[domain])
+        summary[domain]['affected_keywords'] = len(affected[domain])
+        summary[domain]['affected_pct'] = 100 * len(affected[domain]) / keyword_count if keyword_count else 0.0
+    return summary
+
+
+def keyword_flags(multiple_urls, url_switches):
+    """
+    Issues found per keyword and domain, for a combined table
+
+    Returns:
+        dict: (keyword, domain) -> list of MULTIPLE_URLS and URL_SWITCH
+    """
+    flags = {}
+    for finding in multiple_urls:
+        flags.setdefault((finding['keyword'], finding['domain']), []).append(MULTIPLE_URLS)
+    for change in url_switches:
+        issues = flags.setdefault((change['keyword'], change['domain']), [])
+        if URL_SWITCH not in issues:
+            issues.append(URL_SWITCH)
+    return flags
@@ -0,0 +1,251 @@
+"""
+Chart builders whose payload stays bounded for any number of keywords
+
+Plotly figures ship every point to the browser as JSON, so charts built
+from raw rows grow with the keyword count until the page stalls. These
+builders aggregate on the server first:
+
+- rank_histogram counts ranks per bin and draws precomputed box plots
+- keyword_rank_bars shows the top keywords and folds the rest into "Other"
+- rank_scatter merges identical points and draws them with WebGL
+
+so a figure holds at most POINT_BUDGET points. Plotly is imported inside
+the builders, only when a chart is drawn.
+"""
+import math
+
+# Most bars, markers or bins a figure may send to the browser
+POINT_BUDGET = 2000
+# Bins of rank histograms
+HISTOGRAM_BINS = 20
+# Keywords shown individually in per-keyword bar charts
+TOP_KEYWORDS = 30
+OTHER_LABEL = "Other"
+
+
+def bin_counts(values, bins=HISTOGRAM_BINS, start=None, end=None):
+    """
+    Count values per equal-width bin
+
+    Args:
+        values (list): Numbers to count
+        bins (int): Number of bins
+        start (float): Lower edge of the first bin, defaults to the smallest value
+        end (float): Upper edge of the last bin, defaults to the largest value
+
+    Returns:
+        tuple: (edges, counts) with len(counts) + 1 edges
+    """
+    if not values:
+        return [], []
+    start = min(values) if start is None else start
+    end = max(values) if end is None else end
+    bins = max(1, bins)
+    width = (end - start) / bins or 1
+    counts = [0] * bins
+    for value in values:
+        counts[min(bins - 1, max(0, int((value - start) / width)))] += 1
+    return [start + width * i for i in range(bins + 1)], counts
+
+
+def box_stats(values):
+    """
+    Quartiles and Tukey fences of a list of numbers, as drawn by a box plot
+
+    Returns:
+        dict: q1, median, q3, lowerfence, upperfence and mean, None without values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def quantile(fraction):
+        # Linear interpolation between closest ranks, like numpy's default
+        position = (len(ordered) - 1) * fraction
+        lower = math.floor(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+    q1, median, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+    spread = 1.5 * (q3 - q1)
+    return {
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'lowerfence': min(value for value in ordered if value >= q1 - spread),
+        'upperfence': max(value for value in ordered if value <= q3 + spread),
+        'mean': sum(ordered) / len(ordered),
+    }
+
+
+def top_n_with_other(scores, n, other_label=OTHER_LABEL):
+    """
+    Split items into the n best scored and the rest
+
+    Args:
+        scores (dict): Item -> score, lower is better, None sorts last
+        n (int): Number of items to keep
+        other_label (str): Label of the folded items
+
+    Returns:
+        tuple: (kept items in score order, folded items, label for the folded
+            items such as "Other (12)", None if nothing was folded)
+    """
+    ordered = sorted(scores, key=lambda item: (scores[item] is None, scores[item] or 0))
+    kept, folded = ordered[:n], ordered[n:]
+    return kept, folded, f"{other_label} ({len(folded)})" if folded else None
+
+
+def rank_histogram(ranks_by_series, bins=HISTOGRAM_BINS, title=None, height=450):
+    """
+    Histogram of ranks per series with a box plot above it
+
+    Args:
+        ranks_by_series (dict): Series name (e.g. domain) -> list of ranks
+        bins (int): Number of bins shared by all series
+        title (str): Figure title
+        height (int): Figure height in pixels
+
+    Returns:
+        plotly.graph_objects.Figure: bins * series bars and one box per series
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    all_ranks = [rank for ranks in ranks_by_series.values() for rank in ranks]
+    start, end = (min(all_ranks), max(all_ranks) + 1) if all_ranks else (1, 2)
+    bins = max(1, min(bins, end - start))
+
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.2, 0.8], vertical_spacing=0.03)
+    for series, ranks in ranks_by_series.items():
+        edges, counts = bin_counts(ranks, bins, start, end)
+        if not counts:
+            continue
+        width = edges[1] - edges[0]
+        fig.add_trace(
+            go.Bar(
+                x=[edge + width / 2 for edge in edges[:-1]],
+                y=counts,
+                width=width,
+                name=series,
+                legendgroup=series,
+                opacity=0.7,
+                hovertemplate=f"{series}<br>Positions %{{customdata}}<br>%{{y}} keywords<extra></extra>",
+                customdata=[f"{math.ceil(low)}-{math.ceil(high) - 1}" for low, high in zip(edges, edges[1:])]
+            ),
+            row=2, col=1
+        )
+        stats = box_stats(ranks)
+        fig.add_trace(
+            go.Box(
+                y=[series],
+                orientation='h',
+                name=series,
+                legendgroup=series,
+                showlegend=False,
+                **{key: [value] for key, value in stats.items()}
+            ),
+            row=1, col=1
+        )
+
+    fig.update_layout(title=title, barmode='relative', bargap=0.1, height=height)
+    fig.update_yaxes(showticklabels=False, row=1, col=1)
+    return fig
+
+
+def keyword_rank_bars(ranks_by_keyword, domains, top_n=TOP_KEYWORDS, title=None, height=450):
+    """
+    Grouped bars of each domain's rank for the best ranked keywords
+
+    Keywords beyond top_n, ordered by their best rank over all domains, are
+    folded into one "Other" group showing each domain's average rank.
+
+    Args:
+        ranks_by_keyword (dict): Keyword -> domain -> rank (None if not found)
+        domains (list): Domains, one bar each per keyword
+        top_n (int): Keywords shown individually, capped by POINT_BUDGET
+        title (str): Figure title
+        height (int): Figure height in pixels
+
+    Returns:
+        tuple: (plotly.graph_objects.Figure, number of folded keywords)
+    """
+    import plotly.graph_objects as go
+
+    top_n = max(1, min(top_n, POINT_BUDGET // max(1, len(domains)) - 1))
+    best = {
+        keyword: min((rank for rank in ranks.values() if rank is not None), default=None)
+        for keyword, ranks in ranks_by_keyword.items()
+    }
+    kept, folded, other_label = top_n_with_other(best, top_n)
+
+    fig = go.Figure()
+    for domain in domains:
+        x = []
+        y = []
+        for keyword in kept:
+            rank = ranks_by_keyword[keyword].get(domain)
+            if rank is not None:
+                x.append(keyword)
+                y.append(rank)
+        folded_ranks = [ranks_by_keyword[keyword].get(domain) for keyword in folded]
+        folded_ranks = [rank for rank in folded_ranks if rank is not None]
+        if folded_ranks:
+            x.append(other_label)
+            y.append(round(sum(folded_ranks) / len(folded_ranks), 1))
+        fig.add_trace(go.Bar(x=x, y=y, name=domain))
+
+    fig.update_layout(
+        title=title,
+        barmode='group',
+        height=height,
+        xaxis={'categoryorder': 'array', 'categoryarray': kept + ([other_label] if other_label else [])}
+    )
+    return fig, len(folded)
+
+
+def rank_scatter(points, point_budget=POINT_BUDGET, title=None, height=400):
+    """
+    WebGL scatter of rank pairs, merging points at the same position
+
+    Ranks are integers, so thousands of keywords share far fewer distinct
+    positions. Points at the same position and color become one marker
+    sized by how many keywords it stands for. Beyond point_budget the
+    smallest markers are dropped.
+
+    Args:
+        points (list): Dicts with x, y, color and label (e.g. the keyword)
+        point_budget (int): Most markers drawn
+        title (str): Figure title
+        height (int): Figure height in pixels
+
+    Returns:
+        tuple: (plotly.graph_objects.Figure, number of keywords not drawn)
+    """
+    import plotly.graph_objects as go
+
+    merged = {}
+    for point in points:
+        merged.setdefault((point['color'], point['x'], point['y']), []).append(point['label'])
+
+    markers = sorted(merged.items(), key=lambda item: -len(item[1]))
+    dropped = sum(len(labels) for _, labels in markers[point_budget:])
+    markers = markers[:point_budget]
+
+    by_color = {}
+    for (color, x, y), labels in markers:
+        by_color.setdefault(color, []).append((x, y, labels))
+
+    fig = go.Figure()
+    for color, color_markers in by_color.items():
+        fig.add_trace(go.Scattergl(
+            x=[x for x, _, _ in color_markers],
+            y=[y for _, y, _ in color_markers],
+            mode='markers',
+            name=color,
+            marker={'size': [min(30, 6 + 3 * math.log2(len(labels))) for _, _, labels in color_markers]},
+            text=[labels[0] + (f" and {len(labels) - 1} more" if len(labels) > 1 else "") for _, _, labels in color_markers],
+            hovertemplate="%{text}<br>%{x} vs %{y}<extra></extra>"
+        ))
+    fig.update_layout(title=title, height=height)
+    return fig, dropped
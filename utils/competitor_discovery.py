@@ -0,0 +1,212 @@
+"""
+Competitor discovery from the hosts ranking next to the tracked domains
+
+Every organic result page lists all ranking hosts, not just the tracked
+ones. CompetitorDiscovery streams over those pages, from a run or from the
+organic results archived in the SERP features store, and counts for every
+host the keywords it ranks for and its CTR-weighted visibility.
+
+The number of distinct hosts grows with the keyword count, so hosts are
+counted in a Space-Saving heavy-hitters summary of fixed capacity: once
+it is full, a new host replaces the one with the least visibility and
+inherits its visibility as possible overestimation (the error). Its keyword
+count and positions start from zero, so they only cover the keywords seen
+since it was counted and are lower bounds. Any host with more than total
+visibility / capacity is guaranteed to be kept, and the suggested
+competitors are exactly those heavy hitters.
+"""
+import heapq
+
+from utils.data_service import host_of
+from utils.serp_features import organic_links
+from utils.visibility import ctr_for_position
+
+# Hosts counted at the same time, memory stays O(capacity) for any keyword count
+DEFAULT_CAPACITY = 1000
+# Competitors suggested by default
+DEFAULT_SUGGESTIONS = 20
+# Hosts that rank everywhere but are not competitors of a site
+DEFAULT_IGNORED_HOSTS = (
+    "youtube.com", "wikipedia.org", "facebook.com", "instagram.com", "twitter.com",
+    "x.com", "linkedin.com", "pinterest.com", "reddit.com", "quora.com", "amazon.com",
+)
+
+
+def _matches(host, domains):
+    """Whether a host is in a set of domains or a subdomain of one, one lookup per label"""
+    while host:
+        if host in domains:
+            return True
+        host = host.partition(".")[2]
+    return False
+
+
+class SpaceSaving:
+    """
+    Bounded weighted heavy-hitters counter (Space-Saving)
+
+    Tracks at most capacity items. Every item carries its weight, a
+    secondary count and the error inherited when it replaced another item,
+    so weight - error is a lower bound of the true weight. Count and
+    position sum are not inherited, they cover the occurrences since the
+    item was tracked and are exact only while error is 0.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = max(1, capacity)
+        self.total = 0.0
+        # Item -> [weight, count, position_sum, error]
+        self._counters = {}
+        # Lazy min-heap of (weight, item), entries are stale once the weight changed
+        self._heap = []
+
+    def __len__(self):
+        return len(self._counters)
+
+    def add(self, item, weight, position=0):
+        """
+        Count one occurrence of an item
+
+        Args:
+            item (str): The item, e.g. a host
+            weight (float): Weight of the occurrence
+            position (int): Ranking position, summed for an average
+        """
+        self.total += weight
+        counter = self._counters.get(item)
+        if counter is None:
+            if len(self._counters) < self.capacity:
+                counter = self._counters[item] = [0.0, 0, 0, 0.0]
+            else:
+                # Replace the lightest item, the newcomer may have been counted as it,
+                # its weight is bounded by the floor but its keywords and positions are unknown
+                _, (floor, _, _, _) = self._pop_min()
+                counter = self._counters[item] = [floor, 0, 0, floor]
+        counter[0] += weight
+        counter[1] += 1
+        counter[2] += position
+        heapq.heappush(self._heap, (counter[0], item))
+        if len(self._heap) > 4 * self.capacity:
+            # Drop stale entries so the heap stays O(capacity)
+            self._heap = [(counter[0], item) for item, counter in self._counters.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, n=None):
+        """
+        Heaviest items first
+
+        Returns:
+            list: (item, weight, count, position_sum, error) tuples
+        """
+        items = sorted(self._counters.items(), key=lambda entry: -entry[1][0])
+        return [(item, *counter) for item, counter in items[:n]]
+
+    def _pop_min(self):
+        """Remove and return the item with the smallest weight and its counter"""
+        while True:
+            weight, item = heapq.heappop(self._heap)
+            counter = self._counters.get(item)
+            if counter is not None and counter[0] == weight:
+                return item, self._counters.pop(item)
+
+
+class CompetitorDiscovery:
+    """
+    Streaming count of the hosts ranking for a keyword set
+
+    Each host counts once per keyword at its best position: one keyword
+    towards its keyword count and the CTR of that position towards its
+    visibility. Tracked domains and ignored hosts are skipped.
+    """
+
+    def __init__(self, domains, capacity=DEFAULT_CAPACITY, ignored_hosts=DEFAULT_IGNORED_HOSTS):
+        """
+        Args:
+            domains (list): Tracked domains, never suggested
+            capacity (int): Hosts counted at the same time
+            ignored_hosts (iterable): Hosts (and their subdomains) never suggested
+        """
+        self.domains = [host_of(domain) for domain in domains]
+        self.excluded = set(self.domains) | {host_of(host) for host in ignored_hosts or ()}
+        self.counter = SpaceSaving(capacity)
+        self.keywords = 0
+
+    def add_page(self, keyword, organic):
+        """
+        Count the organic results of one keyword
+
+        Args:
+            keyword (str): The keyword of the page
+            organic (iterable): (position, link) pairs of the organic results
+        """
+        best = {}
+        for position, link in organic:
+            host = host_of(link)
+            if not host or host in best:
+                continue
+            best[host] = position
+        self.keywords += 1
+        for host, position in best.items():
+            if _matches(host, self.excluded):
+                continue
+            self.counter.add(host, ctr_for_position(position), position)
+
+    def add_response(self, keyword, search_results):
+        """
+        Count a Serper search response, usable as a tracker response_callback
+
+        Args:
+            keyword (str): The keyword of the response
+            search_results (dict): Organic search results from Serper
+        """
+        self.add_page(keyword, organic_links(search_results))
+
+    def add_archive(self, rows):
+        """
+        Count archived organic results without fetching them again
+
+        Args:
+            rows (iterable): (keyword, position, link) rows grouped by keyword,
+                as yielded by SerpFeatureStore.iter_organic
+        """
+        keyword = None
+        page = []
+        for row_keyword, position, link in rows:
+            if row_keyword != keyword:
+                if keyword is not None:
+                    self.add_page(keyword, page)
+                keyword, page = row_keyword, []
+            page.append((position, link))
+        if keyword is not None:
+            self.add_page(keyword, page)
+
+    def suggestions(self, n=DEFAULT_SUGGESTIONS):
+        """
+        Hosts with the most visibility across the counted keywords
+
+        Args:
+            n (int): Number of hosts to return
+
+        Returns:
+            list: Dicts with host, keywords, keyword_pct, visibility (% of the
+                clicks of a #1 ranking for every keyword), average_position,
+                guaranteed (the host is certainly among the top n) and exact
+                (keywords and average_position cover every counted keyword,
+                otherwise only those since the host was tracked, keywords
+                then being a lower bound and visibility an upper bound)
+        """
+        top = self.counter.top(n + 1)
+        # A host is certainly ahead of every host left out if its lower bound beats them
+        threshold = top[n][1] if len(top) > n else 0.0
+        suggestions = []
+        for host, weight, count, position_sum, error in top[:n]:
+            suggestions.append({
+                'host': host,
+                'keywords': count,
+                'keyword_pct': 100 * count / self.keywords if self.keywords else 0.0,
+                'visibility': 100 * weight / self.keywords if self.keywords else 0.0,
+                'average_position': position_sum / count if count else None,
+                'guaranteed': weight - error >= threshold,
+                'exact': error == 0,
+            })
+        return suggestions
@@ -0,0 +1,208 @@
+"""
+Cost estimates of rank runs before any request is sent
+
+The planned pages of a run are walked the same way RankTracker.track would
+request them: the first page at the keyword's starting size, the full size
+page when adaptive mode escalates and the deeper pages up to max_depth.
+Pages already in the response cache cost nothing. How deep a keyword goes
+depends on results not known yet, so every estimate is a range:
+
+- min: first pages only, every domain found right away
+- expected: keywords found last time stop where they were found, keywords
+  missing last time or without history go to the full depth
+- max: every keyword to the full depth
+"""
+import math
+
+from utils.api_service import credits_for_request
+from utils.rank_tracker import RankTracker
+
+ESTIMATE_LEVELS = ("min", "expected", "max")
+# Runs expected to cost more credits than this ask for confirmation first
+DEFAULT_CONFIRM_ABOVE_CREDITS = 100
+
+
+def _planned_pages(start_size, result_size, max_pages):
+    """
+    Pages RankTracker.track may request for a keyword, cheapest first
+
+    Returns:
+        list: (result_size, page) tuples, the first being the first request
+    """
+    pages = [(start_size, 1)]
+    if start_size < result_size:
+        pages.append((result_size, 1))
+    pages.extend((result_size, page) for page in range(2, max_pages + 1))
+    return pages
+
+
+def _expected_page_count(keyword, domains, start_size, result_size, max_pages, previous_results):
+    """Number of planned pages the keyword is expected to need, from its previous ranks"""
+    full_depth = len(_planned_pages(start_size, result_size, max_pages))
+    previous = (previous_results or {}).get(keyword)
+    if not previous:
+        return full_depth
+
+    deepest = 0
+    for domain in domains:
+        if domain not in previous:
+            continue
+        result = previous[domain]
+        if result is None:
+            # Missing last time, likely missing again
+            return full_depth
+        deepest = max(deepest, result.rank or 0)
+
+    if deepest <= start_size:
+        return 1
+    escalation = 1 if start_size < result_size else 0
+    return min(full_depth, 1 + escalation + max(0, math.ceil(deepest / result_size) - 1))
+
+
+def estimate_run_cost(api_service, keywords, domains, search_type="search", location="United States", language="en", country_code="us", result_size=10, batch_size=1, max_depth=None, adaptive=False, previous_results=None, extra_keywords=0):
+    """
+    Estimate the queries, requests and credits a run will use
+
+    Args:
+        api_service (SerperAPI): Client whose response cache is checked
+        keywords (list): List of keywords
+        domains (list): List of domains
+        search_type (str): Search vertical (search, images, news, videos, places)
+        location (str): Location for search results
+        language (str): Language code (en, tr, etc.)
+        country_code (str): Country code (us, tr, etc.)
+        result_size (int): Number of results per page (10, 20, 50 or 100)
+        batch_size (int): Number of keywords per API request, 1 disables batching
+        max_depth (int): Deepest rank to look for, None checks the first page only
+        adaptive (bool): Start with a small result size and escalate per keyword
+        previous_results (dict): Results of an earlier run used to pick starting sizes
+        extra_keywords (int): Keywords added during the run, e.g. by discovery,
+            counted as uncached keywords without history
+
+    Returns:
+        dict: 'keywords', 'cached' (keywords whose first page is cached) and
+            'queries', 'requests' and 'credits', each with min, expected and max
+    """
+    keywords = list(dict.fromkeys(keywords))
+    max_pages = max(1, math.ceil((max_depth or result_size) / result_size))
+    ladder = RankTracker._size_ladder(result_size) if adaptive else [result_size]
+
+    # Uncached queries per (result_size, page) and level, batched per group like the tracker
+    groups = {level: {} for level in ESTIMATE_LEVELS}
+    cached = 0
+
+    def plan(pages, expected_count, is_cached):
+        for level, count in (('min', 1), ('expected', expected_count), ('max', len(pages))):
+            for size, page in pages[:count]:
+                if not is_cached(size, page):
+                    groups[level][(size, page)] = groups[level].get((size, page), 0) + 1
+
+    for keyword in keywords:
+        start_size = RankTracker._start_size(keyword, domains, ladder, previous_results)
+        pages = _planned_pages(start_size, result_size, max_pages)
+        if api_service.is_cached(keyword, search_type, location, language, country_code, start_size, 1):
+            cached += 1
+        plan(
+            pages,
+            _expected_page_count(keyword, domains, start_size, result_size, max_pages, previous_results),
+            lambda size, page: api_service.is_cached(keyword, search_type, location, language, country_code, size, page)
+        )
+
+    # Keywords found during the run have no history and nothing cached
+    extra_pages = _planned_pages(ladder[0], result_size, max_pages)
+    for _ in range(extra_keywords):
+        plan(extra_pages, len(extra_pages), lambda size, page: False)
+
+    estimate = {'keywords': len(keywords) + extra_keywords, 'cached': cached, 'queries': {}, 'requests': {}, 'credits': {}}
+    for level in ESTIMATE_LEVELS:
+        estimate['queries'][level] = sum(groups[level].values())
+        estimate['requests'][level] = sum(math.ceil(count / max(1, batch_size)) for count in groups[level].values())
+        estimate['credits'][level] = sum(credits_for_request(size) * count for (size, _), count in groups[level].items())
+    return estimate
+
+
+def load_budgets():
+    """
+    Credit budgets from the budgets secrets section
+
+    Returns:
+        dict: per_run_credits and per_user_monthly_credits (None when not set)
+            and confirm_above_credits
+    """
+    import streamlit as st
+
+    try:
+        config = dict(st.secrets["budgets"])
+    except Exception:
+        # No budgets configured
+        config = {}
+    return {
+        'per_run_credits': config.get('per_run_credits'),
+        'per_user_monthly_credits': config.get('per_user_monthly_credits'),
+        'confirm_above_credits': config.get('confirm_above_credits', DEFAULT_CONFIRM_ABOVE_CREDITS),
+    }
+
+
+def credit_limit(budgets, spent_this_month=0, run_budget=None):
+    """
+    Most credits a run may use under the configured budgets
+
+    Args:
+        budgets (dict): per_run_credits and per_user_monthly_credits, either may be missing
+        spent_this_month (int): Credits the user already spent this month
+        run_budget (int): Budget chosen for this run, if any
+
+    Returns:
+        int: The credit limit, None if nothing limits the run
+    """
+    limits = [limit for limit in (run_budget, budgets.get('per_run_credits')) if limit]
+    monthly = budgets.get('per_user_monthly_credits')
+    if monthly:
+        limits.append(max(0, monthly - spent_this_month))
+    return min(limits, default=None)
+
+
+def reserve_run_credits(ledger, user, estimate, limit, budgets):
+    """
+    Reserve the credits a run may use before it starts
+
+    The run's most expensive outcome is held in the ledger, capped by its
+    limit. Under a monthly budget the run's limit becomes what was granted,
+    so concurrent runs of one user stay within the budget together.
+
+    Args:
+        ledger (CreditLedger): The credit ledger
+        user (str): Who starts the run
+        estimate (dict): Output of estimate_run_cost
+        limit (int): The run's credit limit from credit_limit, None if unlimited
+        budgets (dict): per_user_monthly_credits may be set
+
+    Returns:
+        tuple: (reservation id, credit limit of the run), settle the
+            reservation with CreditLedger.record
+    """
+    hold = estimate['credits']['max'] if limit is None else min(limit, estimate['credits']['max'])
+    if hold <= 0:
+        # Served from the response cache, or already refused by its limit
+        return None, limit
+    monthly = budgets.get('per_user_monthly_credits')
+    reservation_id, granted = ledger.reserve(user, hold, monthly)
+    if monthly:
+        limit = granted if limit is None else min(limit, granted)
+    return reservation_id, limit
+
+
+def budget_problem(estimate, limit):
+    """
+    Reason a run cannot start under its credit limit
+
+    Returns:
+        str: The problem, None if the run can start
+    """
+    if limit is None:
+        return None
+    if limit <= 0:
+        return "The credit budget is used up"
+    if estimate['credits']['min'] > limit:
+        return f"This run needs at least {estimate['credits']['min']} credits but the budget allows {limit}"
+    return None
@@ -0,0 +1,266 @@
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from utils.storage import get_data_path
+
+# Hours after which a reservation no run settled, e.g. after a crash, stops holding credits
+RESERVATION_TTL_HOURS = 12
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spend (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at TEXT NOT NULL,
+    user TEXT NOT NULL,
+    project TEXT,
+    search_type TEXT NOT NULL,
+    location TEXT NOT NULL,
+    keyword_count INTEGER NOT NULL,
+    requests INTEGER NOT NULL,
+    credits INTEGER NOT NULL,
+    estimated_credits INTEGER,
+    cache_hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS spend_user_time ON spend(user, recorded_at);
+CREATE TABLE IF NOT EXISTS reservations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    reserved_at TEXT NOT NULL,
+    user TEXT NOT NULL,
+    credits INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS key_spend (
+    key_id TEXT PRIMARY KEY,
+    requests INTEGER NOT NULL,
+    credits INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def month_start(day=None):
+    """Return the first moment of the month containing a date, as stored in the ledger"""
+    day = day or date.today()
+    return datetime(day.year, day.month, 1).isoformat(timespec="seconds")
+
+
+class CreditLedger:
+    """
+    Local record of the API credits every run actually used
+
+    Interactive runs are recorded per user, scheduled runs under the
+    scheduler with their project, next to the credits estimated before the
+    run so estimates can be compared with real spend.
+
+    Runs reserve the credits they may use before they start and settle the
+    reservation with their actual spend, so concurrent runs of one user see
+    each other's credits against the monthly budget.
+
+    The spend of every API key is kept as running totals in key_spend, so
+    key credit limits survive restarts.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_data_path("ledger.sqlite3")
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection, committing on success and always closing it"""
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def reserve(self, user, credits, monthly_limit=None):
+        """
+        Hold credits for a run about to start
+
+        The monthly budget is checked and the hold written in one
+        transaction, so two runs starting at once cannot both take the
+        last credits.
+
+        Args:
+            user (str): Who starts the run
+            credits (int): Credits the run may use
+            monthly_limit (int): The user's monthly budget, None for no limit
+
+        Returns:
+            tuple: (reservation id, credits granted), fewer than asked for
+                when the budget has less left, (None, 0) if nothing is left
+        """
+        with self._connect() as connection:
+            # Take the write lock before reading, other reservations wait for this one
+            connection.execute("BEGIN IMMEDIATE")
+            granted = credits
+            if monthly_limit:
+                granted = min(credits, max(0, monthly_limit - self._spent(connection, user, month_start(), True)))
+            if granted <= 0:
+                return None, 0
+            cursor = connection.execute(
+                "INSERT INTO reservations (reserved_at, user, credits) VALUES (?, ?, ?)",
+                (datetime.now().isoformat(timespec="seconds"), user, granted)
+            )
+            return cursor.lastrowid, granted
+
+    def release(self, reservation_id):
+        """Drop a reservation without recording spend, e.g. for a run that never started"""
+        if reservation_id is None:
+            return
+        with self._connect() as connection:
+            connection.execute("DELETE FROM reservations WHERE id = ?", (reservation_id,))
+
+    def record(self, user, usage, keyword_count, search_type, location, estimated_credits=None, project=None, recorded_at=None, reservation_id=None):
+        """
+        Add the spend of one run
+
+        Args:
+            user (str): Who started the run
+            usage (dict): The run's 'usage' report
+            keyword_count (int): Number of keywords tracked
+            search_type (str): Search vertical of the run
+            location (str): Location for search results
+            estimated_credits (int): Expected credits shown before the run
+            project (str): Name of the scheduled project, None for interactive runs
+            recorded_at (datetime): Time of the run, defaults to now
+            reservation_id (int): Reservation of the run, settled by this entry
+
+        Returns:
+            int: The id of the ledger entry
+        """
+        usage = usage or {}
+        recorded_at = (recorded_at or datetime.now()).isoformat(timespec="seconds")
+        with self._connect() as connection:
+            if reservation_id is not None:
+                connection.execute("DELETE FROM reservations WHERE id = ?", (reservation_id,))
+            cursor = connection.execute(
+                "INSERT INTO spend (recorded_at, user, project, search_type, location, keyword_count, requests, credits, estimated_credits, cache_hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    recorded_at, user, project, search_type, location, keyword_count,
+                    usage.get('requests', 0), usage.get('credits_used', 0), estimated_credits,
+                    usage.get('cache_hits', 0)
+                )
+            )
+            return cursor.lastrowid
+
+    def add_key_spend(self, key_id, credits, byte_count=0, requests=1):
+        """
+        Add requests to an API key's running totals
+
+        Args:
+            key_id (str): Id of the key, see key_pool.key_id
+            credits (int): Credits the requests cost
+            byte_count (int): Bytes downloaded
+            requests (int): Number of requests
+        """
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO key_spend (key_id, requests, credits, bytes, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key_id) DO UPDATE SET requests = requests + excluded.requests, "
+                "credits = credits + excluded.credits, bytes = bytes + excluded.bytes, updated_at = excluded.updated_at",
+                (key_id, requests, credits, byte_count, datetime.now().isoformat(timespec="seconds"))
+            )
+
+    def key_spend(self, key_ids):
+        """
+        Running totals of API keys
+
+        Args:
+            key_ids (list): Ids of the keys
+
+        Returns:
+            dict: Key id -> dict with requests, credits and bytes, keys never used are missing
+        """
+        key_ids = list(key_ids)
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT key_id, requests, credits, bytes FROM key_spend WHERE key_id IN ({','.join('?' * len(key_ids))})",
+                key_ids
+            )
+            return {row['key_id']: {'requests': row['requests'], 'credits': row['credits'], 'bytes': row['bytes']} for row in rows}
+
+    def spent(self, user=None, since=None, include_reserved=True):
+        """
+        Credits spent, by one user or everyone
+
+        Args:
+            user (str): Only count this user's runs, None for all users
+            since (str): ISO timestamp to count from, defaults to the start of the month
+            include_reserved (bool): Count credits held by running runs as spent
+
+        Returns:
+            int: Total credits
+        """
+        with self._connect() as connection:
+            return self._spent(connection, user, since or month_start(), include_reserved)
+
+    def reserved(self, user=None):
+        """
+        Credits held by runs that have not settled yet
+
+        Returns:
+            int: Total credits of the live reservations
+        """
+        with self._connect() as connection:
+            return self._reserved(connection, user)
+
+    def _spent(self, connection, user, since, include_reserved):
+        query = "SELECT COALESCE(SUM(credits), 0) FROM spend WHERE recorded_at >= ?"
+        params = [since]
+        if user is not None:
+            query += " AND user = ?"
+            params.append(user)
+        spent = connection.execute(query, params).fetchone()[0]
+        return spent + self._reserved(connection, user) if include_reserved else spent
+
+    @staticmethod
+    def _reserved(connection, user):
+        cutoff = (datetime.now() - timedelta(hours=RESERVATION_TTL_HOURS)).isoformat(timespec="seconds")
+        query = "SELECT COALESCE(SUM(credits), 0) FROM reservations WHERE reserved_at >= ?"
+        params = [cutoff]
+        if user is not None:
+            query += " AND user = ?"
+            params.append(user)
+        return connection.execute(query, params).fetchone()[0]
+
+    def recent(self, user=None, limit=20):
+        """
+        Latest ledger entries, newest first
+
+        Returns:
+            list: Dicts with the columns of the spend table
+        """
+        query = "SELECT * FROM spend"
+        params = []
+        if user is not None:
+            query += " WHERE user = ?"
+            params.append(user)
+        query += " ORDER BY recorded_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as connection:
+            return [dict(row) for row in connection.execute(query, params)]
+
+    def monthly_totals(self, user=None):
+        """
+        Credits and requests per month
+
+        Returns:
+            list: Dicts with month (YYYY-MM), runs, requests, credits and
+                estimated_credits, newest month first
+        """
+        query = (
+            "SELECT substr(recorded_at, 1, 7) AS month, COUNT(*) AS runs, SUM(requests) AS requests, "
+            "SUM(credits) AS credits, SUM(estimated_credits) AS estimated_credits FROM spend"
+        )
+        params = []
+        if user is not None:
+            query += " WHERE user = ?"
+            params.append(user)
+        query += " GROUP BY month ORDER BY month DESC"
+        with self._connect() as connection:
+            return [dict(row) for row in connection.execute(query, params)]
@@ -1,10 +1,136 @@
-import pandas as pd
 import streamlit as st
 
+from utils.api_service import get_vertical
+from utils.models import RankHit
+
+
+def host_of(url):
+    """
+    Return the lowercase host name of a URL or bare domain
+    
+    Args:
+        url (str): A URL such as https://www.example.com/page, or a host name
+        
+    Returns:
+        str: The host without scheme, port, path or a leading "www."
+    """
+    if not url:
+        return ""
+    start = url.find("//")
+    host = url[start + 2:] if start >= 0 else url
+    for separator in "/?#":
+        end = host.find(separator)
+        if end >= 0:
+            host = host[:end]
+    host = host.rpartition("@")[2].partition(":")[0].lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def path_of(url):
+    """
+    Return the path of a URL or tracked domain entry
+    
+    Args:
+        url (str): A URL such as https://example.com/blog/post?page=2
+        
+    Returns:
+        str: The path without query, fragment or trailing slash, e.g. /blog/post
+    """
+    if not url:
+        return ""
+    start = url.find("//")
+    rest = url[start + 2:] if start >= 0 else url
+    slash = rest.find("/")
+    if slash < 0:
+        return ""
+    path = rest[slash:]
+    for separator in "?#":
+        path = path.partition(separator)[0]
+    return path.rstrip("/")
+
+
+def split_domain(domain):
+    """
+    Split a tracked domain entry into the host to look up and a path prefix
+    
+    Args:
+        domain (str): A tracked entry such as example.com or example.com/blog
+        
+    Returns:
+        tuple: (host, path), host is empty for single-label entries such as
+            "com", which would otherwise match every result
+    """
+    host = host_of(domain)
+    if "." not in host:
+        return "", ""
+    return host, path_of(domain)
+
+
+def in_path(url, prefix):
+    """Whether a URL lies under a path prefix, by whole segments (/blog matches /blog/post, not /blog-post)"""
+    if not prefix:
+        return True
+    path = path_of(url)
+    return path == prefix or path.startswith(prefix + "/")
+
+
+def build_host_index(items, link_fields):
+    """
+    Map every host and parent domain on a result page to its first result
+    
+    A result on blog.example.com is indexed under blog.example.com and
+    example.com, so tracked domains match their subdomains too. Single
+    labels such as com are not indexed.
+    
+    Args:
+        items (list): Result items in ranking order
+        link_fields (tuple): Item fields holding a URL or host name
+        
+    Returns:
+        dict: Host -> first result item on it
+    """
+    index = {}
+    for item in items:
+        for field in link_fields:
+            host = host_of(item.get(field))
+            # Parents of an indexed host were indexed along with it
+            while "." in host and host not in index:
+                index[host] = item
+                host = host.partition(".")[2]
+    return index
+
+
+def build_host_hits(items, link_fields):
+    """
+    Map every host and parent domain on a result page to all results on it
+    
+    Like build_host_index, but keeping every result of a host in ranking
+    order, so a domain with several URLs on the page gets all of them.
+    
+    Args:
+        items (list): Result items in ranking order
+        link_fields (tuple): Item fields holding a URL or host name
+        
+    Returns:
+        dict: Host -> list of result items on it or its subdomains
+    """
+    index = {}
+    for item in items:
+        hosts = set()
+        for field in link_fields:
+            host = host_of(item.get(field))
+            while "." in host and host not in hosts:
+                hosts.add(host)
+                host = host.partition(".")[2]
+        for host in hosts:
+            index.setdefault(host, []).append(item)
+    return index
+
+
 class DataService:
     """Service for data processing and manipulation"""
     
-    def find_domain_rank(self, search_results, domain, result_size=10):
+    def find_domain_rank(self, search_results, domain, result_size=10, offset=0):
         """
         Find the rank of a domain in search results
         
@@ -12,28 +138,16 @@ class DataService:
             search_results (dict): The search results from Serper API
             domain (str): The domain to find
             result_size (int): Maximum result size to check
+            offset (int): Number of results on earlier pages, added to page-relative positions
             
         Returns:
-            tuple or None: (rank position, url) or None if not found
+            RankHit or None: The rank and URL, or None if not found
         """
         # Check if this is an image search result
-        if 'images' in search_results:
-            return self.find_domain_in_image_results(search_results, domain, result_size)
-        
-        # Regular organic search
-        if 'organic' not in search_results:
-            return None
-            
-        organic_results = search_results.get('organic', [])
-        
-        for result in organic_results[:result_size]:
-            link = result.get('link', '')
-            if domain in link:
-                return (result.get('position', 0), link)
-        
-        return None
+        search_type = "images" if 'images' in search_results else "search"
+        return self.match_domains(search_results, [domain], search_type, result_size, offset)[domain]
     
-    def find_domain_in_image_results(self, search_results, domain, result_size=10):
+    def find_domain_in_image_results(self, search_results, domain, result_size=10, offset=0):
         """
         Find a domain in image search results
         
@@ -41,26 +155,106 @@ class DataService:
             search_results (dict): The image search results from Serper API
             domain (str): The domain to find
             result_size (int): Maximum result size to check
+            offset (int): Number of results on earlier pages, added to page-relative positions
             
         Returns:
-            tuple or None: (rank position, url, image_url) or None if not found
+            RankHit or None: The rank, URL and image URL, or None if not found
         """
-        if 'images' not in search_results:
-            return None
+        return self.match_domains(search_results, [domain], "images", result_size, offset)[domain]
+    
+    def match_domains(self, search_results, domains, search_type="search", result_size=10, offset=0):
+        """
+        Find the first result of each domain on one result page
+        
+        The page is scanned once into an index from host name, and every
+        parent domain of it, to the first result on that host. Each domain
+        is then a dictionary lookup, so a page costs O(results + domains)
+        instead of a substring check per result per domain. For image
+        results both the page link and the domain field are indexed.
+        Entries with a path, such as example.com/blog, take the first
+        result on the host whose link lies under that path.
+        
+        Args:
+            search_results (dict): The search results from Serper API
+            domains (list): The domains to find
+            search_type (str): Search vertical (search, images, news, videos, places)
+            result_size (int): Maximum result size to check
+            offset (int): Number of results on earlier pages, added to page-relative positions
             
-        image_results = search_results.get('images', [])
+        Returns:
+            dict: Domain -> RankHit, or None if not found
+        """
+        vertical = get_vertical(search_type)
+        items = search_results.get(vertical['results']) or []
+        link_field = vertical['link_fields'][0]
+        host_index = build_host_index(items[:result_size], vertical['link_fields'])
+        host_hits = None
+        image_field = vertical.get('image_field')
         
-        for result in image_results[:result_size]:
-            # Both link and domain fields contain domain information in image results
-            link = result.get('link', '')
-            result_domain = result.get('domain', '')
+        matches = {}
+        for domain in domains:
+            host, path = split_domain(domain)
+            if path:
+                # Only built when an entry has a path, the host alone decides otherwise
+                if host_hits is None:
+                    host_hits = build_host_hits(items[:result_size], vertical['link_fields'])
+                result = next((item for item in host_hits.get(host, []) if in_path(item.get(link_field), path)), None)
+            else:
+                result = host_index.get(host)
+            if result is None:
+                matches[domain] = None
+                continue
+            link = result.get(link_field, '')
+            image_url = result.get(image_field, '') if image_field else ""
+            matches[domain] = RankHit(self._absolute_position(result.get('position', 0), offset), link, image_url)
+        return matches
+    
+    def match_all_domains(self, search_results, domains, search_type="search", result_size=10, offset=0):
+        """
+        Find every result of each domain on one result page
+        
+        Same single scan as match_domains, keeping all results per host
+        instead of the first, e.g. to spot several URLs of a domain
+        competing for one keyword.
+        
+        Args:
+            search_results (dict): The search results from Serper API
+            domains (list): The domains to find
+            search_type (str): Search vertical (search, images, news, videos, places)
+            result_size (int): Maximum result size to check
+            offset (int): Number of results on earlier pages, added to page-relative positions
             
-            if domain in link or domain in result_domain:
-                # Return position, link and image URL
-                image_url = result.get('imageUrl', '')
-                return (result.get('position', 0), link, image_url)
+        Returns:
+            dict: Domain -> list of RankHit in ranking order, empty if not found
+        """
+        vertical = get_vertical(search_type)
+        items = search_results.get(vertical['results']) or []
+        host_hits = build_host_hits(items[:result_size], vertical['link_fields'])
+        image_field = vertical.get('image_field')
+        
+        link_field = vertical['link_fields'][0]
         
-        return None
+        matches = {}
+        for domain in domains:
+            host, path = split_domain(domain)
+            matches[domain] = [
+                RankHit(
+                    self._absolute_position(result.get('position', 0), offset),
+                    result.get(link_field, ''),
+                    result.get(image_field, '') if image_field else ""
+                )
+                for result in host_hits.get(host, [])
+                if in_path(result.get(link_field), path)
+            ]
+        return matches
+    
+    @staticmethod
+    def _absolute_position(position, offset):
+        """Convert a position on a later result page into an overall rank"""
+        # Deeper pages may report positions relative to the page or already absolute
+        if offset and position <= offset:
+            return offset + position
+        return position
     
     def results_to_dataframe(self, results, domains, keywords):
         """
@@ -74,6 +268,8 @@ class DataService:
         Returns:
             pandas.DataFrame: DataFrame with rankings and URLs
         """
+        import pandas as pd
+        
         data = []
         
         for keyword in keywords:
@@ -87,19 +283,9 @@ class DataService:
                     row[f"{domain} URL"] = ""
                     row[f"{domain} Image URL"] = ""
                 else:
-                    # Check if this is an image result (3 values) or regular result (2 values)
-                    if len(result) == 3:
-                        # Unpack the tuple (rank, url, image_url)
-                        rank, url, image_url = result
-                        row[f"{domain} Rank"] = rank
-                        row[f"{domain} URL"] = url
-                        row[f"{domain} Image URL"] = image_url
-                    else:
-                        # Unpack the tuple (rank, url)
-                        rank, url = result
-                        row[f"{domain} Rank"] = rank
-                        row[f"{domain} URL"] = url
-                        row[f"{domain} Image URL"] = ""
+                    row[f"{domain} Rank"] = result.rank
+                    row[f"{domain} URL"] = result.url
+                    row[f"{domain} Image URL"] = result.image_url
             
             data.append(row)
         
@@ -128,8 +314,7 @@ class DataService:
                 
                 # Calculate score: higher positions get higher scores
                 if result is not None:
-                    # Get the rank (first element of the tuple, regardless of tuple length)
-                    rank = result[0]
+                    rank = result.rank
                     
                     if rank == 1:
                         scores[domain] += 10
@@ -0,0 +1,379 @@
+"""
+Fair-share dispatch of API requests between sessions
+
+Every SerperAPI of the app process asks the shared RequestDispatcher for a
+slot before it sends a request. Requests wait in one of two lanes:
+
+- interactive: small runs started from the app, served first
+- bulk: large runs, which may never take the slots kept for interactive
+  requests
+
+Within a lane, waiting requests are ordered by weighted fair queuing per
+tenant (a user or project), so a 50k keyword run of one user takes turns
+with the runs of everyone else instead of queueing them behind it.
+
+Each session fetches one request at a time, so a slot limit alone would
+only queue once many sessions fetch together. The bulk lane is therefore
+also capped at BULK_MAX_IN_FLIGHT requests and paced by a token bucket of
+BULK_REQUESTS_PER_SECOND. Bulk requests queue, and take fair turns, as soon
+as a few large runs overlap. The bucket lives in a SQLite file, so
+scheduled sweeps and sharded workers, which run in other processes, draw
+from the same bulk rate through their own dispatchers.
+"""
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.storage import get_data_path
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+# Share of dispatch turns of each lane while both have requests waiting
+LANE_WEIGHTS = {INTERACTIVE: 4, BULK: 1}
+# Requests in flight across all sessions, matching the connection pool
+MAX_IN_FLIGHT = 10
+# In-flight slots bulk requests never take, so interactive checks do not wait
+INTERACTIVE_RESERVED = 2
+# Bulk requests in flight at once, low so concurrent large runs queue and take turns
+BULK_MAX_IN_FLIGHT = 2
+# Bulk requests per second across every process sharing the data directory
+BULK_REQUESTS_PER_SECOND = 5
+# Runs expected to send at most this many requests use the interactive lane
+INTERACTIVE_MAX_REQUESTS = 25
+# Seconds between queue position reports while a request waits
+QUEUE_REPORT_INTERVAL = 0.5
+
+
+def load_fair_share_config():
+    """
+    The fair_share secrets section
+
+    Returns:
+        dict: The section's settings, empty when it is missing
+    """
+    import streamlit as st
+
+    try:
+        return dict(st.secrets["fair_share"])
+    except Exception:
+        # No fair share settings, every user gets the same share
+        return {}
+
+
+def choose_lane(expected_requests):
+    """
+    Lane for a run from its estimated number of requests
+
+    Args:
+        expected_requests (int): Requests the run is expected to send
+
+    Returns:
+        str: INTERACTIVE or BULK
+    """
+    return INTERACTIVE if expected_requests <= INTERACTIVE_MAX_REQUESTS else BULK
+
+
+class TokenBucket:
+    """
+    Requests per second with short bursts, shared between processes
+
+    The fill level is kept in a SQLite file and updated in one write
+    transaction per request, so every process taking from a bucket of the
+    same name shares its rate.
+    """
+
+    def __init__(self, name, rate, burst=None, path=None):
+        """
+        Args:
+            name (str): Bucket name, processes using the same name share the rate
+            rate (float): Tokens added per second
+            burst (float): Most tokens held, defaults to one second's worth
+            path (str): SQLite file, defaults to data/dispatch.sqlite3
+        """
+        self.name = name
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst) if burst else self.rate)
+        self.path = path or get_data_path("dispatch.sqlite3")
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection, committing on success and always closing it"""
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def take(self):
+        """
+        Take a token if one is available
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until the next one
+        """
+        with self._connect() as connection:
+            # Take the write lock first so two processes cannot spend the same token
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = connection.execute("SELECT tokens, updated_at FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            connection.execute(
+                "INSERT OR REPLACE INTO token_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (self.name, tokens, now)
+            )
+            return wait
+
+
+class _Ticket:
+    """A request waiting for or holding a slot"""
+
+    __slots__ = ('lane', 'tenant', 'cost', 'start', 'finish', 'order', 'granted')
+
+    def __init__(self, lane, tenant, cost, start, finish, order):
+        self.lane = lane
+        self.tenant = tenant
+        self.cost = cost
+        self.start = start
+        self.finish = finish
+        self.order = order
+        self.granted = False
+
+    def __lt__(self, other):
+        return (self.finish, self.order) < (other.finish, other.order)
+
+
+class RequestDispatcher:
+    """
+    Thread-safe dispatcher shared by all sessions of a process
+
+    Tenants get turns in proportion to their weight (default 1), measured
+    in credits, by start-time fair queuing: each request is tagged with a
+    virtual finish time of the tenant's previous finish plus cost / weight
+    and the smallest tag goes first. Lanes take turns the same way by their
+    LANE_WEIGHTS. Lanes with a rate only send while their token bucket
+    has tokens.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, interactive_reserved=INTERACTIVE_RESERVED, lane_weights=None, tenant_weights=None, bulk_max_in_flight=BULK_MAX_IN_FLIGHT, lane_rates=None, rate_path=None):
+        """
+        Args:
+            max_in_flight (int): Requests sent at the same time across all sessions
+            interactive_reserved (int): Slots bulk requests may not use
+            lane_weights (dict): Lane -> share of turns, defaults to LANE_WEIGHTS
+            tenant_weights (dict): Tenant -> share of turns within a lane, 1 if missing
+            bulk_max_in_flight (int): Bulk requests sent at the same time
+            lane_rates (dict): Lane -> requests per second, missing or 0 for no
+                limit, defaults to BULK_REQUESTS_PER_SECOND for the bulk lane
+            rate_path (str): SQLite file of the shared token buckets
+        """
+        self.max_in_flight = max(1, max_in_flight)
+        self.interactive_reserved = min(max(0, interactive_reserved), self.max_in_flight - 1)
+        self.bulk_max_in_flight = max(1, min(bulk_max_in_flight, self.max_in_flight - self.interactive_reserved))
+        self.lane_weights = dict(lane_weights or LANE_WEIGHTS)
+        self.tenant_weights = dict(tenant_weights or {})
+        self.lane_rates = {BULK: BULK_REQUESTS_PER_SECOND} if lane_rates is None else dict(lane_rates)
+        self._buckets = {
+            lane: TokenBucket(f"lane:{lane}", rate, path=rate_path)
+            for lane, rate in self.lane_rates.items() if rate
+        }
+        # Lane -> monotonic time its bucket has a token again
+        self._blocked_until = {lane: 0.0 for lane in LANES}
+        self._cond = threading.Condition()
+        self._order = itertools.count()
+        self._queues = {lane: [] for lane in LANES}
+        self._in_flight = {lane: 0 for lane in LANES}
+        # Virtual clock of each lane and the lanes' own turn counters
+        self._virtual_time = {lane: 0.0 for lane in LANES}
+        self._lane_pass = {lane: 0.0 for lane in LANES}
+        # (lane, tenant) -> finish tag of the tenant's latest request
+        self._tenant_finish = {}
+        # (lane, tenant) -> requests and credits served since the process started
+        self._served = {}
+
+    @classmethod
+    def from_config(cls, config=None):
+        """
+        Build a dispatcher from the fair_share secrets section
+
+        Args:
+            config (dict): May set max_in_flight, interactive_reserved,
+                bulk_max_in_flight, bulk_requests_per_second (0 disables pacing)
+                and weights (tenant -> weight)
+
+        Returns:
+            RequestDispatcher: The configured dispatcher
+        """
+        config = config or {}
+        options = {key: config[key] for key in ('max_in_flight', 'interactive_reserved', 'bulk_max_in_flight') if key in config}
+        if 'bulk_requests_per_second' in config:
+            options['lane_rates'] = {BULK: config['bulk_requests_per_second']}
+        return cls(tenant_weights=dict(config.get('weights', {})), **options)
+
+    @contextmanager
+    def slot(self, lane, tenant, cost=1, wait_callback=None):
+        """
+        Hold a request slot for the duration of the block
+
+        Args:
+            lane (str): INTERACTIVE or BULK
+            tenant (str): User or project the request is made for
+            cost (int): Credits of the request
+            wait_callback (callable): Called every QUEUE_REPORT_INTERVAL seconds
+                while waiting with a dict of lane, ahead (requests of the lane
+                served first) and in_flight (requests being sent)
+        """
+        ticket = self._enqueue(lane, tenant, cost)
+        try:
+            self._wait(ticket, wait_callback)
+            yield
+        finally:
+            self._release(ticket)
+
+    def stats(self):
+        """
+        Queue lengths and service per lane and tenant
+
+        Returns:
+            dict: 'lanes' (lane -> queued and in_flight) and 'tenants', a list
+                of dicts with lane, tenant, queued, requests and credits
+        """
+        with self._cond:
+            queued = {}
+            for lane, queue in self._queues.items():
+                for ticket in queue:
+                    queued[(lane, ticket.tenant)] = queued.get((lane, ticket.tenant), 0) + 1
+            tenants = [
+                {
+                    'lane': lane,
+                    'tenant': tenant,
+                    'queued': queued.get((lane, tenant), 0),
+                    'requests': self._served.get((lane, tenant), (0, 0))[0],
+                    'credits': self._served.get((lane, tenant), (0, 0))[1],
+                }
+                for lane, tenant in sorted(set(queued) | set(self._served), key=lambda item: (item[0], str(item[1])))
+            ]
+            return {
+                'lanes': {
+                    lane: {'queued': len(self._queues[lane]), 'in_flight': self._in_flight[lane]}
+                    for lane in LANES
+                },
+                'tenants': tenants,
+            }
+
+    def _enqueue(self, lane, tenant, cost):
+        """Tag a request with its virtual finish time and queue it"""
+        if lane not in self._queues:
+            raise ValueError(f"Unknown lane: {lane}")
+        with self._cond:
+            if not self._queues[lane] and not self._in_flight[lane]:
+                # An idle lane does not bank turns for the time it was idle
+                busy = [self._lane_pass[other] for other in LANES if other != lane and (self._queues[other] or self._in_flight[other])]
+                self._lane_pass[lane] = max([self._lane_pass[lane]] + busy)
+
+            weight = max(self.tenant_weights.get(tenant, 1), 1e-6)
+            start = max(self._virtual_time[lane], self._tenant_finish.get((lane, tenant), 0.0))
+            finish = start + max(cost, 1) / weight
+            self._tenant_finish[(lane, tenant)] = finish
+
+            ticket = _Ticket(lane, tenant, max(cost, 1), start, finish, next(self._order))
+            heapq.heappush(self._queues[lane], ticket)
+            self._dispatch()
+            return ticket
+
+    def _wait(self, ticket, wait_callback):
+        """Block until the ticket is granted, reporting its position meanwhile"""
+        while True:
+            with self._cond:
+                if ticket.granted:
+                    return
+                self._cond.wait(self._wait_timeout(wait_callback))
+                if not ticket.granted:
+                    # Nobody is woken when a bucket refills, so waiters retry themselves
+                    self._dispatch()
+                if ticket.granted:
+                    return
+                position = self._position(ticket)
+            # Reported without the lock, the callback may update the UI
+            if wait_callback:
+                wait_callback(position)
+
+    def _release(self, ticket):
+        """Free a granted slot, or drop a request that stopped waiting"""
+        with self._cond:
+            if ticket.granted:
+                self._in_flight[ticket.lane] -= 1
+            else:
+                queue = self._queues[ticket.lane]
+                queue.remove(ticket)
+                heapq.heapify(queue)
+            self._dispatch()
+
+    def _wait_timeout(self, wait_callback):
+        """Seconds a waiter sleeps before checking again, None to wait for a release"""
+        timeouts = [QUEUE_REPORT_INTERVAL] if wait_callback else []
+        now = time.monotonic()
+        # Only lanes waiting on their bucket need a wake-up, lanes waiting on a
+        # slot are woken by the release that frees it
+        timeouts.extend(
+            self._blocked_until[lane] - now
+            for lane in LANES if self._queues[lane] and self._blocked_until[lane] > now
+        )
+        return min(timeouts, default=None)
+
+    def _dispatch(self):
+        """Grant free slots to waiting requests, called with the lock held"""
+        granted = False
+        while True:
+            lane = self._next_lane()
+            if lane is None:
+                break
+            bucket = self._buckets.get(lane)
+            if bucket is not None:
+                wait = bucket.take()
+                if wait > 0:
+                    self._blocked_until[lane] = time.monotonic() + wait
+                    continue
+            ticket = heapq.heappop(self._queues[lane])
+            ticket.granted = True
+            self._in_flight[lane] += 1
+            self._virtual_time[lane] = max(self._virtual_time[lane], ticket.start)
+            self._lane_pass[lane] += ticket.cost / self.lane_weights.get(lane, 1)
+            requests, credits = self._served.get((lane, ticket.tenant), (0, 0))
+            self._served[(lane, ticket.tenant)] = (requests + 1, credits + ticket.cost)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _next_lane(self):
+        """Lane allowed to send next, None if no slot is free for a waiting request"""
+        in_flight = sum(self._in_flight.values())
+        if in_flight >= self.max_in_flight:
+            return None
+        now = time.monotonic()
+        candidates = [lane for lane in LANES if self._queues[lane] and self._blocked_until[lane] <= now]
+        if BULK in candidates and self._in_flight[BULK] >= self.bulk_max_in_flight:
+            candidates.remove(BULK)
+        return min(candidates, key=lambda lane: self._lane_pass[lane], default=None)
+
+    def _position(self, ticket):
+        """Queue position of a ticket, called with the lock held"""
+        return {
+            'lane': ticket.lane,
+            'ahead': sum(1 for other in self._queues[ticket.lane] if other < ticket),
+            'in_flight': sum(self._in_flight.values()),
+        }
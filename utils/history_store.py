@@ -0,0 +1,376 @@
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from utils.storage import get_data_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project TEXT,
+    started_at TEXT NOT NULL,
+    search_type TEXT NOT NULL,
+    location TEXT NOT NULL,
+    result_size INTEGER NOT NULL,
+    max_depth INTEGER,
+    keyword_count INTEGER NOT NULL,
+    error_count INTEGER NOT NULL,
+    credits_used INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rankings (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    keyword TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    rank INTEGER,
+    url TEXT,
+    image_url TEXT
+);
+CREATE INDEX IF NOT EXISTS rankings_run ON rankings(run_id);
+CREATE INDEX IF NOT EXISTS rankings_keyword_domain ON rankings(keyword, domain);
+CREATE INDEX IF NOT EXISTS rankings_domain_keyword ON rankings(domain, keyword);
+CREATE INDEX IF NOT EXISTS runs_scope ON runs(location, search_type, started_at);
+CREATE TABLE IF NOT EXISTS ranking_hits (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    keyword TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    url TEXT
+);
+CREATE INDEX IF NOT EXISTS ranking_hits_run ON ranking_hits(run_id);
+CREATE INDEX IF NOT EXISTS ranking_hits_domain_keyword ON ranking_hits(domain, keyword);
+CREATE TABLE IF NOT EXISTS rank_rollups (
+    granularity TEXT NOT NULL,
+    location TEXT NOT NULL,
+    search_type TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    period TEXT NOT NULL,
+    rank_sum INTEGER NOT NULL,
+    rank_count INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    best_rank INTEGER,
+    PRIMARY KEY (granularity, location, search_type, domain, keyword, period)
+) WITHOUT ROWID;
+"""
+
+# Rollup periods, each keyed by the first day of the period
+GRANULARITIES = ("day", "week")
+# Keyword value of the rollup rows aggregated over all keywords of a domain
+ALL_KEYWORDS = "*"
+
+_UPSERT_ROLLUP = """
+INSERT INTO rank_rollups (granularity, location, search_type, domain, keyword, period, rank_sum, rank_count, samples, best_rank)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (granularity, location, search_type, domain, keyword, period) DO UPDATE SET
+    rank_sum = rank_sum + excluded.rank_sum,
+    rank_count = rank_count + excluded.rank_count,
+    samples = samples + excluded.samples,
+    best_rank = CASE
+        WHEN best_rank IS NULL THEN excluded.best_rank
+        WHEN excluded.best_rank IS NULL THEN best_rank
+        ELSE MIN(best_rank, excluded.best_rank)
+    END
+"""
+
+
+def period_start(day, granularity):
+    """Return the first day of the rollup period containing a date"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+class HistoryStore:
+    """
+    Persistent history of rank runs in a local SQLite database
+
+    Every stored run is also folded into daily and weekly rollups per
+    (location, search type, domain, keyword) and per domain over all
+    keywords, so trend charts read pre-aggregated rows instead of raw
+    rankings.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_data_path("history.sqlite3")
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+            # Databases created before rollups existed are backfilled once
+            needs_backfill = (
+                connection.execute("SELECT 1 FROM rank_rollups LIMIT 1").fetchone() is None
+                and connection.execute("SELECT 1 FROM rankings LIMIT 1").fetchone() is not None
+            )
+        if needs_backfill:
+            self.rebuild_rollups()
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection, committing on success and always closing it"""
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA foreign_keys = ON")
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def record_run(self, run, domains, keywords, search_type, location, result_size, max_depth=None, project=None, started_at=None):
+        """
+        Save the output of RankTracker.track
+
+        Args:
+            run (dict): The run output
+            domains (list): List of domains
+            keywords (list): List of keywords
+            search_type (str): Type of search (search, images)
+            location (str): Location for search results
+            result_size (int): Number of results per page
+            max_depth (int): Deepest rank looked for, if paginating
+            project (str): Name of the scheduled project, None for interactive runs
+            started_at (datetime): Start time of the run, defaults to now
+
+        Returns:
+            int: The id of the stored run
+        """
+        started_at = (started_at or datetime.now()).isoformat(timespec="seconds")
+        results = run['results']
+
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO runs (project, started_at, search_type, location, result_size, max_depth, keyword_count, error_count, credits_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    project, started_at, search_type, location, result_size, max_depth,
+                    len(keywords), len(run['errors']), run.get('usage', {}).get('credits_used', 0)
+                )
+            )
+            run_id = cursor.lastrowid
+
+            rows = []
+            for keyword in keywords:
+                if keyword not in results:
+                    # Not fetched, do not record it as lost
+                    continue
+                for domain in domains:
+                    hit = results[keyword].get(domain)
+                    if hit is None:
+                        rows.append((run_id, keyword, domain, None, None, None))
+                    else:
+                        rows.append((run_id, keyword, domain, hit.rank, hit.url, hit.image_url))
+            connection.executemany(
+                "INSERT INTO rankings (run_id, keyword, domain, rank, url, image_url) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            # Every position of domains with more than one result, rankings holds the first
+            connection.executemany(
+                "INSERT INTO ranking_hits (run_id, keyword, domain, rank, url) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (run_id, keyword, domain, hit.rank, hit.url)
+                    for keyword, keyword_hits in run.get('hits', {}).items()
+                    for domain, domain_hits in keyword_hits.items()
+                    if len(domain_hits) > 1
+                    for hit in domain_hits
+                )
+            )
+            self._add_to_rollups(connection, rows, location, search_type, datetime.fromisoformat(started_at).date())
+
+        return run_id
+
+    def _add_to_rollups(self, connection, rows, location, search_type, day):
+        """Fold one run's rankings into the daily and weekly rollups"""
+        # Per domain totals over all keywords, so domain trends read one row per period
+        domain_totals = {}
+        for _, _, domain, rank, _, _ in rows:
+            totals = domain_totals.setdefault(domain, [0, 0, 0, None])
+            totals[2] += 1
+            if rank is not None:
+                totals[0] += rank
+                totals[1] += 1
+                totals[3] = rank if totals[3] is None else min(totals[3], rank)
+
+        for granularity in GRANULARITIES:
+            period = period_start(day, granularity).isoformat()
+            connection.executemany(_UPSERT_ROLLUP, (
+                (granularity, location, search_type, domain, keyword, period,
+                 rank or 0, 0 if rank is None else 1, 1, rank)
+                for _, keyword, domain, rank, _, _ in rows
+            ))
+            connection.executemany(_UPSERT_ROLLUP, (
+                (granularity, location, search_type, domain, ALL_KEYWORDS, period, *totals)
+                for domain, totals in domain_totals.items()
+            ))
+
+    def rebuild_rollups(self):
+        """Recompute all rollups from the stored rankings"""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM rank_rollups")
+            runs = connection.execute("SELECT id, started_at, location, search_type FROM runs").fetchall()
+            for run in runs:
+                rows = connection.execute(
+                    "SELECT run_id, keyword, domain, rank, url, image_url FROM rankings WHERE run_id = ?",
+                    (run['id'],)
+                ).fetchall()
+                self._add_to_rollups(
+                    connection, [tuple(row) for row in rows], run['location'], run['search_type'],
+                    datetime.fromisoformat(run['started_at']).date()
+                )
+
+    def get_trend(self, domains, location, search_type, start, end=None, keywords=None, max_points=400):
+        """
+        Read rank trends from the rollups, downsampled to a point budget
+
+        Daily rollups are used while the range fits in max_points, weekly
+        rollups otherwise. If even the weekly series is too long, consecutive
+        weeks are merged into larger buckets.
+
+        Args:
+            domains (list): Domains to include
+            location (str): Location for search results
+            search_type (str): Type of search (search, images)
+            start (date): First day of the range
+            end (date): Last day of the range, defaults to today
+            keywords (list): Keywords to return individually, None returns
+                one series per domain aggregated over all keywords
+            max_points (int): Maximum number of points per series
+
+        Returns:
+            list: Dictionaries with period, domain, keyword, avg_rank,
+                best_rank, found and samples
+        """
+        end = end or date.today()
+        span_days = (end - start).days + 1
+        granularity = "day" if span_days <= max_points else "week"
+        period_days = 1 if granularity == "day" else 7
+        first_period = period_start(start, granularity)
+        # Merge consecutive periods when the series would exceed the budget
+        bucket_size = max(1, -(-span_days // (period_days * max_points)))
+
+        keyword_values = list(keywords) if keywords is not None else [ALL_KEYWORDS]
+        domain_marks = ",".join("?" * len(domains))
+        keyword_marks = ",".join("?" * len(keyword_values))
+        query = f"""
+            SELECT domain, keyword,
+                CAST((julianday(period) - julianday(?)) / ? AS INTEGER) AS bucket,
+                MIN(period) AS period,
+                SUM(rank_sum) AS rank_sum,
+                SUM(rank_count) AS found,
+                SUM(samples) AS samples,
+                MIN(best_rank) AS best_rank
+            FROM rank_rollups
+            WHERE granularity = ? AND location = ? AND search_type = ?
+                AND domain IN ({domain_marks}) AND keyword IN ({keyword_marks})
+                AND period BETWEEN ? AND ?
+            GROUP BY domain, keyword, bucket
+            ORDER BY domain, keyword, bucket
+        """
+        params = [
+            first_period.isoformat(), period_days * bucket_size,
+            granularity, location, search_type,
+            *domains, *keyword_values,
+            first_period.isoformat(), end.isoformat()
+        ]
+
+        with self._connect() as connection:
+            rows = connection.execute(query, params).fetchall()
+
+        return [
+            {
+                'period': row['period'],
+                'domain': row['domain'],
+                'keyword': None if row['keyword'] == ALL_KEYWORDS else row['keyword'],
+                'avg_rank': row['rank_sum'] / row['found'] if row['found'] else None,
+                'best_rank': row['best_rank'],
+                'found': row['found'],
+                'samples': row['samples'],
+            }
+            for row in rows
+        ]
+
+    def get_url_changes(self, domains, location, search_type, start=None):
+        """
+        Find keywords whose ranking URL of a domain changed between runs
+
+        Each run is compared with the previous run in which the domain was
+        found for the keyword, using the first URL of the domain.
+
+        Args:
+            domains (list): Domains to include
+            location (str): Location for search results
+            search_type (str): Type of search (search, images)
+            start (date): Only compare runs from this day on, None for all runs
+
+        Returns:
+            list: Dictionaries with keyword, domain, started_at, url, rank,
+                previous_url and previous_rank, ordered by domain and keyword
+        """
+        domain_marks = ",".join("?" * len(domains))
+        query = f"""
+            SELECT * FROM (
+                SELECT k.keyword, k.domain, r.started_at, k.url, k.rank,
+                    LAG(k.url) OVER scope AS previous_url,
+                    LAG(k.rank) OVER scope AS previous_rank
+                FROM rankings k JOIN runs r ON r.id = k.run_id
+                WHERE r.location = ? AND r.search_type = ? AND r.started_at >= ?
+                    AND k.domain IN ({domain_marks}) AND k.url IS NOT NULL
+                WINDOW scope AS (PARTITION BY k.domain, k.keyword ORDER BY r.started_at, r.id)
+            )
+            WHERE previous_url IS NOT NULL AND previous_url != url
+            ORDER BY domain, keyword, started_at
+        """
+        params = [location, search_type, start.isoformat() if start else "", *domains]
+
+        with self._connect() as connection:
+            return [dict(row) for row in connection.execute(query, params)]
+
+    def get_latest_ranks(self, domains, location, search_type):
+        """
+        Latest stored rank of every keyword and domain
+
+        Each keyword is taken from the newest run that checked it, so keywords
+        skipped by later runs keep their last known rank. One grouped pass over
+        the (domain, keyword) index, loaded once before a run so every result
+        can be compared with a dictionary lookup.
+
+        Args:
+            domains (list): Domains to include
+            location (str): Location for search results
+            search_type (str): Type of search (search, images)
+
+        Returns:
+            dict: Keyword -> domain -> rank, None if the domain was not found
+        """
+        domain_marks = ",".join("?" * len(domains))
+        # SQLite takes the bare rank column from the row with the largest run id
+        query = f"""
+            SELECT k.keyword, k.domain, k.rank, MAX(k.run_id) AS run_id
+            FROM rankings k JOIN runs r ON r.id = k.run_id
+            WHERE r.location = ? AND r.search_type = ? AND k.domain IN ({domain_marks})
+            GROUP BY k.domain, k.keyword
+        """
+        latest = {}
+        with self._connect() as connection:
+            for row in connection.execute(query, [location, search_type, *domains]):
+                latest.setdefault(row['keyword'], {})[row['domain']] = row['rank']
+        return latest
+
+    def list_runs(self, project=None, limit=50):
+        """
+        List the most recent runs
+
+        Args:
+            project (str): Only list runs of this project
+            limit (int): Maximum number of runs
+
+        Returns:
+            list: Dictionaries describing each run, newest first
+        """
+        query = "SELECT * FROM runs"
+        params = []
+        if project is not None:
+            query += " WHERE project = ?"
+            params.append(project)
+        query += " ORDER BY started_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._connect() as connection:
+            return [dict(row) for row in connection.execute(query, params)]
@@ -0,0 +1,354 @@
+"""
+Pool of Serper API keys with weighted round-robin selection
+
+Keys are configured in secrets, either as the single ``serper`` key or as a
+list under ``serper_keys``::
+
+    [api_keys]
+    serper_keys = [
+        { key = "first-key", weight = 3 },
+        { key = "second-key", weight = 1, credit_limit = 2500 },
+    ]
+
+or comma separated in the SERPER_API_KEYS environment variable.
+
+With a CreditLedger attached, every key's spend is written to the ledger
+as it happens and loaded back by refresh_spend, so credit limits hold
+across restarts and rebuilt pools.
+"""
+import hashlib
+import os
+import threading
+import time
+
+import requests
+
+# Quarantine of a rate limited key when the response has no Retry-After, doubled on repeats
+RATE_LIMIT_COOLDOWN = 60
+MAX_RATE_LIMIT_COOLDOWN = 15 * 60
+
+
+class KeyPoolExhausted(requests.exceptions.RequestException):
+    """No API key is currently usable"""
+
+    def __init__(self, message, retry_at=None):
+        super().__init__(message)
+        # Monotonic time the next quarantined key is released, None if never
+        self.retry_at = retry_at
+
+
+def key_id(key):
+    """Stable id of an API key for the ledger, so the key itself is never written to disk"""
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+class ApiKey:
+    """One API key with its selection weight, limits and usage stats"""
+
+    def __init__(self, key, weight=1, credit_limit=None, name=None):
+        self.key = key
+        self.id = key_id(key)
+        self.weight = max(1, int(weight))
+        self.credit_limit = credit_limit
+        self.name = name or f"…{key[-4:]}"
+        # Smooth weighted round-robin state
+        self.current_weight = 0
+        # Usage of the pool, plus earlier spend once loaded from a ledger
+        self.requests = 0
+        self.credits = 0
+        self.bytes = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.last_status = None
+        # Quarantine: invalid keys stay out, rate limited keys until quarantined_until
+        self.invalid = False
+        self.quarantined_until = 0
+        self.cooldown = 0
+
+    def available(self, now):
+        """Whether the key may be used right now"""
+        if self.invalid or self.quarantined_until > now:
+            return False
+        return self.credit_limit is None or self.credits < self.credit_limit
+
+    def status(self, now=None):
+        """Short human readable state"""
+        now = now or time.monotonic()
+        if self.invalid:
+            return "invalid"
+        if self.quarantined_until > now:
+            return f"rate limited ({self.quarantined_until - now:.0f}s left)"
+        if self.credit_limit is not None and self.credits >= self.credit_limit:
+            return "credit limit reached"
+        return "active"
+
+
+class KeyPool:
+    """
+    Thread-safe pool of API keys shared by every request of a process
+
+    Keys are picked with smooth weighted round-robin, so a key of weight 3
+    serves three requests for every one of a weight 1 key, interleaved
+    rather than in bursts. A key answering 401 or 403 is taken out for good,
+    a key answering 429 is quarantined for its Retry-After (or an
+    increasing cooldown), and keys that reached their credit limit are
+    skipped.
+    """
+
+    def __init__(self, keys=(), ledger=None):
+        """
+        Args:
+            keys (list): Keys or key settings, see add
+            ledger (CreditLedger): Records the spend of every key, None keeps it in memory
+        """
+        self.keys = []
+        self.ledger = ledger
+        self._lock = threading.Lock()
+        for key in keys:
+            self.add(key)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    def add(self, key, weight=1, credit_limit=None, name=None):
+        """
+        Add a key, ignoring empty and duplicate keys
+
+        Args:
+            key (str or dict): The key, or a dict with key, weight, credit_limit and name
+            weight (int): Share of requests relative to the other keys
+            credit_limit (int): Stop using the key after this many credits
+            name (str): Label shown in stats, defaults to the last characters of the key
+        """
+        if isinstance(key, dict):
+            return self.add(key.get('key'), key.get('weight', 1), key.get('credit_limit'), key.get('name'))
+        if not key or any(existing.key == key for existing in self.keys):
+            return
+        with self._lock:
+            self.keys.append(ApiKey(key, weight, credit_limit, name))
+
+    @staticmethod
+    def read_config(config=None, environ=None):
+        """
+        Key settings from the api_keys secrets section and the environment
+
+        Args:
+            config (dict): The api_keys section of the secrets
+            environ (dict): Environment variables, defaults to os.environ
+
+        Returns:
+            list: Dicts with key, weight, credit_limit and name, in pool order
+        """
+        environ = os.environ if environ is None else environ
+        config = config or {}
+        keys = [dict(key) if not isinstance(key, str) else key for key in config.get('serper_keys') or []]
+        keys.append(config.get('serper'))
+        keys.extend(key.strip() for key in (environ.get('SERPER_API_KEYS') or "").split(","))
+        keys.append(environ.get('SERPER_API_KEY'))
+
+        configs = []
+        seen = set()
+        for key in keys:
+            key = key if isinstance(key, dict) else {'key': key}
+            if not key.get('key') or key['key'] in seen:
+                continue
+            seen.add(key['key'])
+            configs.append({
+                'key': key['key'],
+                'weight': key.get('weight', 1),
+                'credit_limit': key.get('credit_limit'),
+                'name': key.get('name'),
+            })
+        return configs
+
+    @classmethod
+    def from_config(cls, config=None, environ=None, ledger=None):
+        """
+        Build a pool from the api_keys secrets section and the environment
+
+        Args:
+            config (dict): The api_keys section of the secrets
+            environ (dict): Environment variables, defaults to os.environ
+            ledger (CreditLedger): Records and restores the spend of every key
+
+        Returns:
+            KeyPool: Pool with every configured key and its recorded spend
+        """
+        pool = cls(cls.read_config(config, environ), ledger)
+        pool.refresh_spend()
+        return pool
+
+    def sync(self, configs):
+        """
+        Apply key settings read again from secrets
+
+        Known keys keep their usage and quarantine, new keys are added and
+        keys no longer configured are dropped. Recorded spend is reloaded.
+
+        Args:
+            configs (list): Output of read_config
+        """
+        with self._lock:
+            existing = {key.key: key for key in self.keys}
+            keys = []
+            for config in configs:
+                key = existing.get(config['key'])
+                if key is None:
+                    key = ApiKey(config['key'], config.get('weight', 1), config.get('credit_limit'), config.get('name'))
+                else:
+                    key.weight = max(1, int(config.get('weight', 1)))
+                    key.credit_limit = config.get('credit_limit')
+                    key.name = config.get('name') or f"…{key.key[-4:]}"
+                keys.append(key)
+            self.keys = keys
+        self.refresh_spend()
+
+    def refresh_spend(self):
+        """Load every key's spend from the ledger, including other processes' requests"""
+        if self.ledger is None or not self.keys:
+            return
+        spend = self.ledger.key_spend([key.id for key in self.keys])
+        with self._lock:
+            for key in self.keys:
+                recorded = spend.get(key.id)
+                if recorded is None:
+                    continue
+                # In-memory counts may be ahead of a ledger write still in progress
+                key.requests = max(key.requests, recorded['requests'])
+                key.credits = max(key.credits, recorded['credits'])
+                key.bytes = max(key.bytes, recorded['bytes'])
+
+    def configs(self):
+        """
+        Key settings as plain dicts, e.g. to build the same pool in a worker process
+
+        Returns:
+            list: Dicts with key, weight, credit_limit, name and credits (spent so far)
+        """
+        return [
+            {'key': key.key, 'weight': key.weight, 'credit_limit': key.credit_limit, 'name': key.name, 'credits': key.credits}
+            for key in self.keys
+        ]
+
+    def acquire(self):
+        """
+        Pick the next key by smooth weighted round-robin
+
+        Returns:
+            ApiKey: The key to use
+
+        Raises:
+            KeyPoolExhausted: If no key is usable right now
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [key for key in self.keys if key.available(now)]
+            if not candidates:
+                raise KeyPoolExhausted(self._exhausted_message(), self._next_release(now))
+
+            total = 0
+            best = None
+            for key in candidates:
+                key.current_weight += key.weight
+                total += key.weight
+                if best is None or key.current_weight > best.current_weight:
+                    best = key
+            best.current_weight -= total
+            return best
+
+    def record_success(self, key, credits, byte_count):
+        """Add a successful request to the key's stats and the ledger"""
+        with self._lock:
+            key.requests += 1
+            key.credits += credits
+            key.bytes += byte_count
+            key.last_status = 200
+            key.cooldown = 0
+        if self.ledger is not None:
+            self.ledger.add_key_spend(key.id, credits, byte_count)
+
+    def record_failure(self, key, status_code, retry_after=None):
+        """
+        Record a failed request, quarantining the key on 401, 403 and 429
+
+        Args:
+            key (ApiKey): The key that was used
+            status_code (int): HTTP status, None for connection errors
+            retry_after (float): Seconds from a Retry-After header
+
+        Returns:
+            bool: True if the key was quarantined and another key should be tried
+        """
+        with self._lock:
+            key.failures += 1
+            key.last_status = status_code
+            if status_code in (401, 403):
+                key.invalid = True
+                return True
+            if status_code == 429:
+                key.rate_limited += 1
+                key.cooldown = min(max(key.cooldown * 2, RATE_LIMIT_COOLDOWN), MAX_RATE_LIMIT_COOLDOWN)
+                key.quarantined_until = time.monotonic() + (retry_after if retry_after else key.cooldown)
+                return True
+            return False
+
+    def release_quarantine(self):
+        """Make every quarantined key usable again"""
+        with self._lock:
+            for key in self.keys:
+                key.invalid = False
+                key.quarantined_until = 0
+                key.cooldown = 0
+
+    def stats(self):
+        """
+        Usage of every key
+
+        Returns:
+            list: Dicts with name, weight, status, requests, credits, bytes,
+                failures and rate_limited
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    'name': key.name,
+                    'weight': key.weight,
+                    'status': key.status(now),
+                    'requests': key.requests,
+                    'credits': key.credits,
+                    'credit_limit': key.credit_limit,
+                    'bytes': key.bytes,
+                    'failures': key.failures,
+                    'rate_limited': key.rate_limited,
+                }
+                for key in self.keys
+            ]
+
+    def _next_release(self, now):
+        """Monotonic time the first rate limited key becomes usable, None if none will"""
+        releases = [
+            key.quarantined_until for key in self.keys
+            if not key.invalid and key.quarantined_until > now
+            and (key.credit_limit is None or key.credits < key.credit_limit)
+        ]
+        return min(releases, default=None)
+
+    def _exhausted_message(self):
+        if not self.keys:
+            return "API key is required"
+        return "No usable API key: " + ", ".join(f"{key.name} {key.status()}" for key in self.keys)
+
+
+def parse_retry_after(response):
+    """Seconds to wait from a response's Retry-After header, None if absent or a date"""
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,175 @@
+"""
+Keyword clustering by shared ranking URLs
+
+Keywords whose top results share many URLs answer the same search intent
+and are usually served best by one page. Comparing every pair of URL sets
+is O(n²), too slow for tens of thousands of keywords, so pairs are found
+with MinHash locality-sensitive hashing:
+
+- every keyword's top URL set gets a MinHash signature of NUM_PERM values,
+  equal at each position with probability equal to the sets' Jaccard
+  similarity
+- signatures are cut into BANDS bands, keywords with an identical band
+  land in the same bucket and become candidate pairs
+- candidates are checked against their exact Jaccard similarity and
+  joined into clusters with a union-find
+
+Each band is bucketed and dropped before the next, so memory stays at the
+signatures plus one band's buckets.
+"""
+import hashlib
+
+from utils.cannibalization import normalize_url
+
+# Top results whose URLs describe a keyword's SERP
+DEFAULT_DEPTH = 10
+# Jaccard similarity of two URL sets to join their keywords, about 5 of 10 URLs shared
+DEFAULT_THRESHOLD = 0.3
+# MinHash values per keyword, split into BANDS bands of NUM_PERM / BANDS rows. Two rows
+# per band find pairs at the default threshold with ~95% probability
+NUM_PERM = 64
+BANDS = 32
+# Earlier bucket members each keyword is checked against, so a URL shared by thousands
+# of keywords does not bring back quadratic work
+MAX_BUCKET_COMPARISONS = 8
+# Mersenne prime of the universal hash functions
+_PRIME = (1 << 31) - 1
+
+
+def url_sets_from_archive(rows, depth=DEFAULT_DEPTH):
+    """
+    Top URL set of each keyword from archived organic results
+
+    Args:
+        rows (iterable): (keyword, position, link) rows grouped by keyword,
+            as yielded by SerpFeatureStore.iter_organic
+        depth (int): Deepest position included
+
+    Returns:
+        dict: Keyword -> frozenset of normalized URLs
+    """
+    url_sets = {}
+    for keyword, position, link in rows:
+        if position <= depth:
+            url_sets.setdefault(keyword, set()).add(normalize_url(link))
+    return {keyword: frozenset(urls) for keyword, urls in url_sets.items()}
+
+
+def jaccard(first, second):
+    """Jaccard similarity of two sets, 0.0 if both are empty"""
+    union = len(first | second)
+    return len(first & second) / union if union else 0.0
+
+
+def _url_hash(url):
+    """Stable 32-bit hash of a URL, unlike hash() it does not change between processes"""
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=4).digest(), "little")
+
+
+def minhash_signatures(url_sets, num_perm=NUM_PERM, seed=1):
+    """
+    MinHash signatures of URL sets
+
+    Args:
+        url_sets (list): Sets of URLs
+        num_perm (int): Hash functions, the signature length
+        seed (int): Seed of the hash functions, signatures only compare under the same seed
+
+    Returns:
+        numpy.ndarray: len(url_sets) x num_perm array of uint32, rows of empty sets are all _PRIME
+    """
+    # numpy comes with pandas, imported only when keywords are clustered
+    import numpy as np
+
+    generator = np.random.default_rng(seed)
+    a = generator.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+    b = generator.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+    signatures = np.full((len(url_sets), num_perm), _PRIME, dtype=np.uint32)
+    for row, urls in enumerate(url_sets):
+        if not urls:
+            continue
+        hashes = np.fromiter((_url_hash(url) for url in urls), dtype=np.uint64, count=len(urls))
+        # a < 2^31 and hashes < 2^32, so a * x + b fits in 64 bits
+        signatures[row] = ((np.outer(a, hashes) + b[:, None]) % _PRIME).min(axis=1)
+    return signatures
+
+
+def _find(parents, item):
+    """Root of an item in the union-find, halving the path on the way"""
+    while parents[item] != item:
+        parents[item] = parents[parents[item]]
+        item = parents[item]
+    return item
+
+
+def cluster_keywords(url_sets, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, bands=BANDS, min_size=2):
+    """
+    Group keywords whose top URLs overlap
+
+    Args:
+        url_sets (dict): Keyword -> set of normalized URLs, see url_sets_from_archive
+        threshold (float): Jaccard similarity needed to join two keywords
+        num_perm (int): MinHash signature length, a multiple of bands
+        bands (int): LSH bands, more bands find less similar pairs
+        min_size (int): Smallest cluster returned
+
+    Returns:
+        list: Clusters, largest first, as dicts with name (the keyword sharing
+            most of the cluster's URLs), keywords, size and shared_urls (URLs
+            ranking for at least half of the keywords, most common first)
+    """
+    keywords = [keyword for keyword, urls in url_sets.items() if urls]
+    sets = [url_sets[keyword] for keyword in keywords]
+    if not keywords:
+        return []
+    signatures = minhash_signatures(sets, num_perm)
+    rows = max(1, num_perm // bands)
+    parents = list(range(len(keywords)))
+
+    for band in range(0, rows * bands, rows):
+        buckets = {}
+        band_keys = signatures[:, band:band + rows]
+        for index in range(len(keywords)):
+            members = buckets.setdefault(band_keys[index].tobytes(), [])
+            for other in members[-MAX_BUCKET_COMPARISONS:]:
+                root, other_root = _find(parents, index), _find(parents, other)
+                if root != other_root and jaccard(sets[index], sets[other]) >= threshold:
+                    parents[root] = other_root
+            members.append(index)
+
+    groups = {}
+    for index in range(len(keywords)):
+        groups.setdefault(_find(parents, index), []).append(index)
+
+    clusters = []
+    for members in groups.values():
+        if len(members) < min_size:
+            continue
+        url_counts = {}
+        for index in members:
+            for url in sets[index]:
+                url_counts[url] = url_counts.get(url, 0) + 1
+        # The keyword whose URLs the rest of the cluster shares most
+        name_index = max(members, key=lambda index: (sum(url_counts[url] for url in sets[index]), -index))
+        shared = sorted(
+            (url for url, count in url_counts.items() if 2 * count >= len(members)),
+            key=lambda url: -url_counts[url]
+        )
+        clusters.append({
+            'name': keywords[name_index],
+            'keywords': [keywords[index] for index in members],
+            'size': len(members),
+            'shared_urls': shared,
+        })
+    clusters.sort(key=lambda cluster: (-cluster['size'], cluster['name']))
+    return clusters
+
+
+def cluster_labels(clusters):
+    """
+    Cluster name of every clustered keyword, for the Cluster column of result tables
+
+    Returns:
+        dict: Keyword -> cluster name
+    """
+    return {keyword: cluster['name'] for cluster in clusters for keyword in cluster['keywords']}
@@ -0,0 +1,262 @@
+import heapq
+from itertools import count
+
+from utils.keyword_import import normalize_keyword
+from utils.serp_features import tokenize
+
+# Keywords fetched together in one tracking run between frontier updates
+WAVE_SIZE = 20
+
+# Where a discovered keyword came from
+DISCOVERY_SOURCES = {
+    'seed': "Seed",
+    'related_search': "Related Search",
+    'people_also_ask': "People Also Ask",
+}
+
+
+def keyword_novelty(keyword, seen_terms):
+    """
+    Share of a keyword's terms not covered by the keywords fetched so far
+
+    Args:
+        keyword (str): Candidate keyword
+        seen_terms (set): Terms of the keywords already fetched
+
+    Returns:
+        float: Novelty from 0 (nothing new) to 1 (only new terms)
+    """
+    terms = tokenize(keyword)
+    if not terms:
+        return 0.0
+    return len(terms - seen_terms) / len(terms)
+
+
+class KeywordDiscovery:
+    """
+    Expands seed keywords through related searches and People Also Ask
+
+    Discovery is a breadth-first crawl over result pages: every fetched
+    keyword contributes its related searches and questions to a frontier.
+    The frontier is a priority queue ordered by novelty, so candidates that
+    add terms not seen yet are fetched first, and it is capped so a wide
+    crawl cannot grow without bound. Keywords are fetched in waves through
+    the rank tracker, which means discovered keywords are ranked for the
+    tracked domains as they are fetched.
+    """
+
+    def __init__(self, rank_tracker):
+        self.rank_tracker = rank_tracker
+
+    def discover(self, seeds, domains, search_type="search", location="United States", language="en", country_code="us", result_size=10, batch_size=1, max_depth=None, expansion_depth=2, max_new_keywords=50, max_credits=None, max_frontier=500, include_questions=True, progress_callback=None, adaptive=False, previous_results=None, result_callback=None, response_callback=None):
+        """
+        Track seed keywords and the keywords discovered from their results
+
+        Args:
+            seeds (list): Keywords to start from, always tracked
+            domains (list): List of domains
+            search_type (str): Type of search, only organic search has related searches
+            location (str): Location for search results
+            language (str): Language code (en, tr, etc.)
+            country_code (str): Country code (us, tr, etc.)
+            result_size (int): Number of results per page (10, 20, 50 or 100)
+            batch_size (int): Number of keywords per API request, 1 disables batching
+            max_depth (int): Deepest rank to look for, None checks the first page only
+            expansion_depth (int): Maximum number of hops from a seed keyword
+            max_new_keywords (int): Maximum number of discovered keywords to fetch
+            max_credits (int): Credit budget of the whole run, None for no limit
+            max_frontier (int): Maximum number of candidates kept in the frontier
+            include_questions (bool): Also expand People Also Ask questions
+            progress_callback (callable): Called with (fraction, text) while fetching
+            adaptive (bool): Start with a small result size and escalate per keyword
+            previous_results (dict): Results of an earlier run used to pick starting sizes
+            result_callback (callable): Passed through to RankTracker.track
+            response_callback (callable): Passed through to RankTracker.track
+
+        Returns:
+            dict: Merged run output like RankTracker.track, plus 'keywords'
+                (seeds and fetched discoveries in fetch order), 'discovered'
+                (keyword, parent, source, depth and novelty of each fetched
+                discovery), 'coverage' (domain -> counts) and 'frontier'
+                (candidates left and dropped)
+        """
+        run = {
+            'results': {},
+            'search_metadata': {},
+            'errors': {},
+            'pages_fetched': 0,
+            'usage': None,
+            'hits': {},
+        }
+        seen = set()
+        seen_terms = set()
+        origins = {}
+        frontier = []
+        order = count()
+        dropped = 0
+
+        wave = []
+        for seed in seeds:
+            keyword, key = normalize_keyword(seed)
+            if keyword is not None and key not in seen:
+                seen.add(key)
+                wave.append(keyword)
+                origins[keyword] = (None, 'seed', 0, 1.0)
+                seen_terms |= tokenize(keyword)
+
+        new_keywords = 0
+        wave_number = 0
+        while wave:
+            wave_number += 1
+            # Each wave may only spend what earlier waves left of the budget
+            wave_budget = None
+            if max_credits is not None:
+                wave_budget = max_credits - (run['usage']['credits_used'] if run['usage'] else 0)
+            wave_run = self.rank_tracker.track(
+                wave, domains, search_type, location, language, country_code, result_size,
+                batch_size=batch_size,
+                max_depth=max_depth,
+                progress_callback=self._wave_progress(progress_callback, wave_number, new_keywords - len(wave), len(wave), max_new_keywords),
+                adaptive=adaptive,
+                previous_results=previous_results,
+                result_callback=result_callback,
+                response_callback=response_callback,
+                max_credits=wave_budget
+            )
+            self._merge(run, wave_run)
+
+            # Queue the related searches and questions of this wave
+            for keyword in wave:
+                depth = origins[keyword][2]
+                if depth >= expansion_depth:
+                    continue
+                for candidate, source in self._candidates(wave_run['search_metadata'].get(keyword), include_questions):
+                    candidate, key = normalize_keyword(candidate)
+                    if candidate is None or key in seen:
+                        continue
+                    seen.add(key)
+                    novelty = keyword_novelty(candidate, seen_terms)
+                    heapq.heappush(frontier, (-novelty, depth + 1, next(order), candidate, keyword, source))
+
+            if len(frontier) > max_frontier:
+                # Keep the most promising candidates, nsmallest returns a valid heap
+                dropped += len(frontier) - max_frontier
+                frontier = heapq.nsmallest(max_frontier, frontier)
+
+            if max_credits is not None and run['usage']['credits_used'] >= max_credits:
+                break
+            wave = self._next_wave(frontier, seen_terms, origins, min(max(WAVE_SIZE, batch_size), max_new_keywords - new_keywords))
+            new_keywords += len(wave)
+
+        fetched = list(origins)
+        run['keywords'] = fetched
+        run['discovered'] = [
+            {
+                'keyword': keyword,
+                'parent': origins[keyword][0],
+                'source': origins[keyword][1],
+                'depth': origins[keyword][2],
+                'novelty': origins[keyword][3],
+            }
+            for keyword in fetched
+            if origins[keyword][1] != 'seed'
+        ]
+        run['coverage'] = self.coverage(run['results'], domains, [item['keyword'] for item in run['discovered']])
+        run['frontier'] = {'remaining': len(frontier), 'dropped': dropped}
+        return run
+
+    @staticmethod
+    def coverage(results, domains, discovered):
+        """
+        Count the keywords each domain ranks for, overall and among discoveries
+
+        Args:
+            results (dict): Keyword -> domain -> RankHit or None
+            domains (list): List of domains
+            discovered (list): Keywords found by discovery rather than given as seeds
+
+        Returns:
+            dict: Domain -> dict with keywords, found, discovered and discovered_found
+        """
+        discovered = set(discovered)
+        coverage = {
+            domain: {'keywords': 0, 'found': 0, 'discovered': 0, 'discovered_found': 0}
+            for domain in domains
+        }
+        for keyword, keyword_results in results.items():
+            is_discovered = keyword in discovered
+            for domain in domains:
+                counts = coverage[domain]
+                found = keyword_results.get(domain) is not None
+                counts['keywords'] += 1
+                counts['found'] += found
+                if is_discovered:
+                    counts['discovered'] += 1
+                    counts['discovered_found'] += found
+        return coverage
+
+    @staticmethod
+    def _candidates(metadata, include_questions):
+        """Yield (text, source) pairs from a keyword's search metadata"""
+        if not metadata:
+            return
+        for item in metadata.get('related_searches') or []:
+            if item.get('query'):
+                yield item['query'], 'related_search'
+        if include_questions:
+            for item in metadata.get('people_also_ask') or []:
+                if item.get('question'):
+                    yield item['question'], 'people_also_ask'
+
+    @staticmethod
+    def _next_wave(frontier, seen_terms, origins, size):
+        """
+        Pop the most novel candidates from the frontier
+
+        Novelty only drops as more terms are seen, so a stale score is an
+        upper bound. A popped candidate is rescored and pushed back if it
+        no longer beats the next one, instead of rescoring the whole heap.
+        """
+        wave = []
+        while frontier and len(wave) < size:
+            item = heapq.heappop(frontier)
+            _, depth, position, keyword, parent, source = item
+            novelty = keyword_novelty(keyword, seen_terms)
+            rescored = (-novelty, depth, position, keyword, parent, source)
+            if frontier and rescored > frontier[0]:
+                heapq.heappush(frontier, rescored)
+                continue
+
+            wave.append(keyword)
+            origins[keyword] = (parent, source, depth, novelty)
+            # Later picks in the same wave should add different terms
+            seen_terms |= tokenize(keyword)
+        return wave
+
+    @staticmethod
+    def _merge(run, wave_run):
+        """Add one wave's tracking output to the combined run"""
+        run['results'].update(wave_run['results'])
+        run['hits'].update(wave_run['hits'])
+        run['search_metadata'].update(wave_run['search_metadata'])
+        run['errors'].update(wave_run['errors'])
+        run['pages_fetched'] += wave_run['pages_fetched']
+        if run['usage'] is None:
+            run['usage'] = dict(wave_run['usage'])
+        else:
+            for key, value in wave_run['usage'].items():
+                run['usage'][key] += value
+
+    @staticmethod
+    def _wave_progress(progress_callback, wave_number, done, wave_length, budget):
+        """Label a wave's progress and map it onto the discovery budget"""
+        if progress_callback is None:
+            return None
+
+        def report(fraction, text):
+            if wave_number == 1:
+                progress_callback(fraction, f"Seed keywords: {text}")
+            else:
+                overall = (done + fraction * wave_length) / budget if budget else 1.0
+                progress_callback(min(overall, 1.0), f"Discovery wave {wave_number}: {text}")
+        return report
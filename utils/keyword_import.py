@@ -0,0 +1,257 @@
+import csv
+import gzip
+import io
+import re
+import zipfile
+import zlib
+from urllib.parse import quote, urlsplit
+
+# Google ignores query words beyond this limit
+MAX_KEYWORD_WORDS = 32
+# Only the first rejects are kept for display, the rest are only counted
+MAX_REPORTED_REJECTS = 100
+
+KEYWORD_HEADERS = {'keyword', 'keywords', 'query', 'queries', 'anahtar kelime'}
+WEIGHT_HEADERS = {'volume', 'search volume', 'searches', 'weight', 'hacim'}
+DOMAIN_HEADERS = {'domain', 'domains', 'url', 'urls', 'site', 'website'}
+
+_LABEL_PATTERN = re.compile(r'^(?!-)[a-z0-9-]{1,63}(?<!-)$')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+# Bytes that are not valid UTF-8 are decoded to these lone surrogates
+_UNDECODABLE_PATTERN = re.compile('[\udc80-\udcff]')
+# Characters left as they are when percent-encoding a tracked path
+_PATH_SAFE = "/%:@!$&'()*+,;=-._~"
+# Raised while reading a damaged gzip, zip (XLSX) or CSV file
+_READ_ERRORS = (OSError, EOFError, zlib.error, zipfile.BadZipFile, KeyError, ValueError, csv.Error)
+
+
+class ImportFileError(Exception):
+    """An uploaded file could not be read"""
+
+
+class ImportReport:
+    """Accepted values and counts from an import"""
+
+    def __init__(self):
+        self.values = []
+        # Value -> weight, for files with a weight (search volume) column
+        self.weights = {}
+        # Non-blank values read
+        self.total = 0
+        self.duplicates = 0
+        self.rejected = 0
+        # (line number, raw value, reason) for the first rejects
+        self.rejects = []
+
+    @property
+    def accepted(self):
+        return len(self.values)
+
+    def summary(self):
+        """One-line summary of the import"""
+        return f"{self.accepted} imported, {self.duplicates} duplicates skipped, {self.rejected} rejected"
+
+
+def normalize_keyword(value):
+    """
+    Normalize a keyword
+
+    Args:
+        value (str): The raw keyword
+
+    Returns:
+        tuple: (keyword, dedup key) on success or (None, reason) if rejected
+    """
+    keyword = _WHITESPACE_PATTERN.sub(' ', value).strip()
+    if not keyword:
+        return None, "empty"
+    if len(keyword.split(' ')) > MAX_KEYWORD_WORDS:
+        return None, f"more than {MAX_KEYWORD_WORDS} words"
+    # Keep the original spelling, queries are sent as entered, but treat
+    # case variants as duplicates
+    return keyword, keyword.casefold()
+
+
+def normalize_domain(value):
+    """
+    Normalize a domain or URL to a lowercase ASCII (punycode) host name and path
+
+    A path is kept as a prefix, so example.com/blog tracks only the results
+    under /blog. Scheme, port, query and fragment are dropped.
+
+    Args:
+        value (str): The raw domain or URL
+
+    Returns:
+        tuple: (host or host/path, dedup key) on success or (None, reason) if rejected
+    """
+    value = value.strip()
+    if not value:
+        return None, "empty"
+
+    # Parse bare domains as network locations so the host and path split apart
+    parts = urlsplit(value if '://' in value else f'//{value}')
+    try:
+        host = parts.hostname
+    except ValueError:
+        host = None
+    if not host:
+        return None, "no host name"
+
+    host = host.rstrip('.')
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        return None, "invalid international domain name"
+
+    labels = host.split('.')
+    if len(labels) < 2 or not all(_LABEL_PATTERN.match(label) for label in labels):
+        return None, "not a valid domain"
+
+    # Percent-encoded like the result URLs it is matched against, without a trailing slash
+    path = quote(parts.path, safe=_PATH_SAFE).rstrip('/')
+    return host + path, host + path
+
+
+def import_values(lines, normalizer):
+    """
+    Normalize and deduplicate values one at a time
+
+    Args:
+        lines (iterable): Raw values, or (raw value, raw weight) pairs, consumed lazily
+        normalizer (callable): normalize_keyword or normalize_domain
+
+    Returns:
+        ImportReport: Accepted values in input order with counts and rejects
+    """
+    report = ImportReport()
+    seen = set()
+
+    for line_number, raw in enumerate(lines, start=1):
+        raw_weight = None
+        if isinstance(raw, tuple):
+            raw, raw_weight = raw
+        if _UNDECODABLE_PATTERN.search(raw):
+            value, key = None, "not valid UTF-8 text"
+            # Shown with replacement characters, lone surrogates cannot be displayed
+            raw = raw.encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')
+        else:
+            value, key = normalizer(raw)
+
+        # Blank lines are skipped silently
+        if value is None and key == "empty":
+            continue
+
+        report.total += 1
+        if value is None:
+            report.rejected += 1
+            if len(report.rejects) < MAX_REPORTED_REJECTS:
+                report.rejects.append((line_number, raw, key))
+            continue
+        if key in seen:
+            report.duplicates += 1
+            continue
+
+        seen.add(key)
+        report.values.append(value)
+        weight = _parse_weight(raw_weight)
+        if weight is not None:
+            report.weights[value] = weight
+
+    return report
+
+
+def _parse_weight(raw_weight):
+    """Parse a weight cell such as '1,200' or '1200.0', None if empty or invalid"""
+    if raw_weight is None:
+        return None
+    try:
+        weight = float(str(raw_weight).replace(',', '').strip())
+    except ValueError:
+        return None
+    return weight if weight >= 0 else None
+
+
+def iter_text_lines(text):
+    """Iterate over the lines of pasted text without building a list"""
+    for match in re.finditer(r'[^\r\n]+', text):
+        yield match.group(0)
+
+
+def iter_file_values(file, file_name, headers=(), weight_headers=None):
+    """
+    Stream values from an uploaded file
+
+    Supports plain text (one value per line), CSV and XLSX files, optionally
+    gzip compressed (.gz). For CSV and XLSX the column whose header matches
+    one of headers is used, otherwise the first column.
+
+    Args:
+        file (file-like): Binary file object, e.g. a Streamlit UploadedFile
+        file_name (str): Original file name, used to detect the format
+        headers (iterable): Lowercase header names identifying the value column
+        weight_headers (iterable): Lowercase header names of an optional weight
+            column; when given, CSV and XLSX rows yield (value, weight) pairs
+
+    Yields:
+        str or tuple: Raw values, or (value, weight) pairs; bytes that are
+            not valid UTF-8 are kept as lone surrogates for import_values to reject
+
+    Raises:
+        ImportFileError: If the file is damaged or not in the format its name says
+    """
+    name = file_name.lower()
+    try:
+        if name.endswith('.gz'):
+            file = gzip.GzipFile(fileobj=file)
+            name = name[:-3]
+
+        if name.endswith('.xlsx'):
+            yield from _iter_xlsx_values(file, headers, weight_headers)
+        elif name.endswith('.csv'):
+            text = io.TextIOWrapper(file, encoding='utf-8-sig', errors='surrogateescape', newline='')
+            yield from _iter_rows_values(csv.reader(text), headers, weight_headers)
+        else:
+            text = io.TextIOWrapper(file, encoding='utf-8-sig', errors='surrogateescape')
+            for line in text:
+                yield line.rstrip('\r\n')
+    except _READ_ERRORS as e:
+        raise ImportFileError(f"Could not read {file_name}: {e}") from e
+
+
+def _iter_xlsx_values(file, headers, weight_headers=None):
+    """Stream the value column of the first worksheet of an XLSX workbook"""
+    # openpyxl is only needed for Excel imports
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = (
+            ['' if cell is None else str(cell) for cell in row]
+            for row in workbook.worksheets[0].iter_rows(values_only=True)
+        )
+        yield from _iter_rows_values(rows, headers, weight_headers)
+    finally:
+        workbook.close()
+
+
+def _iter_rows_values(rows, headers, weight_headers=None):
+    """Pick the value (and optional weight) column from tabular rows, skipping a header row"""
+    column = 0
+    weight_column = None
+    for row_number, row in enumerate(rows):
+        if row_number == 0:
+            header_cells = [cell.strip().lower() for cell in row]
+            matches = [index for index, cell in enumerate(header_cells) if cell in headers]
+            weight_matches = [index for index, cell in enumerate(header_cells) if cell in (weight_headers or ())]
+            if weight_matches:
+                weight_column = weight_matches[0]
+            if matches or weight_matches:
+                column = matches[0] if matches else 0
+                continue
+        value = row[column] if column < len(row) else ''
+        if weight_headers is None:
+            yield value
+        else:
+            weight = row[weight_column] if weight_column is not None and weight_column < len(row) else None
+            yield value, weight
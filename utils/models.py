@@ -0,0 +1,21 @@
+from dataclasses import dataclass
+
+
+@dataclass(slots=True, frozen=True)
+class RankHit:
+    """
+    A domain's ranking for one keyword
+
+    Attributes:
+        rank (int): Ranking position, starting at 1
+        url (str): URL of the ranking result
+        image_url (str): Direct image URL for image search results, empty otherwise
+    """
+    rank: int
+    url: str
+    image_url: str = ""
+
+
+def rank_of(hit):
+    """Return the rank of a RankHit, or None when the domain was not found"""
+    return hit.rank if hit is not None else None
@@ -0,0 +1,302 @@
+import math
+import requests
+
+from utils.api_service import credits_for_request, get_vertical
+
+# Result size used for the first request of each keyword in adaptive mode
+ADAPTIVE_START_SIZE = 10
+
+# Language and country codes for each supported location
+LOCALES = {
+    "Turkey": ("tr", "tr"),
+    "United States": ("en", "us"),
+}
+
+
+def get_locale(location):
+    """
+    Return the language and country code for a location
+
+    Args:
+        location (str): Location for search results
+
+    Returns:
+        tuple: (language, country_code)
+    """
+    return LOCALES.get(location, LOCALES["United States"])
+
+
+class RankTracker:
+    """Runs rank checks for a set of keywords and domains without any UI"""
+
+    def __init__(self, api_service, data_service):
+        self.api_service = api_service
+        self.data_service = data_service
+
+    def track(self, keywords, domains, search_type="search", location="United States", language="en", country_code="us", result_size=10, batch_size=1, max_depth=None, progress_callback=None, adaptive=False, previous_results=None, result_callback=None, response_callback=None, max_credits=None):
+        """
+        Fetch search results for each keyword and find the rank of each domain
+
+        When max_depth is larger than result_size, further pages are fetched
+        only for keywords where at least one domain has not been found yet.
+        Each keyword stops paginating as soon as all domains are resolved, a
+        page comes back empty or the depth limit is reached.
+
+        In adaptive mode the first page is requested with a small result
+        size and re-requested at the full result size only for keywords with
+        unresolved domains. Keywords whose domains were all found deeper in
+        previous_results start at the size that covered them last time.
+
+        With max_credits set, no page is requested once it could take the run
+        over the budget and the keywords left out are reported in 'errors'.
+
+        Args:
+            keywords (list): List of keywords
+            domains (list): List of domains
+            search_type (str): Search vertical (search, images, news, videos, places)
+            location (str): Location for search results
+            language (str): Language code (en, tr, etc.)
+            country_code (str): Country code (us, tr, etc.)
+            result_size (int): Number of results per page (10, 20, 50 or 100)
+            batch_size (int): Number of keywords per API request, 1 disables batching
+            max_depth (int): Deepest rank to look for, None checks the first page only
+            progress_callback (callable): Called with (fraction, text) while fetching
+            adaptive (bool): Start with a small result size and escalate per keyword
+            previous_results (dict): Results of an earlier run used to pick starting sizes
+            result_callback (callable): Called with (keyword, keyword_results) whenever a
+                keyword's ranks are filled in, so aggregates can update incrementally
+            response_callback (callable): Called with (keyword, search_results) for every
+                first-page response, e.g. to index SERP features
+            max_credits (int): Credit budget of the run, None for no limit
+
+        Returns:
+            dict: Run output with 'results' (keyword -> domain -> rank),
+                'search_metadata', 'errors' (keyword -> message),
+                'pages_fetched' (number of keyword pages requested) and
+                'usage' (requests, bytes and credits compared to a fixed-size run)
+                and 'hits' (keyword -> domain -> every RankHit of the domain on
+                the fetched pages, for domains found at least once)
+        """
+        keywords = list(dict.fromkeys(keywords))
+        max_pages = max(1, math.ceil((max_depth or result_size) / result_size))
+        usage_before = dict(self.api_service.usage)
+
+        results = {}
+        hits = {}
+        search_metadata = {}
+        errors = {}
+        pages_fetched = 0
+        # Result slots requested, used to estimate the payload of a fixed-size run
+        first_page_slots = 0
+        deep_page_slots = 0
+        first_page_credits = 0
+
+        # First page, escalating from small result sizes in adaptive mode
+        ladder = self._size_ladder(result_size) if adaptive else [result_size]
+        start_sizes = {
+            keyword: self._start_size(keyword, domains, ladder, previous_results)
+            for keyword in keywords
+        }
+
+        pending = []
+        escalated = []
+        for size in ladder:
+            group = escalated + [keyword for keyword in keywords if start_sizes[keyword] == size]
+            escalated = []
+            group = self._within_budget(group, size, max_credits, usage_before, errors)
+            if not group:
+                continue
+
+            fetched, page_errors = self._fetch_page(
+                group, search_type, location, language, country_code,
+                size, batch_size, 1, progress_callback
+            )
+            pages_fetched += len(group)
+            first_page_slots += size * len(fetched)
+            first_page_credits += credits_for_request(size) * len(fetched)
+
+            for keyword in group:
+                search_results = fetched.get(keyword)
+                if search_results is None:
+                    errors[keyword] = page_errors.get(keyword, "No response")
+                    continue
+
+                if keyword not in results:
+                    results[keyword] = {domain: None for domain in domains}
+                    hits[keyword] = {}
+                    if search_type == "search":
+                        # Save metadata for organic search only
+                        search_metadata[keyword] = {
+                            'related_searches': search_results.get('relatedSearches', []),
+                            'people_also_ask': search_results.get('peopleAlsoAsk', [])
+                        }
+
+                if response_callback:
+                    response_callback(keyword, search_results)
+
+                unresolved = self._match_page(results[keyword], hits[keyword], search_results, search_type, size, 0)
+                if result_callback:
+                    result_callback(keyword, results[keyword])
+                if unresolved:
+                    if size < result_size:
+                        escalated.append(keyword)
+                    else:
+                        pending.append(keyword)
+
+        # Deeper pages at the full result size for keywords still missing domains
+        page = 2
+        while pending and page <= max_pages:
+            offset = (page - 1) * result_size
+            pending = self._within_budget(pending, result_size, max_credits, usage_before, errors)
+            if not pending:
+                break
+            fetched, page_errors = self._fetch_page(
+                pending, search_type, location, language, country_code,
+                result_size, batch_size, page, progress_callback
+            )
+            pages_fetched += len(pending)
+            deep_page_slots += result_size * len(fetched)
+
+            unresolved = []
+            for keyword in pending:
+                search_results = fetched.get(keyword)
+                if search_results is None:
+                    # Keep whatever earlier pages found and stop paginating this keyword
+                    errors[keyword] = f"Page {page}: {page_errors.get(keyword, 'No response')}"
+                    continue
+
+                if self._match_page(results[keyword], hits[keyword], search_results, search_type, result_size, offset):
+                    unresolved.append(keyword)
+                if result_callback:
+                    result_callback(keyword, results[keyword])
+
+            pending = unresolved
+            page += 1
+
+        return {
+            'results': results,
+            'search_metadata': search_metadata,
+            'errors': errors,
+            'pages_fetched': pages_fetched,
+            'usage': self._usage_report(
+                usage_before, len(results), result_size,
+                first_page_slots, deep_page_slots, first_page_credits
+            ),
+            'hits': {keyword: keyword_hits for keyword, keyword_hits in hits.items() if keyword_hits}
+        }
+
+    def _match_page(self, keyword_results, keyword_hits, search_results, search_type, result_size, offset):
+        """
+        Fill in ranks for unresolved domains and collect every hit from one result page
+
+        Returns:
+            bool: True if some domain is still unresolved and the page was not empty
+        """
+        page_hits = self.data_service.match_all_domains(search_results, list(keyword_results), search_type, result_size, offset)
+        for domain, domain_hits in page_hits.items():
+            if not domain_hits:
+                continue
+            if keyword_results[domain] is None:
+                keyword_results[domain] = domain_hits[0]
+            known = keyword_hits.setdefault(domain, [])
+            # An escalated first page repeats the smaller page it replaces
+            known.extend(hit for hit in domain_hits if hit not in known)
+            known.sort(key=lambda hit: hit.rank)
+
+        page_items = search_results.get(get_vertical(search_type)['results'], [])
+        return bool(page_items) and any(rank is None for rank in keyword_results.values())
+
+    def _within_budget(self, keywords, result_size, max_credits, usage_before, errors):
+        """Keep the keywords whose next page still fits the credit budget, reporting the rest"""
+        if max_credits is None:
+            return keywords
+        spent = self.api_service.usage['credits'] - usage_before['credits']
+        affordable = max(0, (max_credits - spent) // credits_for_request(result_size))
+        for keyword in keywords[affordable:]:
+            errors.setdefault(keyword, "Credit budget reached")
+        return keywords[:affordable]
+
+    @staticmethod
+    def _size_ladder(result_size):
+        """Result sizes tried in adaptive mode, smallest first"""
+        if result_size <= ADAPTIVE_START_SIZE:
+            return [result_size]
+        return [ADAPTIVE_START_SIZE, result_size]
+
+    @staticmethod
+    def _start_size(keyword, domains, ladder, previous_results):
+        """Pick the first result size for a keyword from its previous ranks"""
+        previous = (previous_results or {}).get(keyword)
+        if not previous:
+            return ladder[0]
+
+        ranks = []
+        for domain in domains:
+            if domain not in previous:
+                # Domain was not tracked last time, nothing to learn from
+                continue
+            result = previous[domain]
+            if result is None:
+                # Missing last time, the small page is unlikely to be enough
+                return ladder[-1]
+            ranks.append(result.rank)
+
+        deepest = max(ranks, default=0)
+        for size in ladder:
+            if deepest <= size:
+                return size
+        return ladder[-1]
+
+    def _usage_report(self, usage_before, keyword_count, result_size, first_page_slots, deep_page_slots, first_page_credits):
+        """Summarize this run's API usage against a fixed-size run"""
+        usage = {key: self.api_service.usage[key] - usage_before[key] for key in usage_before}
+
+        # A fixed-size run fetches every keyword's first page at the full size
+        # and the same deeper pages
+        fixed_credits = usage['credits'] - first_page_credits + keyword_count * credits_for_request(result_size)
+        fetched_slots = first_page_slots + deep_page_slots
+        fixed_slots = keyword_count * result_size + deep_page_slots
+        estimated_fixed_bytes = round(usage['bytes'] * fixed_slots / fetched_slots) if fetched_slots else 0
+
+        return {
+            'requests': usage['requests'],
+            'bytes_downloaded': usage['bytes'],
+            'credits_used': usage['credits'],
+            'fixed_size_credits': fixed_credits,
+            'credits_saved': fixed_credits - usage['credits'],
+            'cache_hits': usage['cache_hits'],
+            'estimated_fixed_size_bytes': estimated_fixed_bytes
+        }
+
+    def _fetch_page(self, keywords, search_type, location, language, country_code, result_size, batch_size, page, progress_callback):
+        """Fetch one result page for each keyword, batched when enabled"""
+        total = len(keywords)
+        label = f"Page {page}: " if page > 1 else ""
+
+        if batch_size > 1:
+            return self.api_service.get_batch_search_results(
+                keywords, search_type, location, language, country_code, result_size,
+                batch_size=batch_size,
+                progress_callback=lambda done: self._report(progress_callback, done / total, f"{label}Fetched {done} of {total} keywords"),
+                page=page
+            )
+
+        fetched = {}
+        errors = {}
+        for i, keyword in enumerate(keywords):
+            self._report(progress_callback, i / total, f"{label}Processing: {keyword}")
+            try:
+                fetched[keyword] = self.api_service.get_search_results(
+                    keyword, search_type, location, language, country_code, result_size, page
+                )
+            except requests.exceptions.RequestException as e:
+                errors[keyword] = str(e)
+        self._report(progress_callback, 1.0, f"{label}Fetched {total} keywords")
+
+        return fetched, errors
+
+    @staticmethod
+    def _report(progress_callback, fraction, text):
+        """Forward progress to the callback if one was given"""
+        if progress_callback:
+            progress_callback(min(fraction, 1.0), text)
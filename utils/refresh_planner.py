@@ -0,0 +1,256 @@
+"""
+Volatility-aware refresh planning
+
+Most keywords of a large portfolio keep the same SERP for weeks, yet a
+sweep refetches all of them. RefreshPlanner remembers per keyword how much
+its results moved between checks and spaces the checks accordingly:
+
+- every check scores the change against the previous one: rank deltas and
+  ranking URL changes of the tracked domains, and churn of the top 10 URLs
+- the scores are smoothed into a volatility between 0 (never moves) and 1
+- volatile keywords are due every day, stable ones up to every
+  MAX_INTERVAL_DAYS days, with a geometric scale in between
+
+A plan picks the due keywords, most overdue and volatile first, and stops
+at the credit budget. Keywords left over stay due and come first next time.
+"""
+import json
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils.storage import get_data_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keyword_state (
+    location TEXT NOT NULL,
+    search_type TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    checked_at TEXT NOT NULL,
+    checks INTEGER NOT NULL,
+    volatility REAL,
+    ranks TEXT NOT NULL,
+    urls TEXT,
+    PRIMARY KEY (location, search_type, keyword)
+) WITHOUT ROWID;
+"""
+
+# Days between checks of the most stable keywords
+MAX_INTERVAL_DAYS = 14
+# Volatility from which a keyword is checked on every daily sweep
+VOLATILE = 0.3
+# Checks before a keyword's interval may grow, its volatility is a guess before that
+MIN_CHECKS = 3
+# Weight of the latest change in the smoothed volatility
+SMOOTHING = 0.3
+# Rank change that counts as a full change, larger moves are capped
+RANK_DELTA_CAP = 10
+# Change score of a domain ranking with another URL at a similar position
+URL_CHANGE_SCORE = 0.5
+# Top results whose URL churn is measured
+URL_SET_DEPTH = 10
+# Hours a keyword may be checked early, so a sweep at 02:00 still finds yesterday's 02:05 check due
+DUE_TOLERANCE_HOURS = 2
+
+
+def interval_days(volatility, checks):
+    """
+    Days between checks of a keyword
+
+    Args:
+        volatility (float): Smoothed volatility between 0 and 1, None if unknown
+        checks (int): Number of times the keyword was checked
+
+    Returns:
+        float: 1 for volatile or new keywords, up to MAX_INTERVAL_DAYS for stable ones
+    """
+    if volatility is None or checks < MIN_CHECKS or volatility >= VOLATILE:
+        return 1.0
+    return MAX_INTERVAL_DAYS ** (1 - volatility / VOLATILE)
+
+
+def change_score(previous_ranks, ranks, previous_urls=None, urls=None):
+    """
+    How much a keyword's results moved between two checks
+
+    Args:
+        previous_ranks (dict): Domain -> (rank, url) of the previous check, rank None if not found
+        ranks (dict): Domain -> (rank, url) of this check
+        previous_urls (set): Top URLs of the previous check, None if unknown
+        urls (set): Top URLs of this check, None if unknown
+
+    Returns:
+        float: 0 (nothing moved) to 1, the mean of the rank and URL set scores that are known
+    """
+    domain_scores = []
+    for domain in previous_ranks.keys() & ranks.keys():
+        (previous_rank, previous_url), (rank, url) = previous_ranks[domain], ranks[domain]
+        if previous_rank is None and rank is None:
+            continue
+        if previous_rank is None or rank is None:
+            # Entering or leaving the results is the largest change
+            domain_scores.append(1.0)
+            continue
+        score = min(abs(rank - previous_rank), RANK_DELTA_CAP) / RANK_DELTA_CAP
+        if url != previous_url:
+            score = max(score, URL_CHANGE_SCORE)
+        domain_scores.append(score)
+
+    scores = []
+    if domain_scores:
+        scores.append(sum(domain_scores) / len(domain_scores))
+    if previous_urls is not None and urls is not None and (previous_urls or urls):
+        scores.append(1 - len(previous_urls & urls) / len(previous_urls | urls))
+    return sum(scores) / len(scores) if scores else 0.0
+
+
+def top_urls(search_results, depth=URL_SET_DEPTH):
+    """
+    Normalized URLs of the top organic results of a response, for change_score
+
+    Returns:
+        frozenset: The URLs ranking at positions 1 to depth
+    """
+    from utils.cannibalization import normalize_url
+    from utils.serp_features import organic_links
+
+    return frozenset(normalize_url(link) for position, link in organic_links(search_results) if position <= depth)
+
+
+class RefreshPlanner:
+    """
+    Per-keyword check history and volatility, stored in data/refresh.sqlite3
+
+    Keywords are kept per location and search type. Only the latest ranks
+    and top URLs are stored, so a check compares against the previous one
+    with a primary key lookup.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_data_path("refresh.sqlite3")
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection, committing on success and always closing it"""
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def observe(self, location, search_type, results, url_sets=None, checked_at=None):
+        """
+        Record a check of keywords and update their volatility
+
+        Args:
+            location (str): Location for search results
+            search_type (str): Search vertical
+            results (dict): Keyword -> domain -> RankHit or None, as in a run's 'results'
+            url_sets (dict): Keyword -> top URLs from top_urls, organic search only
+            checked_at (datetime): Time of the check, defaults to now
+        """
+        from utils.models import rank_of
+
+        url_sets = url_sets or {}
+        checked_at = (checked_at or datetime.now()).isoformat(timespec="seconds")
+        rows = []
+        with self._connect() as connection:
+            for keyword, keyword_results in results.items():
+                ranks = {
+                    domain: (rank_of(hit), hit.url if hit is not None else None)
+                    for domain, hit in keyword_results.items()
+                }
+                urls = url_sets.get(keyword)
+                previous = connection.execute(
+                    "SELECT checks, volatility, ranks, urls FROM keyword_state WHERE location = ? AND search_type = ? AND keyword = ?",
+                    (location, search_type, keyword)
+                ).fetchone()
+
+                if previous is None:
+                    checks, volatility = 1, None
+                else:
+                    previous_ranks = {domain: tuple(value) for domain, value in json.loads(previous['ranks']).items()}
+                    previous_urls = set(json.loads(previous['urls'])) if previous['urls'] is not None else None
+                    score = change_score(previous_ranks, ranks, previous_urls, urls)
+                    checks = previous['checks'] + 1
+                    # The first comparison sets the volatility, later ones move it gradually
+                    volatility = score if previous['volatility'] is None else (
+                        (1 - SMOOTHING) * previous['volatility'] + SMOOTHING * score
+                    )
+                rows.append((
+                    location, search_type, keyword, checked_at, checks, volatility,
+                    json.dumps(ranks), json.dumps(sorted(urls)) if urls is not None else None
+                ))
+
+            connection.executemany(
+                "INSERT OR REPLACE INTO keyword_state (location, search_type, keyword, checked_at, checks, volatility, ranks, urls) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def plan(self, keywords, location, search_type, result_size=10, max_credits=None, now=None):
+        """
+        Choose the keywords to fetch in a sweep
+
+        Args:
+            keywords (list): All keywords of the project
+            location (str): Location for search results
+            search_type (str): Search vertical
+            result_size (int): Results per page, sets the credits of a keyword
+            max_credits (int): Credit budget of the sweep, None for no limit
+            now (datetime): Reference time, defaults to now
+
+        Returns:
+            dict: 'refresh' (keywords to fetch, most urgent first), 'deferred'
+                (due but beyond the budget), 'skipped' (not due yet),
+                'credits' (first-page credits of the refreshed keywords) and
+                'volatility' (keyword -> volatility, None if unknown)
+        """
+        from utils.api_service import credits_for_request
+
+        now = now or datetime.now()
+        wanted = set(keywords)
+        with self._connect() as connection:
+            # Filtered here, a project may have more keywords than SQLite accepts as parameters
+            states = {
+                row['keyword']: row
+                for row in connection.execute(
+                    "SELECT keyword, checked_at, checks, volatility FROM keyword_state WHERE location = ? AND search_type = ?",
+                    (location, search_type)
+                )
+                if row['keyword'] in wanted
+            }
+
+        due = []
+        skipped = []
+        volatility = {}
+        for order, keyword in enumerate(keywords):
+            state = states.get(keyword)
+            if state is None:
+                # Never checked, fetched before anything else
+                volatility[keyword] = None
+                due.append((float('inf'), 1.0, order, keyword))
+                continue
+            volatility[keyword] = state['volatility']
+            elapsed = (now - datetime.fromisoformat(state['checked_at'])).total_seconds() / 3600 + DUE_TOLERANCE_HOURS
+            overdue = elapsed / 24 / interval_days(state['volatility'], state['checks'])
+            if overdue >= 1:
+                due.append((overdue, state['volatility'] or 0.0, order, keyword))
+            else:
+                skipped.append(keyword)
+
+        due.sort(key=lambda item: (-item[0], -item[1], item[2]))
+        per_keyword = credits_for_request(result_size)
+        affordable = len(due) if max_credits is None else max(0, max_credits // per_keyword)
+        refresh = [keyword for _, _, _, keyword in due[:affordable]]
+        return {
+            'refresh': refresh,
+            'deferred': [keyword for _, _, _, keyword in due[affordable:]],
+            'skipped': skipped,
+            'credits': len(refresh) * per_keyword,
+            'volatility': volatility,
+        }
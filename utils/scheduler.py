@@ -0,0 +1,495 @@
+"""
+Scheduled rank sweeps
+
+Projects (domains, keywords, locale and a cron schedule) are stored in a
+local JSON file. Run the scheduler headlessly with:
+
+    python -m utils.scheduler run
+
+Other commands: ``list`` shows projects and their next run, ``run-now NAME``
+runs one project immediately and ``plan NAME`` shows which keywords its
+next sweep would refresh.
+
+Projects with refresh "adaptive" only fetch the keywords RefreshPlanner
+finds due, stable keywords are checked less often.
+"""
+import argparse
+import json
+import math
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from utils.storage import get_data_path
+
+# Fallback request pacing when a project does not set its own limit
+DEFAULT_REQUESTS_PER_MINUTE = 60
+
+# User the credit ledger records scheduled runs under when their project has no owner
+SCHEDULER_USER = "scheduler"
+
+# Refresh modes of a project: every keyword on every run, or only the ones due by volatility
+REFRESH_ALL = "all"
+REFRESH_ADAPTIVE = "adaptive"
+
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@nightly": "0 2 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+
+# (minimum, maximum) for minute, hour, day of month, month, day of week
+# (Sunday is 0 or 7)
+_CRON_FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+class CronSpec:
+    """A five-field cron expression (minute hour day-of-month month day-of-week)"""
+
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        fields = CRON_ALIASES.get(self.expression, self.expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._parse_field(field, minimum, maximum)
+            for field, (minimum, maximum) in zip(fields, _CRON_FIELD_RANGES)
+        ]
+        self.weekdays = {weekday % 7 for weekday in self.weekdays}
+        # Cron matches either day field when both are restricted
+        self._days_restricted = fields[2] != '*'
+        self._weekdays_restricted = fields[4] != '*'
+
+    @staticmethod
+    def _parse_field(field, minimum, maximum):
+        """Expand one cron field such as '*/15', '1-5' or '0,30' into a set"""
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step_text = part.split('/', 1)
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"Invalid cron step: {field!r}")
+            if part == '*':
+                start, end = minimum, maximum
+            elif '-' in part:
+                start, end = (int(value) for value in part.split('-', 1))
+            else:
+                start = int(part)
+                # 'N/step' runs from N to the end of the range
+                end = maximum if step > 1 else start
+            if start < minimum or end > maximum or start > end:
+                raise ValueError(f"Cron value out of range: {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _matches_day(self, moment):
+        day_match = moment.day in self.days
+        # datetime weekday() is Monday=0, cron is Sunday=0
+        weekday_match = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._days_restricted and self._weekdays_restricted:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def next_run(self, after):
+        """
+        Return the first matching minute strictly after a moment
+
+        Args:
+            after (datetime): The reference moment
+
+        Returns:
+            datetime: The next scheduled time
+        """
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Any valid expression matches at least once in four years (29 February)
+        limit = moment + timedelta(days=4 * 366)
+
+        while moment < limit:
+            if moment.month not in self.months or not self._matches_day(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+                continue
+            if moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+                continue
+            return moment
+
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+
+class ScheduleStore:
+    """Scheduled projects persisted in a local JSON file"""
+
+    def __init__(self, path=None):
+        self.path = path or get_data_path("schedules.json")
+
+    def load(self):
+        """
+        Load all projects
+
+        Returns:
+            dict: Project name -> project settings
+        """
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as file:
+            return json.load(file)
+
+    def save_project(self, name, domains, keywords, schedule, search_type="search", location="Turkey", result_size=10, max_depth=None, window_minutes=60, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, enabled=True, refresh=REFRESH_ALL, credit_budget=None, user=None):
+        """
+        Create or replace a scheduled project
+
+        Args:
+            name (str): Unique project name
+            domains (list): List of domains
+            keywords (list): List of keywords
+            schedule (str): Cron expression, e.g. '0 2 * * *' or '@nightly'
+            search_type (str): Type of search (search, images)
+            location (str): Location for search results
+            result_size (int): Number of results per page
+            max_depth (int): Deepest rank to look for, None checks the first page only
+            window_minutes (int): Spread the run's requests evenly over this many minutes
+            requests_per_minute (int): Upper limit on the request rate
+            enabled (bool): Whether the scheduler should run the project
+            refresh (str): REFRESH_ALL or REFRESH_ADAPTIVE
+            credit_budget (int): Credits a run may spend, None for no limit
+            user (str): Owner whose monthly budget the runs are charged to,
+                None charges SCHEDULER_USER
+        """
+        CronSpec(schedule)  # Validate before saving
+        if refresh not in (REFRESH_ALL, REFRESH_ADAPTIVE):
+            raise ValueError(f"Unknown refresh mode: {refresh!r}")
+
+        def update(projects):
+            previous = projects.get(name, {})
+            projects[name] = {
+                'domains': list(domains),
+                'keywords': list(keywords),
+                'schedule': schedule,
+                'search_type': search_type,
+                'location': location,
+                'result_size': result_size,
+                'max_depth': max_depth,
+                'window_minutes': window_minutes,
+                'requests_per_minute': requests_per_minute,
+                'enabled': enabled,
+                'refresh': refresh,
+                'credit_budget': credit_budget,
+                'user': user,
+                'created_at': previous.get('created_at', datetime.now().isoformat(timespec="seconds")),
+                'last_run': previous.get('last_run'),
+            }
+
+        self._update(update)
+
+    def set_enabled(self, name, enabled):
+        """Enable or pause a project"""
+        self._update(lambda projects: projects[name].update(enabled=enabled) if name in projects else None)
+
+    def delete_project(self, name):
+        """Remove a project"""
+        self._update(lambda projects: projects.pop(name, None))
+
+    def mark_run(self, name, moment):
+        """Record when a project last ran"""
+        self._update(lambda projects: projects[name].update(last_run=moment.isoformat(timespec="seconds")) if name in projects else None)
+
+    def _update(self, change):
+        """Re-read the file, apply a change and write it back atomically"""
+        projects = self.load()
+        change(projects)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, delete=False, suffix='.tmp') as file:
+            json.dump(projects, file, indent=2, ensure_ascii=False)
+        os.replace(file.name, self.path)
+
+
+def next_run_time(project):
+    """Return when a project is next due"""
+    reference = project.get('last_run') or project.get('created_at')
+    after = datetime.fromisoformat(reference) if reference else datetime.now()
+    return CronSpec(project['schedule']).next_run(after)
+
+
+def request_interval(project, batch_size=1):
+    """
+    Seconds to wait between requests so a run fills its window
+
+    Args:
+        project (dict): Project settings
+        batch_size (int): Keywords per request
+
+    Returns:
+        float: Minimum interval between requests
+    """
+    expected_requests = max(1, math.ceil(len(project['keywords']) / max(1, batch_size)))
+    window_interval = project.get('window_minutes', 0) * 60 / expected_requests
+    rate_interval = 60 / max(1, project.get('requests_per_minute') or DEFAULT_REQUESTS_PER_MINUTE)
+    return max(window_interval, rate_interval)
+
+
+class Scheduler:
+    """Runs due projects through the headless rank tracking path"""
+
+    def __init__(self, schedule_store=None, history_store=None, api_factory=None, log=print, feature_store=None, ledger=None, refresh_planner=None, alert_config=None, dispatcher=None, budgets=None):
+        # Imported here so the schedule store can be used without the API stack
+        from utils.alerts import load_alert_config
+        from utils.api_service import SerperAPI
+        from utils.cost_estimator import load_budgets
+        from utils.credit_ledger import CreditLedger
+        from utils.dispatcher import RequestDispatcher, load_fair_share_config
+        from utils.history_store import HistoryStore
+        from utils.refresh_planner import RefreshPlanner
+        from utils.serp_features import SerpFeatureStore
+
+        self.schedule_store = schedule_store or ScheduleStore()
+        self.history_store = history_store or HistoryStore()
+        self.feature_store = feature_store or SerpFeatureStore()
+        self.ledger = ledger or CreditLedger()
+        self.refresh_planner = refresh_planner or RefreshPlanner()
+        self.alert_config = load_alert_config() if alert_config is None else alert_config
+        # Sweeps are held against the same monthly budgets as interactive runs
+        self.budgets = load_budgets() if budgets is None else budgets
+        self.api_factory = api_factory or SerperAPI
+        # Sweeps are bulk requests, paced by the bulk rate shared with the app
+        self.dispatcher = dispatcher or RequestDispatcher.from_config(load_fair_share_config())
+        self.log = log
+
+    def due_projects(self, now=None):
+        """
+        Return the names of enabled projects whose next run time has passed
+
+        Args:
+            now (datetime): Reference time, defaults to now
+
+        Returns:
+            list: Project names, most overdue first
+        """
+        now = now or datetime.now()
+        due = []
+        for name, project in self.schedule_store.load().items():
+            if not project.get('enabled', True):
+                continue
+            scheduled_at = next_run_time(project)
+            if scheduled_at <= now:
+                due.append((scheduled_at, name))
+        return [name for _, name in sorted(due)]
+
+    def plan_project(self, name, now=None):
+        """
+        Keywords the next run of a project fetches
+
+        Args:
+            name (str): Project name
+            now (datetime): Reference time, defaults to now
+
+        Returns:
+            dict: Output of RefreshPlanner.plan, every keyword is refreshed
+                unless the project's refresh is REFRESH_ADAPTIVE
+        """
+        project = self.schedule_store.load()[name]
+        if project.get('refresh', REFRESH_ALL) == REFRESH_ADAPTIVE:
+            return self.refresh_planner.plan(
+                project['keywords'], project['location'], project['search_type'], project['result_size'],
+                max_credits=project.get('credit_budget'), now=now
+            )
+        return {'refresh': list(project['keywords']), 'deferred': [], 'skipped': [], 'credits': None, 'volatility': {}}
+
+    def run_project(self, name):
+        """
+        Run one project and write its results into the history store
+
+        Args:
+            name (str): Project name
+
+        Returns:
+            int: The id of the stored run, None if the budgets left no credits for it
+        """
+        from utils.alerts import AlertEngine, load_rules, load_sinks
+        from utils.cost_estimator import budget_problem, credit_limit, estimate_run_cost, reserve_run_credits
+        from utils.data_service import DataService
+        from utils.dispatcher import BULK
+        from utils.rank_tracker import RankTracker, get_locale
+        from utils.refresh_planner import top_urls
+        from utils.serp_features import extract_features
+
+        project = self.schedule_store.load()[name]
+        started_at = datetime.now()
+        # Record the run up front so a crash does not retrigger it in a loop
+        self.schedule_store.mark_run(name, started_at)
+
+        plan = self.plan_project(name, started_at)
+        keywords = plan['refresh']
+
+        api_service = self.api_factory()
+        # Paced for the keywords actually fetched, so a smaller sweep still fills its window
+        api_service.min_request_interval = request_interval(dict(project, keywords=keywords))
+        api_service.dispatcher = self.dispatcher
+        api_service.lane = BULK
+        api_service.tenant = f"{SCHEDULER_USER}:{name}"
+        tracker = RankTracker(api_service, DataService())
+
+        language, country_code = get_locale(project['location'])
+        estimate = estimate_run_cost(
+            api_service, keywords, project['domains'], project['search_type'], project['location'],
+            language, country_code, project['result_size'], max_depth=project.get('max_depth')
+        )
+        # Held like an interactive run, so the owner's runs see this sweep's credits as spent
+        user = project.get('user') or SCHEDULER_USER
+        limit = credit_limit(self.budgets, self.ledger.spent(user), project.get('credit_budget'))
+        reservation_id, max_credits = reserve_run_credits(self.ledger, user, estimate, limit, self.budgets)
+        problem = budget_problem(estimate, max_credits)
+        if problem:
+            self.ledger.release(reservation_id)
+            self.log(f"[{started_at:%Y-%m-%d %H:%M}] Skipped {name}: {problem}")
+            return None
+        skipped = f", {len(plan['skipped'])} stable skipped, {len(plan['deferred'])} deferred" if project.get('refresh') == REFRESH_ADAPTIVE else ""
+        self.log(
+            f"[{started_at:%Y-%m-%d %H:%M}] Running {name}: {len(keywords)} keywords{skipped}, "
+            f"~{estimate['credits']['expected']} credits, one request every {api_service.min_request_interval:.1f}s"
+        )
+
+        # Rank drops are checked against the latest stored ranks as results arrive
+        alert_engine = None
+        if self.alert_config.get('enabled', True):
+            alert_engine = AlertEngine(
+                project['domains'],
+                self.history_store.get_latest_ranks(project['domains'], project['location'], project['search_type']),
+                rules=load_rules(self.alert_config),
+                sinks=load_sinks(self.alert_config),
+                location=project['location'],
+                search_type=project['search_type'],
+                depth=project.get('max_depth') or project['result_size']
+            )
+
+        feature_snapshots = {}
+        url_sets = {}
+
+        def collect_features(keyword, search_results):
+            feature_snapshots[keyword] = extract_features(search_results)
+            url_sets[keyword] = top_urls(search_results)
+
+        usage_before = dict(api_service.usage)
+        try:
+            run = tracker.track(
+                keywords,
+                project['domains'],
+                project['search_type'],
+                project['location'],
+                language,
+                country_code,
+                project['result_size'],
+                max_depth=project.get('max_depth'),
+                response_callback=collect_features if project['search_type'] == "search" else None,
+                result_callback=alert_engine.evaluate if alert_engine else None,
+                max_credits=max_credits
+            )
+        except Exception:
+            if alert_engine:
+                alert_engine.abort()
+            # Settle the hold with what was charged before the failure
+            usage = {key: api_service.usage[key] - usage_before[key] for key in usage_before}
+            self.ledger.record(
+                user,
+                {'requests': usage['requests'], 'credits_used': usage['credits'], 'cache_hits': usage['cache_hits']},
+                len(keywords),
+                project['search_type'],
+                project['location'],
+                estimated_credits=estimate['credits']['expected'],
+                project=name,
+                recorded_at=started_at,
+                reservation_id=reservation_id
+            )
+            raise
+        # Recorded first, so the spend is kept even if storing the results fails
+        self.ledger.record(
+            user,
+            run['usage'],
+            len(keywords),
+            project['search_type'],
+            project['location'],
+            estimated_credits=estimate['credits']['expected'],
+            project=name,
+            recorded_at=started_at,
+            reservation_id=reservation_id
+        )
+        if alert_engine:
+            alerts = alert_engine.close(run['errors'])
+            if alerts:
+                self.log(f"{name}: {len(alerts)} alert(s)")
+            for error in alert_engine.delivery_errors:
+                self.log(f"{name}: alerts could not be delivered: {error}")
+        if feature_snapshots:
+            self.feature_store.index_snapshots(feature_snapshots, project['location'], started_at)
+        # Keywords that failed keep their last check and stay due
+        fetched = {keyword: run['results'][keyword] for keyword in run['results'] if keyword not in run['errors']}
+        self.refresh_planner.observe(project['location'], project['search_type'], fetched, url_sets, started_at)
+        run_id = self.history_store.record_run(
+            run,
+            project['domains'],
+            keywords,
+            project['search_type'],
+            project['location'],
+            project['result_size'],
+            max_depth=project.get('max_depth'),
+            project=name,
+            started_at=started_at
+        )
+        self.log(f"Finished {name}: {len(run['results'])} keywords stored, {len(run['errors'])} errors, {run['usage']['credits_used']} credits")
+        return run_id
+
+    def run_pending(self, now=None):
+        """Run every due project once, one after another"""
+        for name in self.due_projects(now):
+            try:
+                self.run_project(name)
+            except Exception as e:
+                self.log(f"Project {name} failed: {e}")
+
+    def run_forever(self, poll_seconds=30):
+        """Check for due projects until interrupted"""
+        self.log(f"Scheduler started, watching {self.schedule_store.path}")
+        while True:
+            self.run_pending()
+            time.sleep(poll_seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scheduled rank sweeps")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help="Run due projects until interrupted")
+    run_parser.add_argument('--poll-seconds', type=int, default=30)
+    subparsers.add_parser('list', help="List projects and their next run")
+    run_now_parser = subparsers.add_parser('run-now', help="Run one project immediately")
+    run_now_parser.add_argument('name')
+    plan_parser = subparsers.add_parser('plan', help="Show the keywords the next run of a project refreshes")
+    plan_parser.add_argument('name')
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for name, project in ScheduleStore().load().items():
+            status = next_run_time(project).strftime("%Y-%m-%d %H:%M") if project.get('enabled', True) else "paused"
+            print(f"{name}: {project['schedule']} ({len(project['keywords'])} keywords) next: {status}")
+    elif args.command == 'run-now':
+        Scheduler().run_project(args.name)
+    elif args.command == 'plan':
+        plan = Scheduler().plan_project(args.name)
+        total = len(plan['refresh']) + len(plan['deferred']) + len(plan['skipped'])
+        print(f"{args.name}: refresh {len(plan['refresh'])} of {total} keywords, {len(plan['deferred'])} deferred by the credit budget, {len(plan['skipped'])} stable")
+        for keyword in plan['refresh']:
+            volatility = plan['volatility'].get(keyword)
+            print(f"  {keyword}" + (f" (volatility {volatility:.2f})" if volatility is not None else ""))
+    else:
+        Scheduler().run_forever(args.poll_seconds)
+
+
+if __name__ == "__main__":
+    main()
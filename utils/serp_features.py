@@ -0,0 +1,338 @@
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils.storage import get_data_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS serp_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    keyword TEXT NOT NULL,
+    location TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    knowledge_graph TEXT,
+    UNIQUE (keyword, location)
+);
+CREATE TABLE IF NOT EXISTS serp_features (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    snapshot_id INTEGER NOT NULL REFERENCES serp_snapshots(id) ON DELETE CASCADE,
+    feature_type TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    normalized_text TEXT NOT NULL,
+    url TEXT
+);
+CREATE INDEX IF NOT EXISTS serp_features_snapshot ON serp_features(snapshot_id);
+CREATE INDEX IF NOT EXISTS serp_features_dedup ON serp_features(feature_type, normalized_text);
+CREATE TABLE IF NOT EXISTS feature_terms (
+    term TEXT NOT NULL,
+    feature_id INTEGER NOT NULL REFERENCES serp_features(id) ON DELETE CASCADE,
+    PRIMARY KEY (term, feature_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS feature_terms_feature ON feature_terms(feature_id);
+CREATE TABLE IF NOT EXISTS serp_organic (
+    snapshot_id INTEGER NOT NULL REFERENCES serp_snapshots(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    link TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, position)
+) WITHOUT ROWID;
+"""
+
+FEATURE_TYPES = {
+    'people_also_ask': "People Also Ask",
+    'related_search': "Related Searches",
+    'sitelink': "Sitelinks",
+    'top_story': "Top Stories",
+}
+
+_TERM_PATTERN = re.compile(r'\w+')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Case and whitespace insensitive form of a feature text, used for dedup"""
+    return _WHITESPACE_PATTERN.sub(' ', text).strip().casefold().rstrip('?').strip()
+
+
+def tokenize(text):
+    """Split text into the terms stored in the inverted index"""
+    return {term for term in _TERM_PATTERN.findall(text.casefold()) if len(term) > 1 or term.isdigit()}
+
+
+def organic_links(search_results):
+    """
+    Positions and links of the organic results of a search response
+
+    Returns:
+        list: (position, link) pairs in page order
+    """
+    links = []
+    for index, item in enumerate(search_results.get('organic') or [], start=1):
+        if item.get('link'):
+            links.append((item.get('position') or index, item['link']))
+    return links
+
+
+def extract_features(search_results):
+    """
+    Pull SERP features out of a full search response
+
+    Args:
+        search_results (dict): Search results from Serper, a LeanSerp
+            carries every field read here
+
+    Returns:
+        dict: 'knowledge_graph' (title or None), 'features', a list of
+            (feature_type, position, text, url) tuples, and 'organic', the
+            (position, link) pairs of the organic results
+    """
+    features = []
+
+    for position, item in enumerate(search_results.get('peopleAlsoAsk') or [], start=1):
+        if item.get('question'):
+            features.append(('people_also_ask', position, item['question'], item.get('link')))
+
+    for position, item in enumerate(search_results.get('relatedSearches') or [], start=1):
+        if item.get('query'):
+            features.append(('related_search', position, item['query'], None))
+
+    for result in search_results.get('organic') or []:
+        for sitelink in result.get('sitelinks') or []:
+            if sitelink.get('title'):
+                features.append(('sitelink', result.get('position', 0), sitelink['title'], sitelink.get('link')))
+
+    for position, item in enumerate(search_results.get('topStories') or [], start=1):
+        if item.get('title'):
+            features.append(('top_story', position, item['title'], item.get('link')))
+
+    knowledge_graph = search_results.get('knowledgeGraph')
+    return {
+        'knowledge_graph': (knowledge_graph.get('title') or "") if knowledge_graph else None,
+        'features': features,
+        'organic': organic_links(search_results),
+    }
+
+
+class SerpFeatureStore:
+    """
+    Latest SERP features per keyword with an inverted index over their text
+
+    Features are stored in normalized tables, one snapshot per keyword and
+    location. feature_terms maps every term to the features containing it,
+    so searches intersect a few index ranges instead of scanning all text.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_data_path("serp_features.sqlite3")
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection, committing on success and always closing it"""
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA foreign_keys = ON")
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def index_snapshots(self, snapshots, location, fetched_at=None):
+        """
+        Replace the stored features of the given keywords
+
+        Args:
+            snapshots (dict): Keyword -> output of extract_features
+            location (str): Location for search results
+            fetched_at (datetime): When the results were fetched, defaults to now
+        """
+        fetched_at = (fetched_at or datetime.now()).isoformat(timespec="seconds")
+
+        with self._connect() as connection:
+            for keyword, snapshot in snapshots.items():
+                # Cascades to the old features and their terms
+                connection.execute(
+                    "DELETE FROM serp_snapshots WHERE keyword = ? AND location = ?",
+                    (keyword, location)
+                )
+                snapshot_id = connection.execute(
+                    "INSERT INTO serp_snapshots (keyword, location, fetched_at, knowledge_graph) VALUES (?, ?, ?, ?)",
+                    (keyword, location, fetched_at, snapshot['knowledge_graph'])
+                ).lastrowid
+
+                for feature_type, position, text, url in snapshot['features']:
+                    feature_id = connection.execute(
+                        "INSERT INTO serp_features (snapshot_id, feature_type, position, text, normalized_text, url) VALUES (?, ?, ?, ?, ?, ?)",
+                        (snapshot_id, feature_type, position, text, normalize_text(text), url)
+                    ).lastrowid
+                    connection.executemany(
+                        "INSERT INTO feature_terms (term, feature_id) VALUES (?, ?)",
+                        ((term, feature_id) for term in tokenize(text))
+                    )
+                # Snapshots extracted before organic links were kept have none
+                connection.executemany(
+                    "INSERT OR IGNORE INTO serp_organic (snapshot_id, position, link) VALUES (?, ?, ?)",
+                    ((snapshot_id, position, link) for position, link in snapshot.get('organic', ()))
+                )
+
+    def search(self, query, feature_types=None, location=None, limit=200):
+        """
+        Find features whose text contains every term of a query
+
+        Args:
+            query (str): Search text
+            feature_types (list): Restrict to these feature types
+            location (str): Restrict to one location
+            limit (int): Maximum number of rows
+
+        Returns:
+            list: Dictionaries with keyword, location, feature_type, position, text and url
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._connect() as connection:
+            # Walk the postings of the rarest term and probe the others by primary key
+            counts = {
+                term: connection.execute("SELECT COUNT(*) FROM feature_terms WHERE term = ?", (term,)).fetchone()[0]
+                for term in terms
+            }
+            rarest, *others = sorted(terms, key=counts.get)
+            if counts[rarest] == 0:
+                return []
+
+            filters = [
+                "EXISTS (SELECT 1 FROM feature_terms t WHERE t.term = ? AND t.feature_id = postings.feature_id)"
+                for _ in others
+            ]
+            params = [rarest] + others
+            if feature_types:
+                filters.append(f"f.feature_type IN ({','.join('?' * len(feature_types))})")
+                params.extend(feature_types)
+            if location:
+                filters.append("s.location = ?")
+                params.append(location)
+            params.append(limit)
+
+            sql = f"""
+                SELECT s.keyword, s.location, f.feature_type, f.position, f.text, f.url
+                FROM feature_terms postings
+                JOIN serp_features f ON f.id = postings.feature_id
+                JOIN serp_snapshots s ON s.id = f.snapshot_id
+                WHERE postings.term = ?{''.join(' AND ' + condition for condition in filters)}
+                LIMIT ?
+            """
+            return [dict(row) for row in connection.execute(sql, params)]
+
+    def top_features(self, feature_type, keywords=None, location=None, limit=100):
+        """
+        Deduplicated features ranked by how many keywords show them
+
+        Args:
+            feature_type (str): One of FEATURE_TYPES
+            keywords (list): Restrict to these keywords
+            location (str): Restrict to one location
+            limit (int): Maximum number of rows
+
+        Returns:
+            list: Dictionaries with text, keyword_count and keywords (comma separated)
+        """
+        filters = ["f.feature_type = ?"]
+        params = [feature_type]
+        if location:
+            filters.append("s.location = ?")
+            params.append(location)
+        params.append(limit)
+
+        with self._connect() as connection:
+            if keywords:
+                filters.append(f"s.keyword IN {self._keyword_table(connection, keywords)}")
+            sql = f"""
+                SELECT MIN(f.text) AS text,
+                    COUNT(DISTINCT s.keyword) AS keyword_count,
+                    GROUP_CONCAT(DISTINCT s.keyword) AS keywords
+                FROM serp_features f
+                JOIN serp_snapshots s ON s.id = f.snapshot_id
+                WHERE {' AND '.join(filters)}
+                GROUP BY f.normalized_text
+                ORDER BY keyword_count DESC, text
+                LIMIT ?
+            """
+            return [dict(row) for row in connection.execute(sql, params)]
+
+    def knowledge_graph_keywords(self, keywords=None, location=None):
+        """
+        Keywords whose results show a knowledge graph panel
+
+        Returns:
+            dict: Keyword -> knowledge graph title
+        """
+        filters = ["knowledge_graph IS NOT NULL"]
+        params = []
+        if location:
+            filters.append("location = ?")
+            params.append(location)
+
+        with self._connect() as connection:
+            if keywords:
+                filters.append(f"keyword IN {self._keyword_table(connection, keywords)}")
+            rows = connection.execute(
+                f"SELECT keyword, knowledge_graph FROM serp_snapshots WHERE {' AND '.join(filters)}",
+                params
+            )
+            return {row['keyword']: row['knowledge_graph'] for row in rows}
+
+    @staticmethod
+    def _keyword_table(connection, keywords):
+        """
+        Load keywords into a temporary table of the connection
+
+        A keyword list may exceed SQLite's parameter limit, so it is joined
+        as a table instead of bound as IN (?, ...) parameters.
+
+        Returns:
+            str: Subquery selecting the keywords, for use after IN
+        """
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_keywords (keyword TEXT PRIMARY KEY) WITHOUT ROWID")
+        connection.execute("DELETE FROM wanted_keywords")
+        connection.executemany(
+            "INSERT OR IGNORE INTO wanted_keywords (keyword) VALUES (?)",
+            ((keyword,) for keyword in keywords)
+        )
+        return "(SELECT keyword FROM wanted_keywords)"
+
+    def iter_organic(self, keywords=None, location=None):
+        """
+        Stream the archived organic results, one keyword after another
+
+        Rows are read from the cursor as they are consumed, so any number of
+        snapshots can be scanned in constant memory.
+
+        Args:
+            keywords (iterable): Restrict to these keywords
+            location (str): Restrict to one location
+
+        Yields:
+            tuple: (keyword, position, link), grouped by snapshot in position order
+        """
+        # Filtered here, a keyword list may exceed SQLite's parameter limit
+        keywords = set(keywords) if keywords else None
+        sql = """
+            SELECT s.keyword, o.position, o.link
+            FROM serp_organic o
+            JOIN serp_snapshots s ON s.id = o.snapshot_id
+        """
+        params = []
+        if location:
+            sql += " WHERE s.location = ?"
+            params.append(location)
+        sql += " ORDER BY o.snapshot_id, o.position"
+
+        with self._connect() as connection:
+            for keyword, position, link in connection.execute(sql, params):
+                if keywords is None or keyword in keywords:
+                    yield keyword, position, link
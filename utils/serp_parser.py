@@ -0,0 +1,223 @@
+import json
+from typing import Any, List, TypedDict, Union
+
+# Optional fast decoders, the standard library json module is the fallback
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Fields of a Serper response that the ranking pipeline and the SERP
+# features index actually read
+class _Sitelink(TypedDict, total=False):
+    title: str
+    link: str
+
+
+class _OrganicItem(TypedDict, total=False):
+    position: int
+    link: str
+    sitelinks: List[_Sitelink]
+
+
+class _ResultItem(TypedDict, total=False):
+    position: int
+    link: str
+
+
+class _ImageItem(TypedDict, total=False):
+    position: int
+    link: str
+    domain: str
+    imageUrl: str
+
+
+class _PlaceItem(TypedDict, total=False):
+    position: int
+    website: str
+
+
+class _RelatedSearch(TypedDict, total=False):
+    query: str
+
+
+class _PeopleAlsoAsk(TypedDict, total=False):
+    question: str
+    link: str
+
+
+class _TopStory(TypedDict, total=False):
+    title: str
+    link: str
+
+
+class _KnowledgeGraph(TypedDict, total=False):
+    title: str
+
+
+class _LeanPayload(TypedDict, total=False):
+    searchParameters: dict
+    organic: List[_OrganicItem]
+    images: List[_ImageItem]
+    news: List[_ResultItem]
+    videos: List[_ResultItem]
+    places: List[_PlaceItem]
+    relatedSearches: List[_RelatedSearch]
+    peopleAlsoAsk: List[_PeopleAlsoAsk]
+    topStories: List[_TopStory]
+    knowledgeGraph: _KnowledgeGraph
+    # Error responses
+    message: Any
+    statusCode: Any
+    error: Any
+
+
+# Field -> kept subfields (None keeps the value whole), mirrors _LeanPayload
+LEAN_FIELDS = {
+    'searchParameters': None,
+    'organic': {'position': None, 'link': None, 'sitelinks': {'title': None, 'link': None}},
+    'images': {'position': None, 'link': None, 'domain': None, 'imageUrl': None},
+    'news': {'position': None, 'link': None},
+    'videos': {'position': None, 'link': None},
+    'places': {'position': None, 'website': None},
+    'relatedSearches': {'query': None},
+    'peopleAlsoAsk': {'question': None, 'link': None},
+    'topStories': {'title': None, 'link': None},
+    'knowledgeGraph': {'title': None},
+    'message': None,
+    'statusCode': None,
+    'error': None,
+}
+
+if msgspec is not None:
+    _lean_decoder = msgspec.json.Decoder(Union[List[_LeanPayload], _LeanPayload])
+
+
+def decode_json(raw):
+    """
+    Decode a JSON document with the fastest available decoder
+
+    Args:
+        raw (bytes): The JSON document
+
+    Returns:
+        object: The decoded document
+    """
+    if orjson is not None:
+        return orjson.loads(raw)
+    if msgspec is not None:
+        return msgspec.json.decode(raw)
+    return json.loads(raw)
+
+
+def parse_serp(raw):
+    """
+    Parse a Serper response keeping only the fields the pipeline uses
+
+    With msgspec installed the lean fields are decoded directly and the rest
+    of the payload (snippets, knowledge graph attributes...) is skipped
+    without being materialized. Otherwise the document is decoded with
+    orjson or json and trimmed down to the same fields.
+
+    Args:
+        raw (bytes): The raw response body
+
+    Returns:
+        LeanSerp or list: One LeanSerp, or a list of them for batch responses
+
+    Raises:
+        ValueError: The body is not valid JSON (msgspec, orjson and json
+            decode errors are all ValueErrors)
+    """
+    source = _RawSource(raw)
+
+    decoded = None
+    if msgspec is not None:
+        try:
+            decoded = _lean_decoder.decode(raw)
+        except msgspec.ValidationError:
+            # Unexpected field types, trim a generic decode instead
+            decoded = None
+    if decoded is None:
+        decoded = _trim(decode_json(raw))
+
+    if isinstance(decoded, list):
+        return [LeanSerp(item, source, index) for index, item in enumerate(decoded)]
+    return LeanSerp(decoded, source)
+
+
+def _trim(document, fields=LEAN_FIELDS):
+    """Reduce a fully decoded response to the lean fields"""
+    if isinstance(document, list):
+        return [_trim(item, fields) for item in document if isinstance(item, dict) or fields is LEAN_FIELDS]
+    if not isinstance(document, dict):
+        return document
+
+    lean = {}
+    for key, subfields in fields.items():
+        if key not in document:
+            continue
+        value = document[key]
+        if subfields is not None and isinstance(value, (list, dict)):
+            value = _trim(value, subfields)
+        lean[key] = value
+    return lean
+
+
+class _RawSource:
+    """Raw response body shared by the results parsed from it"""
+
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def decoded(self):
+        # Not kept: results live in the shared response cache, where a full
+        # decode would outweigh the lean fields several times over
+        return decode_json(self.raw)
+
+
+class LeanSerp(dict):
+    """
+    Search results holding only the lean fields, with the full payload on demand
+
+    Behaves like the dict returned by response.json() for the lean fields.
+    Any other key is looked up in the full payload, which is decoded from the
+    raw response on every such lookup, so hot paths should stick to the lean
+    fields.
+    """
+
+    __slots__ = ('_source', '_index')
+
+    def __init__(self, lean, source, index=None):
+        super().__init__(lean)
+        self._source = source
+        self._index = index
+
+    @property
+    def raw(self):
+        """The raw response body this result was parsed from"""
+        return self._source.raw
+
+    @property
+    def full(self):
+        """The complete decoded search results"""
+        decoded = self._source.decoded()
+        return decoded if self._index is None else decoded[self._index]
+
+    def get(self, key, default=None):
+        if key in self or key in LEAN_FIELDS:
+            return super().get(key, default)
+        return self.full.get(key, default)
+
+    def __missing__(self, key):
+        if key in LEAN_FIELDS:
+            raise KeyError(key)
+        return self.full[key]
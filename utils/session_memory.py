@@ -0,0 +1,361 @@
+"""
+Bounded per-session memory for large run payloads
+
+Results, hits and search metadata of a run can take tens of megabytes,
+and every long-lived session used to keep them, plus a copy per past run,
+in st.session_state. SessionMemory keeps such payloads under a byte budget
+per session:
+
+- payloads are measured by the memory their objects take (resident_size),
+  pickles are several times smaller and would let a session hold far
+  more than its budget
+- when a session's resident payloads exceed the budget, the least
+  recently used ones are spilled to a SpillStore on disk and only a
+  reference stays in the session
+- spilled payloads are loaded back on first use, evicting others in turn
+
+The SpillStore is shared by all sessions and content addressed, so the
+same payload spilled by two sessions is stored once. Files unused for
+SPILL_TTL seconds are pruned. Open sessions refresh the age of their files
+every TOUCH_INTERVAL seconds, so only sessions left alone for a day lose
+them, and a payload lost that way is reported by SessionMemory.expired.
+Each session reports its usage to a SessionRegistry, shown in the Cache
+sidebar panel.
+"""
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from utils.storage import get_data_dir
+
+# Bytes of payloads a session keeps in memory before spilling to disk
+MAX_SESSION_BYTES = 64 * 1024 * 1024
+# Seconds a spilled payload is kept after it was last written or read
+SPILL_TTL = 24 * 60 * 60
+# Seconds between prunes of the spill directory
+PRUNE_INTERVAL = 10 * 60
+# Seconds between refreshes of the age of a session's spilled files, well below SPILL_TTL
+TOUCH_INTERVAL = 60 * 60
+# Seconds without a report after which a session is considered closed
+SESSION_IDLE_SECONDS = 60 * 60
+# Session state key of a session's entries
+STATE_KEY = '_session_memory'
+# Past runs a session keeps, used to pick starting result sizes
+MAX_HISTORY_RUNS = 10
+
+_ATOMIC_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def resident_size(value):
+    """
+    Estimate the bytes a payload takes in memory
+
+    Walks dicts, sequences, sets and the __dict__ or __slots__ of other
+    objects, counting objects shared between them once. Objects with their
+    own __sizeof__, such as DataFrames, report their size themselves.
+
+    Args:
+        value: Any object
+
+    Returns:
+        int: Sum of sys.getsizeof over every reachable object
+    """
+    seen = set()
+    size = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif isinstance(obj, _ATOMIC_TYPES) or type(obj).__sizeof__ is not object.__sizeof__:
+            continue
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            stack.extend(getattr(obj, slot, None) for slot in getattr(type(obj), '__slots__', ()))
+    return size
+
+
+class SpillStore:
+    """Content-addressed pickles in a shared directory"""
+
+    def __init__(self, directory=None, ttl=SPILL_TTL):
+        self.directory = directory or os.path.join(get_data_dir(), "session_spill")
+        os.makedirs(self.directory, exist_ok=True)
+        self.ttl = ttl
+        self._last_prune = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def save(self, data):
+        """
+        Store pickled bytes
+
+        Args:
+            data (bytes): Output of pickle.dumps
+
+        Returns:
+            str: Key of the payload
+        """
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        if os.path.exists(path):
+            # Already spilled, possibly by another session
+            os.utime(path)
+        else:
+            with tempfile.NamedTemporaryFile('wb', dir=self.directory, delete=False, suffix='.tmp') as file:
+                file.write(data)
+            os.replace(file.name, path)
+        if time.time() - self._last_prune > PRUNE_INTERVAL:
+            self.prune()
+        return key
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def touch(self, keys):
+        """Refresh the age of payloads still referenced, skipping pruned ones"""
+        for key in keys:
+            try:
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                # Reported when the payload is read
+                pass
+
+    def load(self, key):
+        """
+        Load a payload, refreshing its age
+
+        Raises:
+            FileNotFoundError: The payload was pruned
+        """
+        path = self._path(key)
+        with open(path, 'rb') as file:
+            value = pickle.load(file)
+        os.utime(path)
+        return value
+
+    def prune(self):
+        """Delete payloads unused for longer than the TTL"""
+        self._last_prune = time.time()
+        cutoff = self._last_prune - self.ttl
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                # Removed by another process meanwhile
+                pass
+
+    def usage(self):
+        """
+        Returns:
+            dict: files and bytes of the spill directory
+        """
+        files = 0
+        size = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pickle"):
+                files += 1
+                size += entry.stat().st_size
+        return {'files': files, 'bytes': size}
+
+
+class SessionRegistry:
+    """Latest memory usage reported by every session of the process"""
+
+    def __init__(self, idle_seconds=SESSION_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def report(self, session_id, user, usage):
+        """Record a session's usage, see SessionMemory.usage"""
+        with self._lock:
+            self._sessions[session_id] = {'user': user, 'usage': usage, 'last_seen': time.time()}
+
+    def sessions(self):
+        """
+        Sessions seen within idle_seconds, largest resident size first
+
+        Returns:
+            list: Dicts with session_id, user, resident_bytes, spilled_bytes,
+                entries and idle_seconds
+        """
+        now = time.time()
+        with self._lock:
+            for session_id in [key for key, value in self._sessions.items() if now - value['last_seen'] > self.idle_seconds]:
+                del self._sessions[session_id]
+            rows = [
+                {
+                    'session_id': session_id,
+                    'user': value['user'],
+                    'resident_bytes': value['usage']['resident_bytes'],
+                    'spilled_bytes': value['usage']['spilled_bytes'],
+                    'entries': len(value['usage']['entries']),
+                    'idle_seconds': now - value['last_seen'],
+                }
+                for session_id, value in self._sessions.items()
+            ]
+        rows.sort(key=lambda row: -row['resident_bytes'])
+        return rows
+
+
+class SessionMemory:
+    """
+    Named payloads of one session, bounded by max_bytes in memory
+
+    Entries live in the session state under STATE_KEY, in least recently
+    used order, as dicts with value (None once spilled), key (the spill
+    key, None until first spilled), bytes (resident_size of the value) and
+    disk_bytes (pickled size, None until first spilled).
+    """
+
+    def __init__(self, state, store, max_bytes=MAX_SESSION_BYTES, registry=None, session_id=None, user=None):
+        """
+        Args:
+            state (MutableMapping): The session state
+            store (SpillStore): Shared spill store
+            max_bytes (int): Resident bytes allowed for the session
+            registry (SessionRegistry): Receives usage reports
+            session_id (str): Id the session reports under
+            user (str): User of the session, for the report
+        """
+        if STATE_KEY not in state:
+            state[STATE_KEY] = {'entries': OrderedDict(), 'expired': set(), 'touched_at': 0.0}
+        self._state = state[STATE_KEY]
+        self._entries = self._state['entries']
+        self.store = store
+        self.max_bytes = max_bytes
+        self.registry = registry
+        self.session_id = session_id
+        self.user = user
+        if time.time() - self._state['touched_at'] > TOUCH_INTERVAL:
+            # Keep the session's spilled payloads from aging out while it is open
+            self.store.touch(entry['key'] for entry in self._entries.values() if entry['value'] is None)
+            self._state['touched_at'] = time.time()
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def put(self, name, value, spill=False):
+        """
+        Store a payload, replacing any entry of the same name
+
+        Args:
+            name (str): Entry name
+            value: Any picklable object other than None, not changed afterwards
+            spill (bool): Write it to disk right away, for payloads rarely read again
+        """
+        entry = {'value': value, 'key': None, 'bytes': resident_size(value), 'disk_bytes': None}
+        if spill or entry['bytes'] > self.max_bytes:
+            self._spill(entry)
+        self._entries.pop(name, None)
+        self._entries[name] = entry
+        self._state['expired'].discard(name)
+        self._evict()
+        self.report()
+
+    def get(self, name, default=None):
+        """
+        Return a payload, loading it from disk if it was spilled
+
+        Payloads pruned from the spill store are dropped, reported by
+        expired, and default is returned.
+        """
+        entry = self._entries.get(name)
+        if entry is None:
+            return default
+        self._entries.move_to_end(name)
+        if entry['value'] is not None:
+            return entry['value']
+        try:
+            value = self.store.load(entry['key'])
+        except FileNotFoundError:
+            del self._entries[name]
+            self._state['expired'].add(name)
+            self.report()
+            return default
+        if entry['bytes'] <= self.max_bytes:
+            # Resident again until it is the least recently used
+            entry['value'] = value
+            self._evict()
+            self.report()
+        return value
+
+    def drop(self, name):
+        """Forget an entry, its spilled file is pruned once unused"""
+        self._state['expired'].discard(name)
+        if self._entries.pop(name, None) is not None:
+            self.report()
+
+    def expired(self, prefix=""):
+        """
+        Entries lost because their spilled file was pruned, until put again or dropped
+
+        Args:
+            prefix (str): Only names starting with it
+
+        Returns:
+            list: Sorted entry names
+        """
+        return sorted(name for name in self._state['expired'] if name.startswith(prefix))
+
+    def names(self, prefix=""):
+        """Entry names starting with prefix, least recently used first"""
+        return [name for name in self._entries if name.startswith(prefix)]
+
+    def usage(self):
+        """
+        Returns:
+            dict: resident_bytes (estimated memory), spilled_bytes (size on
+                disk), expired (names lost to pruning) and entries (dicts
+                with name, bytes, disk_bytes and spilled)
+        """
+        entries = [
+            {'name': name, 'bytes': entry['bytes'], 'disk_bytes': entry['disk_bytes'], 'spilled': entry['value'] is None}
+            for name, entry in self._entries.items()
+        ]
+        return {
+            'resident_bytes': sum(entry['bytes'] for entry in entries if not entry['spilled']),
+            'spilled_bytes': sum(entry['disk_bytes'] for entry in entries if entry['spilled']),
+            'expired': self.expired(),
+            'entries': entries,
+        }
+
+    def report(self):
+        """Send the usage to the registry"""
+        if self.registry is not None and self.session_id is not None:
+            self.registry.report(self.session_id, self.user, self.usage())
+
+    def _evict(self):
+        """Spill least recently used payloads until the resident ones fit, keeping the newest"""
+        resident = sum(entry['bytes'] for entry in self._entries.values() if entry['value'] is not None)
+        for name, entry in list(self._entries.items())[:-1]:
+            if resident <= self.max_bytes:
+                break
+            if entry['value'] is None:
+                continue
+            self._spill(entry)
+            resident -= entry['bytes']
+
+    def _spill(self, entry):
+        """Write an entry's value to the store, unless its file is still there, and drop it from memory"""
+        if entry['key'] is None or not self.store.exists(entry['key']):
+            data = pickle.dumps(entry['value'], protocol=pickle.HIGHEST_PROTOCOL)
+            entry['key'] = self.store.save(data)
+            entry['disk_bytes'] = len(data)
+        entry['value'] = None
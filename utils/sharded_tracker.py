@@ -0,0 +1,338 @@
+"""
+Sharded rank tracking across worker processes
+
+Large keyword sets are split into shards and tracked in a process pool,
+each worker fetching, parsing and matching its shard with its own
+SerperAPI and RankTracker. Shard outputs are merged into one run in the
+original keyword order. Track a keyword file from the command line with:
+
+    python -m utils.sharded_tracker --domains domains.txt --keywords keywords.csv --workers 32 --output rankings.csv
+"""
+import argparse
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Shards per worker, more shards balance slow shards at a small overhead
+SHARDS_PER_WORKER = 4
+
+# Set by _init_worker in each worker process
+_worker_tracker = None
+
+
+def default_workers():
+    """Number of worker processes to use when none is given"""
+    return os.cpu_count() or 1
+
+
+def split_shards(keywords, shard_count):
+    """
+    Split keywords into contiguous shards of nearly equal size
+
+    Args:
+        keywords (list): Keywords to split
+        shard_count (int): Number of shards wanted
+
+    Returns:
+        list: Lists of keywords, no more than shard_count and none empty
+    """
+    if not keywords:
+        return []
+    shard_size = math.ceil(len(keywords) / max(1, shard_count))
+    return [keywords[start:start + shard_size] for start in range(0, len(keywords), shard_size)]
+
+
+def _init_worker(api_keys, min_request_interval, tenant, fair_share):
+    """Build the tracker once per worker process"""
+    global _worker_tracker
+    from utils.api_service import SerperAPI
+    from utils.data_service import DataService
+    from utils.dispatcher import BULK, RequestDispatcher
+    from utils.key_pool import KeyPool
+    from utils.rank_tracker import RankTracker
+
+    from utils.credit_ledger import CreditLedger
+
+    # Spend is recorded, not loaded: each worker's limits are its share of what was left
+    api_service = SerperAPI(key_pool=KeyPool(api_keys, CreditLedger()))
+    api_service.min_request_interval = min_request_interval
+    # Workers share the bulk rate with the app and scheduled sweeps through its token bucket
+    api_service.dispatcher = RequestDispatcher.from_config(fair_share)
+    api_service.lane = BULK
+    api_service.tenant = tenant
+    _worker_tracker = RankTracker(api_service, DataService())
+
+
+def _shard_usage(requests=0, bytes_downloaded=0, credits_used=0, cache_hits=0):
+    """Usage report of a failed shard in the format of RankTracker.track, nothing saved against a fixed-size run"""
+    return {
+        'requests': requests,
+        'bytes_downloaded': bytes_downloaded,
+        'credits_used': credits_used,
+        'fixed_size_credits': credits_used,
+        'credits_saved': 0,
+        'cache_hits': cache_hits,
+        'estimated_fixed_size_bytes': bytes_downloaded
+    }
+
+
+def _track_shard(shard, domains, search_type, location, language, country_code, result_size, batch_size, max_depth, adaptive, previous_results, collect_features, max_credits):
+    """Track one shard in a worker process, returning its run output"""
+    from utils.serp_features import extract_features
+
+    features = {}
+
+    def collect(keyword, search_results):
+        features[keyword] = extract_features(search_results)
+
+    usage_before = dict(_worker_tracker.api_service.usage)
+    try:
+        run = _worker_tracker.track(
+            shard, domains, search_type, location, language, country_code, result_size,
+            batch_size=batch_size,
+            max_depth=max_depth,
+            adaptive=adaptive,
+            previous_results=previous_results,
+            response_callback=collect if collect_features else None,
+            max_credits=max_credits
+        )
+    except Exception as e:
+        # Report what was spent before the failure, it is charged all the same
+        usage = {key: _worker_tracker.api_service.usage[key] - usage_before[key] for key in usage_before}
+        return ShardedRankTracker._failed_shard(shard, e, _shard_usage(
+            usage['requests'], usage['bytes'], usage['credits'], usage['cache_hits']
+        ))
+    run['features'] = features
+    return run
+
+
+class ShardedRankTracker:
+    """
+    Runs rank checks for a keyword set split across a process pool
+
+    Fetching is I/O bound, but decoding, matching and assembling results for
+    100k+ keywords is CPU bound and held by the GIL in a single process.
+    Each worker owns its own connection pool and response cache, so shards
+    run independently and throughput grows with the number of cores.
+    Callbacks run in the calling process as shards complete.
+
+    Attributes:
+        usage (dict): Usage reports of the last run's shards summed as they
+            finish, also filled when track raises, since the workers' spend
+            never shows in the calling process's SerperAPI usage
+    """
+
+    def __init__(self, api_keys, workers=None, min_request_interval=0, tenant=None, fair_share=None):
+        """
+        Args:
+            api_keys (list): API keys or key settings (KeyPool.configs()) passed
+                to every worker, the credits left under each limit are split
+                between workers
+            workers (int): Number of worker processes, defaults to the CPU count
+            min_request_interval (float): Minimum seconds between requests across
+                all workers, split evenly between them
+            tenant (str): User or project the workers' bulk requests are made for
+            fair_share (dict): The fair_share secrets section, sets the bulk rate
+        """
+        self.api_keys = [key if isinstance(key, dict) else {'key': key} for key in api_keys]
+        self.workers = max(1, workers or default_workers())
+        self.min_request_interval = min_request_interval
+        self.tenant = tenant
+        self.fair_share = dict(fair_share or {})
+        self.usage = {}
+
+    def track(self, keywords, domains, search_type="search", location="United States", language="en", country_code="us", result_size=10, batch_size=1, max_depth=None, progress_callback=None, adaptive=False, previous_results=None, result_callback=None, collect_features=False, max_credits=None):
+        """
+        Fetch search results for each keyword in worker processes
+
+        Takes the same options as RankTracker.track. Per-response callbacks
+        cannot cross process boundaries, so SERP features are extracted in the
+        workers when collect_features is set and returned in 'features'.
+
+        Args:
+            keywords (list): List of keywords
+            domains (list): List of domains
+            search_type (str): Search vertical (search, images, news, videos, places)
+            location (str): Location for search results
+            language (str): Language code (en, tr, etc.)
+            country_code (str): Country code (us, tr, etc.)
+            result_size (int): Number of results per page (10, 20, 50 or 100)
+            batch_size (int): Number of keywords per API request, 1 disables batching
+            max_depth (int): Deepest rank to look for, None checks the first page only
+            progress_callback (callable): Called with (fraction, text) as shards finish
+            adaptive (bool): Start with a small result size and escalate per keyword
+            previous_results (dict): Results of an earlier run used to pick starting sizes
+            result_callback (callable): Called with (keyword, keyword_results) for every
+                keyword of a finished shard
+            collect_features (bool): Extract SERP features of first-page responses
+            max_credits (int): Credit budget of the run, split between shards by
+                their number of keywords
+
+        Returns:
+            dict: Merged run output like RankTracker.track, plus 'features'
+                (keyword -> output of extract_features) and 'shards'
+        """
+        keywords = list(dict.fromkeys(keywords))
+        shards = split_shards(keywords, self.workers * SHARDS_PER_WORKER)
+        workers = min(self.workers, len(shards)) or 1
+
+        # Spawned workers do not inherit the Streamlit runtime or open sockets
+        context = multiprocessing.get_context("spawn")
+        shard_runs = {}
+        self.usage = {}
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._worker_keys(workers), self.min_request_interval * workers, self.tenant, self.fair_share)
+        ) as executor:
+            futures = {}
+            for index, shard in enumerate(shards):
+                # Only ship the previous results this shard can use
+                shard_previous = {keyword: previous_results[keyword] for keyword in shard if keyword in previous_results} if previous_results else None
+                shard_credits = max_credits * len(shard) // len(keywords) if max_credits is not None else None
+                future = executor.submit(
+                    _track_shard, shard, domains, search_type, location, language, country_code,
+                    result_size, batch_size, max_depth, adaptive, shard_previous, collect_features,
+                    shard_credits
+                )
+                futures[future] = index
+
+            done_keywords = 0
+            try:
+                for future in as_completed(futures):
+                    index = futures[future]
+                    shard_runs[index] = self._shard_result(future, shards[index])
+
+                    if result_callback:
+                        for keyword, keyword_results in shard_runs[index]['results'].items():
+                            result_callback(keyword, keyword_results)
+                    done_keywords += len(shards[index])
+                    if progress_callback:
+                        progress_callback(done_keywords / len(keywords), f"Fetched {done_keywords} of {len(keywords)} keywords in {len(shard_runs)} of {len(shards)} shards")
+            finally:
+                # After a callback raised, wait for the other shards so their spend is still counted
+                for future, index in futures.items():
+                    if index not in shard_runs:
+                        shard_runs[index] = self._shard_result(future, shards[index])
+
+        run = self._merge([shard_runs[index] for index in range(len(shards))], keywords)
+        run['shards'] = len(shards)
+        return run
+
+    def _worker_keys(self, workers):
+        """Key settings for one worker, each getting an equal share of the credits left under every limit"""
+        return [
+            dict(
+                key,
+                credit_limit=max(0, key['credit_limit'] - key.get('credits', 0)) // workers if key.get('credit_limit') else key.get('credit_limit'),
+                credits=0
+            )
+            for key in self.api_keys
+        ]
+
+    def _shard_result(self, future, shard):
+        """Run output of a finished shard, with its usage added to self.usage"""
+        try:
+            shard_run = future.result()
+        except Exception as e:
+            # A crashed worker loses only its shard's keywords, and its spend is unknown
+            shard_run = self._failed_shard(shard, e)
+        for key, value in shard_run['usage'].items():
+            self.usage[key] = self.usage.get(key, 0) + value
+        return shard_run
+
+    @staticmethod
+    def _failed_shard(shard, error, usage=None):
+        """Run output for a shard whose worker raised, with the usage spent before it did"""
+        return {
+            'results': {},
+            'search_metadata': {},
+            'errors': {keyword: f"Worker failed: {error}" for keyword in shard},
+            'pages_fetched': 0,
+            'usage': usage or _shard_usage(),
+            'features': {},
+            'hits': {},
+        }
+
+    @staticmethod
+    def _merge(shard_runs, keywords):
+        """Combine shard outputs into one run in the original keyword order"""
+        results = {}
+        search_metadata = {}
+        errors = {}
+        features = {}
+        hits = {}
+        usage = {}
+        pages_fetched = 0
+        for shard_run in shard_runs:
+            results.update(shard_run['results'])
+            hits.update(shard_run['hits'])
+            search_metadata.update(shard_run['search_metadata'])
+            errors.update(shard_run['errors'])
+            features.update(shard_run['features'])
+            pages_fetched += shard_run['pages_fetched']
+            for key, value in shard_run['usage'].items():
+                usage[key] = usage.get(key, 0) + value
+
+        return {
+            'results': {keyword: results[keyword] for keyword in keywords if keyword in results},
+            'search_metadata': search_metadata,
+            'errors': errors,
+            'pages_fetched': pages_fetched,
+            'usage': usage,
+            'features': features,
+            'hits': hits,
+        }
+
+
+def main(argv=None):
+    from utils.api_service import SerperAPI
+    from utils.data_service import DataService
+    from utils.dispatcher import load_fair_share_config
+    from utils.keyword_import import (
+        DOMAIN_HEADERS,
+        KEYWORD_HEADERS,
+        ImportFileError,
+        import_values,
+        iter_file_values,
+        normalize_domain,
+        normalize_keyword,
+    )
+    from utils.rank_tracker import get_locale
+
+    parser = argparse.ArgumentParser(description="Track a large keyword set across worker processes")
+    parser.add_argument('--domains', required=True, help="TXT, CSV or XLSX file of domains")
+    parser.add_argument('--keywords', required=True, help="TXT, CSV or XLSX file of keywords")
+    parser.add_argument('--output', required=True, help="CSV file to write the rankings to")
+    parser.add_argument('--workers', type=int, default=default_workers())
+    parser.add_argument('--search-type', default="search")
+    parser.add_argument('--location', default="United States")
+    parser.add_argument('--result-size', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--max-depth', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.domains, 'rb') as file:
+            domains = import_values(iter_file_values(file, args.domains, DOMAIN_HEADERS), normalize_domain).values
+        with open(args.keywords, 'rb') as file:
+            keywords = import_values(iter_file_values(file, args.keywords, KEYWORD_HEADERS), normalize_keyword).values
+    except ImportFileError as e:
+        parser.error(str(e))
+
+    language, country_code = get_locale(args.location)
+    tracker = ShardedRankTracker(SerperAPI().key_pool.configs(), args.workers, tenant="cli", fair_share=load_fair_share_config())
+    run = tracker.track(
+        keywords, domains, args.search_type, args.location, language, country_code, args.result_size,
+        batch_size=args.batch_size,
+        max_depth=args.max_depth,
+        progress_callback=lambda fraction, text: print(text)
+    )
+    DataService().results_to_dataframe(run['results'], domains, keywords).to_csv(args.output, index=False)
+    print(f"Wrote {len(run['results'])} keywords to {args.output}, {len(run['errors'])} errors, {run['usage'].get('credits_used', 0)} credits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Cold-start and first-render benchmark for the Streamlit app
+
+Every run starts a fresh interpreter, so module imports are measured cold
+(apart from the operating system's file cache). Run it with:
+
+    python -m utils.startup_benchmark --runs 5
+
+It reports the time to import Streamlit, render the first page and rerun
+it, and which packages the first render imports, by their own import time
+from ``python -X importtime``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+# Executed in a fresh interpreter, prints the timings as JSON
+_RENDER_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.run()
+rendered = time.perf_counter()
+app.run()
+rerun = time.perf_counter()
+print(json.dumps({
+    'streamlit_import': imported - started,
+    'first_render': rendered - imported,
+    'rerun': rerun - rendered,
+    'loaded': sorted({name.partition('.')[0] for name in sys.modules}),
+}))
+"""
+
+# Packages worth loading lazily, reported whether or not the first render imports them
+WATCHED_PACKAGES = ("pandas", "numpy", "plotly", "openpyxl", "pyarrow", "msgspec", "orjson")
+
+
+def measure_render(app_path=APP_PATH):
+    """
+    Render the app once in a fresh interpreter
+
+    Returns:
+        dict: Seconds for streamlit_import, first_render and rerun, plus the
+            top-level packages loaded after the first render
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", _RENDER_SCRIPT, app_path],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(app_path)
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def profile_imports(app_path=APP_PATH):
+    """
+    Import time of each top-level package loaded by the first render
+
+    Returns:
+        dict: Package -> seconds spent importing its modules (self time)
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _RENDER_SCRIPT, app_path],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(app_path)
+    ).stderr
+
+    packages = {}
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        package = name.strip().partition(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_time) / 1e6
+    return packages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold start and first render of the app")
+    parser.add_argument('--runs', type=int, default=3, help="Fresh interpreters to average over")
+    parser.add_argument('--top', type=int, default=15, help="Packages to list by import time")
+    parser.add_argument('--app', default=APP_PATH)
+    args = parser.parse_args(argv)
+
+    runs = [measure_render(args.app) for _ in range(max(1, args.runs))]
+    for key, label in (('streamlit_import', "Streamlit import"), ('first_render', "First render"), ('rerun', "Rerun")):
+        values = [run[key] for run in runs]
+        print(f"{label:>17}: median {statistics.median(values) * 1000:7.0f} ms  (min {min(values) * 1000:.0f}, max {max(values) * 1000:.0f})")
+
+    loaded = set(runs[-1]['loaded'])
+    print("\nHeavy packages loaded by the first render: " + (", ".join(package for package in WATCHED_PACKAGES if package in loaded) or "none"))
+
+    print(f"\nTop {args.top} packages by import time:")
+    packages = profile_imports(args.app)
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:>30}: {seconds * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import os
+
+DEFAULT_DATA_DIR = "data"
+
+
+def get_data_dir():
+    """
+    Return the directory for locally persisted data, creating it if needed
+
+    The location can be changed with the SERPER_ANALYZER_DATA_DIR
+    environment variable.
+
+    Returns:
+        str: Path of the data directory
+    """
+    path = os.getenv("SERPER_ANALYZER_DATA_DIR", DEFAULT_DATA_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_data_path(*parts):
+    """Return a path inside the data directory"""
+    path = os.path.join(get_data_dir(), *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,136 @@
+# Approximate organic click-through rate by position (positions 1-20)
+DEFAULT_CTR_CURVE = [
+    0.284, 0.157, 0.110, 0.080, 0.072, 0.051, 0.040, 0.032, 0.028, 0.025,
+    0.010, 0.009, 0.008, 0.007, 0.006, 0.005, 0.005, 0.004, 0.004, 0.003,
+]
+# Click-through rate assumed for any position beyond the curve
+DEFAULT_TAIL_CTR = 0.001
+
+
+def ctr_for_position(rank, ctr_curve=DEFAULT_CTR_CURVE, tail_ctr=DEFAULT_TAIL_CTR):
+    """
+    Return the expected click-through rate of a ranking position
+
+    Args:
+        rank (int): Ranking position, starting at 1
+        ctr_curve (list): CTR of positions 1..len(ctr_curve)
+        tail_ctr (float): CTR of deeper positions
+
+    Returns:
+        float: Expected share of the keyword's clicks
+    """
+    if rank is None or rank < 1:
+        return 0.0
+    if rank <= len(ctr_curve):
+        return ctr_curve[rank - 1]
+    return tail_ctr
+
+
+class VisibilityIndex:
+    """
+    Per-domain visibility maintained incrementally as keyword results arrive
+
+    Each keyword contributes weight * CTR(rank) to every domain ranking for
+    it. The index keeps each keyword's contributions so a changed keyword is
+    applied by subtracting its old contribution and adding the new one, which
+    costs O(domains) regardless of how many keywords are tracked.
+    """
+
+    def __init__(self, domains, ctr_curve=DEFAULT_CTR_CURVE, tail_ctr=DEFAULT_TAIL_CTR):
+        self.domains = list(domains)
+        self.ctr_curve = ctr_curve
+        self.tail_ctr = tail_ctr
+        self._contributions = {}
+        self._weights = {}
+        self._totals = {domain: 0.0 for domain in self.domains}
+        self._total_weight = 0.0
+
+    def __len__(self):
+        return len(self._contributions)
+
+    def __contains__(self, keyword):
+        return keyword in self._contributions
+
+    def update(self, keyword, keyword_results, weight=1.0):
+        """
+        Add or replace a keyword's results
+
+        Args:
+            keyword (str): The keyword
+            keyword_results (dict): Domain -> RankHit or None
+            weight (float): Keyword weight, e.g. monthly search volume
+        """
+        self.remove(keyword)
+
+        contributions = {}
+        for domain in self.domains:
+            hit = keyword_results.get(domain)
+            if hit is None:
+                continue
+            value = weight * ctr_for_position(hit.rank, self.ctr_curve, self.tail_ctr)
+            if value:
+                contributions[domain] = value
+                self._totals[domain] += value
+
+        self._contributions[keyword] = contributions
+        self._weights[keyword] = weight
+        self._total_weight += weight
+
+    def remove(self, keyword):
+        """Remove a keyword's contribution if present"""
+        contributions = self._contributions.pop(keyword, None)
+        if contributions is None:
+            return
+        for domain, value in contributions.items():
+            self._totals[domain] -= value
+        self._total_weight -= self._weights.pop(keyword)
+
+    def retain(self, keywords):
+        """Remove every keyword not in the given collection"""
+        keep = set(keywords)
+        for keyword in [keyword for keyword in self._contributions if keyword not in keep]:
+            self.remove(keyword)
+
+    def estimated_clicks(self, domain):
+        """Weighted CTR sum, estimated monthly clicks when weights are search volumes"""
+        return max(self._totals.get(domain, 0.0), 0.0)
+
+    def visibility(self, domain):
+        """
+        Visibility as a percentage of ranking #1 for every keyword
+
+        Returns:
+            float: Visibility from 0 to 100
+        """
+        best_possible = self._total_weight * ctr_for_position(1, self.ctr_curve, self.tail_ctr)
+        if best_possible <= 0:
+            return 0.0
+        return 100 * self.estimated_clicks(domain) / best_possible
+
+    def share_of_voice(self, domain):
+        """
+        The domain's share of the clicks captured by all tracked domains
+
+        Returns:
+            float: Share of voice from 0 to 100
+        """
+        total = sum(max(value, 0.0) for value in self._totals.values())
+        if total <= 0:
+            return 0.0
+        return 100 * self.estimated_clicks(domain) / total
+
+    def summary(self):
+        """
+        Return visibility metrics for every domain
+
+        Returns:
+            dict: Domain -> dict with visibility, share_of_voice and estimated_clicks
+        """
+        return {
+            domain: {
+                'visibility': self.visibility(domain),
+                'share_of_voice': self.share_of_voice(domain),
+                'estimated_clicks': self.estimated_clicks(domain),
+            }
+            for domain in self.domains
+        }